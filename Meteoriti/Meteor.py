@@ -4,78 +4,413 @@ import cv2
 import numpy as np
 import exifread
 import os
+import sys
 import time
-from jinja2 import Environment, FileSystemLoader, BaseLoader
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
+from report_writer import StreamingReport
+from tiled import open_windowed, detect_black_tiled, TILE_SIZE
+from result_index import ResultIndex, file_hash, data_hash
+from gps_exif import read_gps
+from features import REJECTION_RULES, contour_features, component_features, apply_rules, count_reasons, feature_rows, RING_WIDTH
+from crop_store import open_store, crop_data_uri, extract_crop
+from georef import candidate_points, georef_issue, CandidateWriter
+from dedup import cluster_points, DEDUP_DISTANCE_M, UNIQUE_CSV_FIELDS
+from thumbnails import make_thumbnails, make_thumbnails_windowed, THUMBNAIL_SIZES
+from run_metrics import RunMetrics
 
 SOGLIA_NERO = 40 # tra 0 e 255, test con 30
 MIN_AREA = 400 # pixel contigui, test con 500
+WORKERS = os.cpu_count() or 1 # processi paralleli, 1 = elaborazione sequenziale
+CHUNKSIZE = 16 # immagini inviate a ciascun processo per volta
+MAX_IN_FLIGHT = 2 # lotti da CHUNKSIZE immagini in corso per processo: oltre si attende il consumatore (backpressure)
+TILED_MIN_BYTES = 256 * 1024 ** 2 # file piu' grandi (ortomosaici) elaborati a finestre con memoria limitata
+FAST_GPS = True # lettura dei soli tag GPS (gradi decimali) invece dell'intero EXIF con exifread
+CANDIDATES_GEOJSON = "candidati.geojson" # coordinate a terra di ogni candidato (anche in candidati.csv)
+RESULT_INDEX = "meteor_index.sqlite" # indice dei risultati: rielabora solo immagini nuove o modificate (None per disattivarlo)
+DETECTION_BACKEND = "contours" # "contours" (findContours) o "components" (etichettatura unica con statistiche, aree in pixel come il percorso a finestre)
+FEATURE_FILTER = True # scarta ombre, strade e acqua con le regole di features.REJECTION_RULES prima dei crop
+CROP_STORE = "files" # "files" (un JPEG per crop), "archive" (archivi .pack a blocchi) o "memory" (solo in memoria)
+REPORT_INLINE_CROPS = False # crop d'archivio inclusi nelle pagine come data URI invece che estratti in report_crop/
+THUMBNAIL_DIR = "thumbs" # anteprime ridotte per il report (None per usare le immagini originali)
+METRICS_FILE = "metrics.json" # tempi per fase, contatori ed ETA, riscritto ogni run_metrics.FLUSH_INTERVAL secondi (None per disattivarlo)
+METRICS_PORT = None # porta locale per le metriche in formato Prometheus su /metrics (es. 9108), None per non avviare il server
 
 def get_exif_data(image_path):
     with open(image_path, 'rb') as f:
         exif_tags = exifread.process_file(f)
     return exif_tags
 
-def get_gps_info(exif_data):
+def get_gps_info(exif_data, image_path=""):
     try:
         gps_latitude = exif_data['GPS GPSLatitude']
         gps_longitude = exif_data['GPS GPSLongitude']
     except KeyError:
         print(f"No GPS data for image {image_path}")
-        gps_latitude, gps_longitude = None, None
+        return "N/A", "N/A"
     return str(gps_latitude.values), str(gps_longitude.values)
 
-def detect_and_crop_black(image_path, threshold=SOGLIA_NERO, min_area=MIN_AREA):
-    # carica immagine
-    image = cv2.imread(image_path)
+def add_timing(timings, stage, start):
+    # accumula il tempo trascorso da start nella fase indicata
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return time.perf_counter()
+
+crop_store = None
+
+def get_crop_store():
+    # un archivio per processo, aperto al primo crop
+    global crop_store
+    if crop_store is None:
+        crop_store = open_store(CROP_STORE)
+    return crop_store
+
+def find_black_components(thresholded, min_area=MIN_AREA):
+    # etichettatura delle componenti connesse (8-connessione): restituisce percentuale di nero,
+    # immagine delle etichette e, per le componenti oltre l'area minima, etichette, aree, riquadri e baricentri
+    _, labels, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(thresholded, 8, cv2.CV_32S, cv2.CCL_GRANA)
+    black_percentage = stats[1:, cv2.CC_STAT_AREA].sum() / float(thresholded.size)
+    ids = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > min_area) + 1
+    return black_percentage, labels, ids, stats[ids, cv2.CC_STAT_AREA], stats[ids, :4], centroids[ids]
+
+def filter_by_features(contour_values, found_boxes, rejected=None, features=None):
+    # applica le regole di scarto: restituisce i riquadri tenuti e aggiorna conteggi e caratteristiche
+    keep, reasons = apply_rules(contour_values)
+    if rejected is not None:
+        count_reasons(reasons, rejected)
+    if features is not None:
+        features.extend(feature_rows(contour_values, keep))
+    return [box for box, kept in zip(found_boxes, keep) if kept]
+
+def detect_and_crop_black(image_path, threshold=SOGLIA_NERO, min_area=MIN_AREA, timings=None, boxes=None, image=None, crops=None, rejected=None, features=None):
+    start = time.perf_counter()
+    
+    # carica immagine (se non gia' decodificata dal chiamante)
+    if image is None:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Impossibile leggere l'immagine {image_path}")
+        start = add_timing(timings, "lettura", start)
 
     # converti in scala di grigi
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
     # applicazione della soglia
     _, thresholded = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+    start = add_timing(timings, "soglia", start)
 
-    # contorni
-    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if DETECTION_BACKEND == "components":
+        # un solo passaggio: aree (in pixel), riquadri e percentuale di nero dalle stesse statistiche
+        black_percentage, labels, ids, areas, rects, _ = find_black_components(thresholded, min_area)
+        found_boxes = rects.tolist()
+        start = add_timing(timings, "componenti", start)
+        if FEATURE_FILTER and found_boxes:
+            contour_values = component_features(gray, labels, ids, rects, areas)
+            found_boxes = filter_by_features(contour_values, found_boxes, rejected, features)
+            start = add_timing(timings, "caratteristiche", start)
+    else:
+        # contorni
+        contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-    # filtra i contorni con l'area minima
-    filtered_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
+        # filtra i contorni con l'area minima
+        filtered_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
 
-    # percentuale di nero
-    black_percentage = np.sum(thresholded == 255) / float(thresholded.size)
+        # percentuale di nero
+        black_percentage = np.sum(thresholded == 255) / float(thresholded.size)
+        found_boxes = [list(cv2.boundingRect(cnt)) for cnt in filtered_contours]
+        start = add_timing(timings, "contorni", start)
 
-    # crop
-    crop_paths = []
-    for i, cnt in enumerate(filtered_contours):
-        x, y, w, h = cv2.boundingRect(cnt)
-        crop = image[y:y+h, x:x+w]
-        filename = os.path.basename(image_path)
-        crop_path = os.path.join("crop", f"{os.path.splitext(filename)[0]}_crop{i}.jpg")
-        cv2.imwrite(crop_path, crop)
-        crop_paths.append(crop_path)
+        # caratteristiche di forma e tessitura: i candidati scartati non producono crop
+        if FEATURE_FILTER and filtered_contours:
+            contour_values = contour_features(gray, filtered_contours)
+            found_boxes = filter_by_features(contour_values, found_boxes, rejected, features)
+            start = add_timing(timings, "caratteristiche", start)
+
+    # crop: raccolti e poi salvati tutti insieme
+    image_crops = []
+    for x, y, w, h in found_boxes:
+        image_crops.append(image[y:y+h, x:x+w].copy())
+        if boxes is not None:
+            boxes.append([x, y, w, h])
+    crop_paths = get_crop_store().put(image_path, image_crops)
+    if crops is not None:
+        crops.extend(image_crops)
+    add_timing(timings, "crop", start)
+    
+    return black_percentage, crop_paths
+
+def detect_and_crop_black_tiled(image_path, threshold=SOGLIA_NERO, min_area=MIN_AREA, timings=None, boxes=None, tile_size=TILE_SIZE, crops=None, rejected=None, features=None):
+    # come detect_and_crop_black ma a finestre: l'area e' il numero di pixel scuri contigui
+    # e le componenti che attraversano i bordi delle finestre vengono ricucite
+    start = time.perf_counter()
+    reader = open_windowed(image_path)
+    try:
+        black_percentage, found_boxes = detect_black_tiled(reader, threshold, min_area, tile_size)
+        start = add_timing(timings, "soglia", start)
+        
+        # caratteristiche: per ogni riquadro si rilegge la finestra (con il margine per il contrasto)
+        # e si usa il contorno scuro piu' grande al suo interno
+        if FEATURE_FILTER and found_boxes:
+            found_boxes, reasons, kept_rows = filter_boxes_windowed(reader, found_boxes, threshold)
+            if rejected is not None:
+                count_reasons(reasons, rejected)
+            if features is not None:
+                features.extend(kept_rows)
+            start = add_timing(timings, "caratteristiche", start)
+        
+        # crop: si rilegge solo la finestra del riquadro
+        image_crops = []
+        for x, y, w, h in found_boxes:
+            image_crops.append(np.array(reader.read(y, y+h, x, x+w)))
+            if boxes is not None:
+                boxes.append([int(x), int(y), int(w), int(h)])
+        crop_paths = get_crop_store().put(image_path, image_crops)
+        if crops is not None:
+            crops.extend(image_crops)
+        add_timing(timings, "crop", start)
+    finally:
+        reader.close()
     
     return black_percentage, crop_paths
 
-# template del report
-template_string = """
+def filter_boxes_windowed(reader, found_boxes, threshold=SOGLIA_NERO):
+    kept_boxes = []
+    reasons = []
+    kept_rows = []
+    for x, y, w, h in found_boxes:
+        top, left = max(0, y - RING_WIDTH), max(0, x - RING_WIDTH)
+        bottom, right = min(reader.height, y + h + RING_WIDTH), min(reader.width, x + w + RING_WIDTH)
+        window = np.asarray(reader.read(top, bottom, left, right))
+        gray = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY) if window.ndim == 3 else window
+        _, thresholded = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+        contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            reasons.append(None)
+            kept_boxes.append([x, y, w, h])
+            kept_rows.append({})
+            continue
+        contour_values = contour_features(gray, [max(contours, key=cv2.contourArea)])
+        keep, box_reasons = apply_rules(contour_values)
+        reasons.append(box_reasons[0])
+        if keep[0]:
+            kept_boxes.append([x, y, w, h])
+            kept_rows.extend(feature_rows(contour_values))
+    return kept_boxes, reasons, kept_rows
+
+def read_gps_info(image_path, data=None):
+    # coordinate in gradi decimali; data = byte del file gia' letti, se disponibili
+    gps = read_gps(data if data is not None else image_path)
+    if gps is None:
+        print(f"No GPS data for image {image_path}")
+        return ("N/A", "N/A"), None
+    return (round(gps["lat"], 7), round(gps["lng"], 7)), gps
+
+def process_image(image_dir, image_file, compute_hash=False, keep_crops=False):
+    # keep_crops: restituisce i crop come array (chiave "crops") anche se salvati su disco
+    timings = {}
+    boxes = []
+    crops = [] if CROP_STORE == "memory" or keep_crops else None
+    rejected = {}
+    features = []
+    data = None
+    image_path = os.path.join(image_dir, image_file)
+    if os.path.getsize(image_path) >= TILED_MIN_BYTES:
+        black_percentage, crop_paths = detect_and_crop_black_tiled(image_path, timings=timings, boxes=boxes, crops=crops, rejected=rejected, features=features)
+        reader = open_windowed(image_path)
+        image_size = [reader.width, reader.height]
+        reader.close()
+    else:
+        # lettura unica del file: gli stessi byte servono per decodifica, GPS e hash
+        start = time.perf_counter()
+        with open(image_path, "rb") as f:
+            data = f.read()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Impossibile leggere l'immagine {image_path}")
+        add_timing(timings, "lettura", start)
+        image_size = [image.shape[1], image.shape[0]]
+        black_percentage, crop_paths = detect_and_crop_black(image_path, timings=timings, boxes=boxes, image=image, crops=crops, rejected=rejected, features=features)
+    content_hash = None
+    if compute_hash or (THUMBNAIL_DIR is not None and black_percentage > 0):
+        start = time.perf_counter()
+        content_hash = data_hash(data) if data is not None else file_hash(image_path)
+        add_timing(timings, "hash", start)
+    thumbnails = None
+    if THUMBNAIL_DIR is not None and black_percentage > 0:
+        # anteprime dall'immagine gia' decodificata, o a finestre per gli ortomosaici
+        start = time.perf_counter()
+        if data is not None:
+            thumbnails = make_thumbnails(image, content_hash, directory=THUMBNAIL_DIR)
+        else:
+            reader = open_windowed(image_path)
+            try:
+                thumbnails = make_thumbnails_windowed(reader, content_hash, directory=THUMBNAIL_DIR)
+            finally:
+                reader.close()
+        add_timing(timings, "anteprime", start)
+    if data is not None:
+        del image
+    gps_info = None
+    gps_data = None
+    if black_percentage > 0:
+        start = time.perf_counter()
+        try:
+            if FAST_GPS:
+                gps_info, gps_data = read_gps_info(image_path, data)
+            else:
+                exif_data = get_exif_data(image_path)
+                gps_info = get_gps_info(exif_data, image_path)
+        except Exception as e:
+            print(f"Failed to get exif data for image {image_path}: {e}")
+            gps_info = ("N/A", "N/A")
+        add_timing(timings, "exif", start)
+    record = {"gps": gps_info, "gps_data": gps_data, "black_percentage": black_percentage, "crop_paths": crop_paths, "boxes": boxes, "features": features, "rejected": rejected, "image_size": image_size}
+    if thumbnails is not None:
+        record["preview_path"] = thumbnails[max(thumbnails)]
+    if crops is not None:
+        record["crops"] = crops
+    if compute_hash:
+        record["hash"] = content_hash
+    return image_file, record, timings
+
+def error_record(error):
+    # risultato di un'immagine non elaborata: nessun candidato e il motivo in "error"
+    return {"error": f"{type(error).__name__}: {error}", "gps": ("N/A", "N/A"), "gps_data": None, "black_percentage": 0, "crop_paths": [], "boxes": [], "features": [], "rejected": {}, "image_size": None}
+
+def process_images(image_dir, image_files, compute_hash=False, keep_crops=False):
+    # un lotto di immagini per un solo invio al processo; un'immagine illeggibile produce un record
+    # di errore invece di far perdere l'intero lotto
+    results = []
+    for image_file in image_files:
+        try:
+            results.append(process_image(image_dir, image_file, compute_hash, keep_crops))
+        except Exception as e:
+            results.append((image_file, error_record(e), {}))
+    return results
+
+def iter_directory(image_dir, workers=WORKERS, chunksize=CHUNKSIZE, index=None, timings=None, metrics=None, keep_crops=False):
+    # produce (nome file, risultato) nell'ordine (alfabetico) dei file appena disponibili,
+    # indipendentemente dal numero di processi; con un indice si elaborano solo le immagini nuove o modificate;
+    # metrics (RunMetrics) riceve i tempi per fase dei processi e l'avanzamento;
+    # ai processi restano al massimo MAX_IN_FLIGHT lotti ciascuno: un consumatore lento ferma l'invio
+    image_files = sorted(name for name in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, name)))
+    records = {}
+    if index is not None:
+        for image_file in image_files:
+            record = index.lookup(os.path.join(image_dir, image_file))
+            if record is not None:
+                records[image_file] = record
+    pending_files = [image_file for image_file in image_files if image_file not in records]
+    if metrics is not None:
+        # l'ETA considera solo le immagini da elaborare
+        metrics.count("immagini_dall_indice", len(records))
+        metrics.start_phase("immagini", len(pending_files))
+    
+    task = partial(process_images, image_dir, compute_hash=index is not None, keep_crops=keep_crops)
+    chunks = iter([pending_files[i:i + chunksize] for i in range(0, len(pending_files), chunksize)])
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    in_flight = deque() # lotti inviati, nell'ordine dei file
+    results = iter(())
+    try:
+        for image_file in image_files:
+            if image_file in records:
+                yield image_file, records[image_file]
+                continue
+            if executor is not None:
+                while len(in_flight) < workers * MAX_IN_FLIGHT:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    in_flight.append(executor.submit(task, chunk))
+            _, record, stage_timings = next(results, (None, None, None))
+            if record is None:
+                # lotto successivo: atteso solo quando il precedente e' stato consumato
+                results = iter(in_flight.popleft().result() if executor is not None else task(next(chunks)))
+                _, record, stage_timings = next(results)
+            if timings is not None:
+                for stage, seconds in stage_timings.items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+            if metrics is not None:
+                for stage, seconds in stage_timings.items():
+                    metrics.add_time(stage, seconds)
+                if "error" in record:
+                    metrics.count("errori_immagini")
+                else:
+                    metrics.count("immagini_elaborate")
+                    metrics.count("byte_letti", os.path.getsize(os.path.join(image_dir, image_file)))
+                metrics.count("candidati", len(record["boxes"]))
+                metrics.count("candidati_scartati", sum(record.get("rejected", {}).values()))
+                metrics.advance()
+            if index is not None and "error" not in record: # le immagini fallite si riprovano alla prossima esecuzione
+                content_hash = record.pop("hash")
+                stored = {key: value for key, value in record.items() if key != "crops"} # gli array restano fuori dall'indice
+                index.store(os.path.join(image_dir, image_file), content_hash, stored)
+            yield image_file, record
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if index is not None:
+            index.commit()
+
+def process_directory(image_dir, workers=WORKERS, chunksize=CHUNKSIZE, index=None):
+    info_dict = {}
+    total_timings = {}
+    for image_file, record in iter_directory(image_dir, workers, chunksize, index, total_timings):
+        if record["black_percentage"] > 0:
+            info_dict[image_file] = dict(record, gps=tuple(record["gps"]))
+    return info_dict, total_timings
+
+def report_crop_src(ref):
+    # sorgente <img> di un crop d'archivio: file estratto, oppure data URI se richiesto
+    return crop_data_uri(ref) if REPORT_INLINE_CROPS else extract_crop(ref)
+
+# template del report (pagine scritte in streaming)
+REPORT_PAGE_SIZE = 200 # immagini per pagina
+
+report_page_head = """
 <!DOCTYPE html>
 <html>
 <head>
-    <title>{{ title }}</title>
+    <meta charset="utf-8">
+    <title>{{ title }} - pagina {{ page }}</title>
 </head>
 <body>
-    <h1>{{ title }}</h1>
-    {% for image_file, info in info_dict.items() %}
-        <h2>Immagine: {{ image_file }}</h2>
-        <h3>Coordinate GPS: {{ info['gps'] }}</h3>
-        <h3>Percentuale di nero: {{ info['black_percentage']|round(1) }}%</h3>
-        <img src="{{ os.path.join(image_dir, image_file) }}" style="max-width: 800px"><br>
-        <h3>Crop delle aree nere:</h3>
-        <div style="display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 10px;">
-        {% for crop_path in info['crop_paths'] %}
-            <img src="{{ crop_path }}" style="width: 100%">
-        {% endfor %}
-        </div>
+    <h1>{{ title }} - pagina {{ page }}</h1>
+    <p><a href="{{ index_file }}">Indice</a></p>
+"""
+
+report_row = """
+    <h2>Immagine: {{ row['image_file'] }}</h2>
+    <h3>Coordinate GPS: {{ row['gps'] }}</h3>
+    <h3>Percentuale di nero: {{ row['black_percentage']|round(1) }}%</h3>
+    {% if row['georef_issue'] %}<p>Candidati senza coordinate a terra: {{ row['georef_issue'] }}</p>{% endif %}
+    <a href="{{ row['image_path'] }}" target="_blank"><img src="{{ row['preview_path'] or row['image_path'] }}" style="max-width: 800px" loading="lazy"></a><br>
+    {% if row['rejected'] %}<p>Candidati scartati: {% for reason, count in row['rejected'].items() %}{{ reason }} {{ count }}{% if not loop.last %}, {% endif %}{% endfor %}</p>{% endif %}
+    <h3>Crop delle aree nere:</h3>
+    <div style="display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 10px;">
+    {% for crop_src in crop_srcs %}
+        <figure style="margin: 0"><img src="{{ crop_src }}" style="width: 100%" loading="lazy">
+        {% if loop.index0 in crop_coords %}<figcaption>{{ crop_coords[loop.index0][0] }}, {{ crop_coords[loop.index0][1] }}</figcaption>{% endif %}</figure>
     {% endfor %}
+    </div>
+"""
+
+unique_row = """
+    <div style="display: inline-block; width: 220px; margin: 5px; vertical-align: top;">
+        {% if crop_src %}<img src="{{ crop_src }}" style="width: 100%" loading="lazy"><br>{% endif %}
+        <b>{{ row['lat'] }}, {{ row['lng'] }}</b><br>
+        {{ row['image_file'] }} (crop {{ row['crop_index'] }}), fotogrammi: {{ row['frames'] }}
+        {% if row['duplicates'] %}<br><small>anche in: {{ row['duplicates'].replace(';', ', ') }}</small>{% endif %}
+    </div>
+"""
+
+report_page_tail = """
+    <p>
+        {% if prev_page %}<a href="{{ prev_page }}">&laquo; Pagina precedente</a>{% endif %}
+        {% if next_page %}<a href="{{ next_page }}">Pagina successiva &raquo;</a>{% endif %}
+    </p>
 </body>
 </html>
 """
@@ -83,35 +418,94 @@ template_string = """
 ########
 # MAIN #
 ########
-image_dir = input("Directory immagini: ")
+if __name__ == "__main__":
+    image_dir = input("Directory immagini: ")
 
-env = Environment(loader=BaseLoader)
+    # indice dei risultati delle esecuzioni precedenti
+    index = None
+    if RESULT_INDEX is not None and CROP_STORE != "memory": # i crop in memoria non sopravvivono all'esecuzione
+        index = ResultIndex(RESULT_INDEX, {"threshold": SOGLIA_NERO, "min_area": MIN_AREA, "fast_gps": FAST_GPS, "crop_store": CROP_STORE, "detection_backend": DETECTION_BACKEND, "feature_filter": FEATURE_FILTER, "rejection_rules": REJECTION_RULES, "thumbnails": [THUMBNAIL_DIR, list(THUMBNAIL_SIZES)]})
 
-# creazione template dalla stringa
-template = env.from_string(template_string)
+    # report consultabile gia' durante l'elaborazione, righe aggiunte man mano
+    report = StreamingReport("report.html", "Report corpi scuri", report_page_head, report_row, report_page_tail, REPORT_PAGE_SIZE)
+    candidates = CandidateWriter(CANDIDATES_GEOJSON, f"{os.path.splitext(CANDIDATES_GEOJSON)[0]}.csv")
 
-info_dict = {}
-os.makedirs("crop", exist_ok=True)
-env = Environment(loader=FileSystemLoader('.'))
-#template = env.get_template('template.html') # commentato per fare a meno del file template
-template = env.from_string(template_string)
+    # metriche dell'esecuzione (file periodico ed eventuale endpoint Prometheus)
+    metrics = RunMetrics("meteor", METRICS_FILE)
+    if index is not None:
+        metrics.watch("indice", lambda: {"hits": index.hits, "misses": index.misses})
+    if METRICS_PORT is not None:
+        print(f"Metriche su {metrics.serve(METRICS_PORT)}")
 
-# carica tutte le immagini dalla dir
-for image_file in os.listdir(image_dir):
-    image_path = os.path.join(image_dir, image_file)
-    black_percentage, crop_paths = detect_and_crop_black(image_path)
-    if black_percentage > 0:
-        try:
-            exif_data = get_exif_data(image_path)
-            gps_info = get_gps_info(exif_data)
-        except Exception as e:
-            print(f"Failed to get exif data for image {image_path}: {e}")
-            gps_info = ("N/A", "N/A")
-        info_dict[image_file] = {"gps": gps_info, "black_percentage": black_percentage, "crop_paths": crop_paths}
+    # carica tutte le immagini dalla dir
+    start = time.perf_counter()
+    rejected = {}
+    georef_issues = {} # motivo -> immagini con candidati ma senza coordinate a terra
+    all_points = []
+    memory_srcs = {} # crop in memoria: l'unica copia e' il data URI
+    for image_file, record in iter_directory(image_dir, index=index, metrics=metrics):
+        sys.stdout.write("\r" + metrics.progress_line())
+        sys.stdout.flush()
+        if "error" in record:
+            print(f"\nErrore durante l'elaborazione di {image_file}, saltata.\n{record['error']}")
+            continue
+        for reason, count in record.get("rejected", {}).items():
+            rejected[reason] = rejected.get(reason, 0) + count
+        if record["black_percentage"] > 0:
+            # i crop in memoria finiscono nella pagina come data URI (non nel file dati), quelli in
+            # archivio vengono estratti come file (o inclusi solo con REPORT_INLINE_CROPS)
+            crops = record.pop("crops", None)
+            if crops is not None:
+                crop_srcs = [crop_data_uri(crop=crop) for crop in crops]
+            elif CROP_STORE == "archive":
+                crop_srcs = [report_crop_src(ref) for ref in record["crop_paths"]]
+            else:
+                crop_srcs = record["crop_paths"]
+            points = candidate_points(image_file, record)
+            issue = georef_issue(record.get("gps_data")) if record["boxes"] and not points else None
+            if issue is not None:
+                georef_issues[issue] = georef_issues.get(issue, 0) + 1
+            candidates.add(points)
+            all_points.extend(points)
+            if crops is not None:
+                for point in points:
+                    memory_srcs[(image_file, point["crop_index"])] = crop_srcs[point["crop_index"]]
+            crop_coords = {point["crop_index"]: (point["lat"], point["lng"]) for point in points}
+            with metrics.timed("report"):
+                report.add_row(dict(record, image_file=image_file, image_path=os.path.join(image_dir, image_file), gps=tuple(record["gps"]), georef_issue=issue), {"crop_srcs": crop_srcs, "crop_coords": crop_coords})
+    report.close()
+    candidates.close()
 
-# report
-template_vars = {"title": "Report corpi scuri", "info_dict": info_dict, "image_dir": image_dir, "os": os}
-html_out = template.render(template_vars)
+    # candidati unici tra fotogrammi sovrapposti, con il crop migliore di ciascun gruppo
+    unique = cluster_points(all_points, DEDUP_DISTANCE_M)
+    unique_base = f"{os.path.splitext(CANDIDATES_GEOJSON)[0]}_unici"
+    unique_writer = CandidateWriter(f"{unique_base}.geojson", f"{unique_base}.csv", UNIQUE_CSV_FIELDS)
+    unique_writer.add(unique)
+    unique_writer.close()
+    unique_report = StreamingReport("report_unici.html", "Candidati unici", report_page_head, unique_row, report_page_tail, REPORT_PAGE_SIZE)
+    for point in unique:
+        if (point["image_file"], point["crop_index"]) in memory_srcs:
+            crop_src = memory_srcs[(point["image_file"], point["crop_index"])]
+        elif CROP_STORE == "archive" and point["crop_path"]:
+            crop_src = report_crop_src(point["crop_path"])
+        else:
+            crop_src = point["crop_path"]
+        unique_report.add_row(point, {"crop_src": crop_src})
+    unique_report.close()
+    elapsed = time.perf_counter() - start
 
-with open("report.html", "w") as f:
-    f.write(html_out)
+    # tempi per fase (sommati su tutti i processi) e contatori
+    print(f"\nElaborazione completata in {elapsed:.1f} s con {WORKERS} processi")
+    for line in metrics.summary_lines():
+        print(line)
+    metrics.close()
+    if index is not None:
+        index.close()
+    print(f"Candidati georeferenziati: {candidates.count} ({CANDIDATES_GEOJSON})")
+    print(f"Candidati unici entro {DEDUP_DISTANCE_M} m: {len(unique)} ({unique_base}.geojson, report_unici.html)")
+    for issue, count in sorted(georef_issues.items(), key=lambda item: -item[1]):
+        print(f"Immagini non georeferenziate ({issue}): {count}")
+    if rejected:
+        print(f"Candidati scartati: {sum(rejected.values())}")
+        for reason, count in sorted(rejected.items(), key=lambda item: -item[1]):
+            print(f"  {reason}: {count}")
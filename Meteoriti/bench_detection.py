@@ -0,0 +1,64 @@
+# Coded by Pietro Squilla
+# Confronto dei tempi di rilevamento su fotogrammi grandi: findContours + contourArea per contorno
+# contro un solo passaggio di connectedComponentsWithStats
+import time
+import cv2
+import numpy as np
+import Meteor
+
+FRAME_SIZES = [(3000, 4000), (6000, 8000)] # (altezza, larghezza) dei fotogrammi sintetici
+BLOBS = 2000 # macchie scure per fotogramma
+REPEAT = 3
+
+
+def synthetic_frame(height, width, blobs, seed=0):
+    # terreno chiaro con rumore, macchie scure di varie forme e qualche ombra allungata
+    rng = np.random.default_rng(seed)
+    image = rng.integers(90, 220, size=(height, width), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (7, 7), 0)
+    for _ in range(blobs):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(5, 60)), int(rng.integers(5, 60)))
+        cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, int(rng.integers(0, 35)), -1)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def detect(image, backend):
+    Meteor.DETECTION_BACKEND = backend
+    boxes = []
+    timings = {}
+    black_percentage, _ = Meteor.detect_and_crop_black("bench.jpg", timings=timings, boxes=boxes, image=image)
+    return black_percentage, boxes, timings
+
+
+def bench(image, backend, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = detect(image, backend)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, result)
+    return best
+
+
+if __name__ == "__main__":
+    # niente crop su disco; rilevamento da solo e con le regole di scarto
+    Meteor.CROP_STORE = "memory"
+
+    for height, width in FRAME_SIZES:
+        image = synthetic_frame(height, width, BLOBS)
+        for feature_filter in (False, True):
+            Meteor.FEATURE_FILTER = feature_filter
+            contours_time, (contours_black, contours_boxes, contours_timings) = bench(image, "contours", REPEAT)
+            components_time, (components_black, components_boxes, components_timings) = bench(image, "components", REPEAT)
+
+            print(f"Fotogramma {width}x{height} ({BLOBS} macchie, migliore di {REPEAT}, regole di scarto {'attive' if feature_filter else 'disattivate'})")
+            print(f"  contours:   {contours_time * 1000:.1f} ms, {len(contours_boxes)} candidati, nero {contours_black * 100:.3f}%")
+            print(f"    " + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in contours_timings.items()))
+            print(f"  components: {components_time * 1000:.1f} ms ({contours_time / components_time:.2f}x), {len(components_boxes)} candidati, nero {components_black * 100:.3f}%")
+            print(f"    " + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in components_timings.items()))
+            # i candidati possono differire di poco: l'area dei contorni include i buchi interni,
+            # quella delle componenti conta solo i pixel scuri (come il percorso a finestre)
+            shared = len({tuple(box) for box in contours_boxes} & {tuple(box) for box in components_boxes})
+            print(f"  riquadri identici: {shared}")
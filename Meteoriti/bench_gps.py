@@ -0,0 +1,58 @@
+# Coded by Pietro Squilla
+# Confronto dei tempi di lettura GPS: exifread (get_exif_data + get_gps_info) contro gps_exif.read_gps
+import os
+import time
+from Meteor import get_exif_data, get_gps_info
+from gps_exif import read_gps, dms_to_decimal
+
+
+def exifread_gps(image_path):
+    exif_data = get_exif_data(image_path)
+    if "GPS GPSLatitude" not in exif_data:
+        return None
+    lat = [float(value) for value in exif_data["GPS GPSLatitude"].values]
+    lng = [float(value) for value in exif_data["GPS GPSLongitude"].values]
+    lat_ref = str(exif_data.get("GPS GPSLatitudeRef", "N"))
+    lng_ref = str(exif_data.get("GPS GPSLongitudeRef", "E"))
+    get_gps_info(exif_data, image_path) # stesso lavoro dello script originale
+    return dms_to_decimal(lat, lat_ref), dms_to_decimal(lng, lng_ref)
+
+
+def bench(function, paths, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [function(path) for path in paths]
+    return (time.perf_counter() - start) / (repeat * len(paths)), results
+
+
+def buffer_gps(data):
+    return read_gps(data)
+
+
+if __name__ == "__main__":
+    image_dir = input("Directory immagini: ")
+    repeat = 3
+    paths = [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir)) if name.lower().endswith((".jpg", ".jpeg", ".tif", ".tiff"))]
+    if not paths:
+        raise SystemExit("Nessuna immagine JPEG/TIFF trovata")
+    buffers = []
+    for path in paths:
+        with open(path, "rb") as f:
+            buffers.append(f.read())
+
+    slow, slow_results = bench(exifread_gps, paths, repeat)
+    fast, fast_results = bench(read_gps, paths, repeat)
+    from_buffer, _ = bench(buffer_gps, buffers, repeat)
+
+    mismatches = 0
+    for slow_result, fast_result in zip(slow_results, fast_results):
+        if (slow_result is None) != (fast_result is None):
+            mismatches += 1
+        elif slow_result is not None and (abs(slow_result[0] - fast_result["lat"]) > 1e-7 or abs(slow_result[1] - fast_result["lng"]) > 1e-7):
+            mismatches += 1
+
+    print(f"Immagini: {len(paths)} (x{repeat})")
+    print(f"  exifread:         {slow * 1000:.3f} ms/immagine")
+    print(f"  read_gps (file):  {fast * 1000:.3f} ms/immagine ({slow / fast:.1f}x)")
+    print(f"  read_gps (byte):  {from_buffer * 1000:.3f} ms/immagine ({slow / from_buffer:.1f}x)")
+    print(f"  risultati diversi: {mismatches}")
@@ -0,0 +1,95 @@
+# Coded by Pietro Squilla
+# Micro-benchmark di detect_and_crop_black e della lettura EXIF/GPS su JPEG sintetici con un numero
+# noto di macchie scure; la prima esecuzione salva la baseline, le successive la confrontano
+# (codice 1 se ci sono regressioni)
+import os
+import sys
+import tempfile
+import cv2
+import numpy as np
+from PIL import Image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
+import Meteor
+from gps_exif import read_gps
+from microbench import measure, run_suite
+
+BASELINE_FILE = os.path.join("bench_results", "bench_micro_baseline.json") # relativo alla cartella dello script (ignorato da git), oppure percorso come primo argomento
+UPDATE_BASELINE = False # True per sostituire la baseline con i risultati correnti
+FRAMES = [(750, 1000, 40, 20), (3000, 4000, 400, 5)] # (altezza, larghezza, macchie, misure) dei fotogrammi sintetici
+BACKENDS = ["contours", "components"]
+GPS = (45.4642, 9.19, 120.0) # latitudine, longitudine e quota scritte negli EXIF
+
+
+def blob_field(height, width, blobs, seed=0):
+    # terreno chiaro con rumore e macchie scure rotonde ben separate, tutte sopra MIN_AREA:
+    # il rilevamento deve trovarne esattamente blobs
+    rng = np.random.default_rng(seed)
+    image = rng.integers(90, 220, size=(height, width), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (7, 7), 0)
+    columns = int(np.ceil(np.sqrt(blobs * width / height)))
+    rows = int(np.ceil(blobs / columns))
+    cell_w, cell_h = width // columns, height // rows
+    max_radius = max(14, min(40, min(cell_w, cell_h) // 4))
+    for k in range(blobs):
+        row, column = divmod(k, columns)
+        radius = int(rng.integers(14, max_radius + 1))
+        cx = column * cell_w + cell_w // 2 + int(rng.integers(-cell_w // 8, cell_w // 8 + 1))
+        cy = row * cell_h + cell_h // 2 + int(rng.integers(-cell_h // 8, cell_h // 8 + 1))
+        cv2.circle(image, (cx, cy), radius, int(rng.integers(0, 30)), -1)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def gps_exif_bytes(lat, lng, altitude):
+    # EXIF con il blocco GPS in gradi, primi e secondi, come quello dei droni
+    def dms(value):
+        degrees = int(value)
+        minutes = (value - degrees) * 60
+        return (float(degrees), float(int(minutes)), (minutes - int(minutes)) * 60)
+
+    exif = Image.Exif()
+    exif[0x8825] = {1: "N" if lat >= 0 else "S", 2: dms(abs(lat)), 3: "E" if lng >= 0 else "W", 4: dms(abs(lng)), 5: 0, 6: altitude}
+    return exif.tobytes()
+
+
+def write_frame(directory, height, width, blobs):
+    path = os.path.join(directory, f"frame_{width}x{height}.jpg")
+    image = blob_field(height, width, blobs)
+    Image.fromarray(image[:, :, ::-1]).save(path, quality=95, exif=gps_exif_bytes(*GPS))
+    for backend in BACKENDS:
+        Meteor.DETECTION_BACKEND = backend
+        boxes = []
+        Meteor.detect_and_crop_black(path, boxes=boxes)
+        if len(boxes) != blobs:
+            raise RuntimeError(f"Fotogramma {width}x{height} ({backend}): attese {blobs} macchie, trovate {len(boxes)}")
+    return path
+
+
+def detect(path, backend):
+    Meteor.DETECTION_BACKEND = backend
+    return Meteor.detect_and_crop_black(path)
+
+
+def build_cases(directory):
+    cases = []
+    paths = []
+    for height, width, blobs, repeat in FRAMES:
+        path = write_frame(directory, height, width, blobs)
+        paths.append(path)
+        for backend in BACKENDS:
+            cases.append((f"detect_and_crop_black {backend} {width}x{height}", lambda path=path, backend=backend, repeat=repeat: measure(detect, (path, backend), unit="foto", repeat=repeat)))
+
+    # lettura EXIF sul fotogramma piu' grande: exifread (percorso originale) contro gps_exif
+    path = paths[-1]
+    exif_data = Meteor.get_exif_data(path)
+    cases.append(("get_exif_data", lambda: measure(Meteor.get_exif_data, (path,), unit="foto")))
+    cases.append(("get_gps_info", lambda: measure(Meteor.get_gps_info, (exif_data, path), unit="foto")))
+    cases.append(("read_gps", lambda: measure(read_gps, (path,), unit="foto")))
+    return cases
+
+
+if __name__ == "__main__":
+    # niente crop su disco: si misura il rilevamento, non la scrittura
+    Meteor.CROP_STORE = "memory"
+    baseline_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE)
+    with tempfile.TemporaryDirectory() as directory:
+        run_suite(build_cases(directory), baseline_path, UPDATE_BASELINE)
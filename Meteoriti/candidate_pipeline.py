@@ -0,0 +1,161 @@
+# Coded by Pietro Squilla
+# Pre-filtro a soglia come primo stadio di una pipeline: i crop candidati vengono passati a lotti
+# a una funzione di punteggio (classificatore) che gira in parallelo alla ricerca delle aree scure
+
+import queue
+import threading
+import time
+import numpy as np
+from Meteor import iter_directory, WORKERS, CHUNKSIZE, CROP_STORE
+from crop_store import read_crop
+
+BATCH_SIZE = 32 # crop per chiamata al classificatore
+MAX_PENDING_BATCHES = 4 # lotti pronti in attesa: oltre questo limite la ricerca si ferma (backpressure)
+
+
+class PipelineStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.images = 0
+        self.candidates = 0
+        self.batches = 0
+        self.detect_wait = 0.0 # tempo in cui il classificatore ha atteso la ricerca
+        self.score_time = 0.0
+        self.blocked = 0.0 # tempo in cui la ricerca ha atteso il classificatore
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return {
+            "elapsed": elapsed,
+            "images": self.images,
+            "candidates": self.candidates,
+            "batches": self.batches,
+            "images_per_s": self.images / elapsed if elapsed else 0.0,
+            "candidates_per_s": self.candidates / elapsed if elapsed else 0.0,
+            "detect_wait": self.detect_wait,
+            "score_time": self.score_time,
+            "detect_blocked": self.blocked,
+        }
+
+
+def iter_candidates(image_dir, workers=WORKERS, chunksize=CHUNKSIZE, index=None, timings=None, stats=None):
+    # un dizionario per ogni area scura: immagine, riquadro, GPS e crop (array BGR);
+    # i crop arrivano dai processi come array, riletti dal disco solo per i risultati dell'indice
+    for image_file, record in iter_directory(image_dir, workers, chunksize, index, timings, keep_crops=True):
+        if stats is not None:
+            stats.images += 1
+        crops = record.get("crops")
+        if crops is None:
+            crops = [read_crop(ref) for ref in record["crop_paths"]]
+        for i, (crop, box) in enumerate(zip(crops, record["boxes"])):
+            yield {
+                "image_file": image_file,
+                "crop_index": i,
+                "crop_path": record["crop_paths"][i] if i < len(record["crop_paths"]) else None,
+                "box": box,
+                "gps": record["gps"],
+                "black_percentage": record["black_percentage"],
+                "crop": crop,
+            }
+
+
+def batched(candidates, batch_size):
+    batch = []
+    for candidate in candidates:
+        batch.append(candidate)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def score_candidates(candidates, score, batch_size=BATCH_SIZE, max_pending=MAX_PENDING_BATCHES, stats=None):
+    # candidates: generatore (es. iter_candidates), consumato da un thread separato;
+    # score(lista di crop) -> lista di punteggi, chiamata qui a lotti; produce (candidato, punteggio)
+    if stats is None:
+        stats = PipelineStats()
+    batches = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        # in coda, dopo l'ultimo lotto, la fine oppure l'eccezione che ha fermato la ricerca
+        end = done
+        try:
+            for batch in batched(candidates, batch_size):
+                start = time.perf_counter()
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                stats.blocked += time.perf_counter() - start
+                if stop.is_set():
+                    return
+        except Exception as e:
+            end = e
+        finally:
+            while not stop.is_set():
+                try:
+                    batches.put(end, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            start = time.perf_counter()
+            batch = batches.get()
+            stats.detect_wait += time.perf_counter() - start
+            if batch is done:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            start = time.perf_counter()
+            scores = score([candidate["crop"] for candidate in batch])
+            stats.score_time += time.perf_counter() - start
+            stats.batches += 1
+            stats.candidates += len(batch)
+            for candidate, value in zip(batch, scores):
+                yield candidate, value
+    finally:
+        stop.set()
+        producer.join()
+
+
+def dark_blob_score(crops):
+    # classificatore di prova (solo CPU): crop piccoli, compatti e molto scuri ottengono punteggi alti
+    scores = []
+    for crop in crops:
+        gray = crop.mean(axis=2) if crop.ndim == 3 else crop
+        darkness = 1.0 - gray.mean() / 255.0
+        height, width = gray.shape[:2]
+        compactness = min(height, width) / max(height, width)
+        scores.append(float(np.clip(darkness * compactness, 0.0, 1.0)))
+    return scores
+
+
+########
+# MAIN #
+########
+if __name__ == "__main__":
+    image_dir = input("Directory immagini: ")
+    print(f"Modalita' crop: {CROP_STORE}")
+
+    stats = PipelineStats()
+    results = []
+    for candidate, value in score_candidates(iter_candidates(image_dir, stats=stats), dark_blob_score, stats=stats):
+        results.append((value, candidate["image_file"], candidate["crop_index"], candidate["gps"]))
+    results.sort(reverse=True)
+
+    for value, image_file, crop_index, gps in results[:20]:
+        print(f"{value:.3f}  {image_file} crop {crop_index}  GPS {gps}")
+
+    summary = stats.summary()
+    print(f"Immagini: {summary['images']} ({summary['images_per_s']:.1f}/s), candidati: {summary['candidates']} ({summary['candidates_per_s']:.1f}/s) in {summary['elapsed']:.1f} s")
+    print(f"  lotti: {summary['batches']}, classificatore: {summary['score_time']:.1f} s")
+    print(f"  attesa della ricerca: {summary['detect_wait']:.1f} s, ricerca bloccata dal classificatore: {summary['detect_blocked']:.1f} s")
@@ -0,0 +1,155 @@
+# Coded by Pietro Squilla
+# Archiviazione dei crop: file singoli, archivio a blocchi (pochi file grandi con indice degli offset)
+# oppure solo in memoria per classificatori a valle
+
+import base64
+import json
+import os
+import cv2
+import numpy as np
+
+CROP_DIR = "crop"
+CHUNK_BYTES = 256 * 1024 ** 2 # dimensione massima di un file di archivio
+CROP_QUALITY = 95 # qualita' JPEG dei crop
+REPORT_CROP_DIR = "report_crop" # crop estratti dagli archivi per il report
+
+
+def encode_crop(crop, quality=CROP_QUALITY):
+    ok, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Codifica JPEG del crop fallita")
+    return buffer.tobytes()
+
+
+def crop_file(ref):
+    # file che contiene il crop: il percorso stesso o l'archivio di un riferimento "archivio#offset:lunghezza"
+    return ref.split("#", 1)[0]
+
+
+def read_crop_bytes(ref):
+    if "#" not in ref:
+        with open(ref, "rb") as f:
+            return f.read()
+    path, span = ref.rsplit("#", 1)
+    offset, length = (int(value) for value in span.split(":"))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def read_crop(ref):
+    return cv2.imdecode(np.frombuffer(read_crop_bytes(ref), np.uint8), cv2.IMREAD_COLOR)
+
+
+def crop_data_uri(ref=None, crop=None):
+    # sorgente <img> autonoma, per i crop che il browser non puo' aprire come file
+    data = read_crop_bytes(ref) if crop is None else encode_crop(crop)
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+
+def extract_crop(ref, directory=REPORT_CROP_DIR):
+    # copia come JPEG a se' (senza ricodifica) un crop d'archivio, per mostrarlo nel report;
+    # i crop gia' su file e quelli gia' estratti non vengono riscritti
+    if "#" not in ref:
+        return ref
+    path, span = ref.rsplit("#", 1)
+    target = os.path.join(directory, f"{os.path.splitext(os.path.basename(path))[0]}_{span.replace(':', '_')}.jpg")
+    if not os.path.exists(target):
+        os.makedirs(directory, exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(read_crop_bytes(ref))
+    return target
+
+
+def crop_name(image_path, i):
+    return f"{os.path.splitext(os.path.basename(image_path))[0]}_crop{i}.jpg"
+
+
+class FileCropStore:
+    # un file JPEG per crop (comportamento originale)
+    mode = "files"
+
+    def __init__(self, directory=CROP_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, image_path, crops):
+        refs = []
+        for i, crop in enumerate(crops):
+            ref = os.path.join(self.directory, crop_name(image_path, i))
+            with open(ref, "wb") as f:
+                f.write(encode_crop(crop))
+            refs.append(ref)
+        return refs
+
+
+class ArchiveCropStore:
+    # i crop di ogni immagine vengono codificati e accodati con una sola scrittura a un file .pack;
+    # ogni processo ha i propri archivi, e accanto a ciascuno un .idx (JSONL) con gli offset
+    mode = "archive"
+
+    def __init__(self, directory=CROP_DIR, chunk_bytes=CHUNK_BYTES):
+        self.directory = directory
+        self.chunk_bytes = chunk_bytes
+        self.pack = None
+        self.index = None
+        self.pack_path = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_chunk(self):
+        self.close()
+        number = 0
+        while True:
+            path = os.path.join(self.directory, f"crops_{os.getpid()}_{number:04d}.pack")
+            if not os.path.exists(path):
+                break
+            number += 1
+        self.pack_path = path
+        self.pack = open(path, "ab")
+        self.index = open(f"{os.path.splitext(path)[0]}.idx", "a", encoding="utf-8")
+
+    def put(self, image_path, crops):
+        if not crops:
+            return []
+        buffers = [encode_crop(crop) for crop in crops]
+        size = sum(len(buffer) for buffer in buffers)
+        if self.pack is None or (self.pack.tell() > 0 and self.pack.tell() + size > self.chunk_bytes):
+            self._open_chunk()
+
+        offset = self.pack.tell()
+        self.pack.write(b"".join(buffers))
+        self.pack.flush()
+        refs = []
+        lines = []
+        for i, buffer in enumerate(buffers):
+            refs.append(f"{self.pack_path}#{offset}:{len(buffer)}")
+            lines.append(json.dumps({"image": image_path, "crop": i, "offset": offset, "length": len(buffer)}))
+            offset += len(buffer)
+        self.index.write("\n".join(lines) + "\n")
+        self.index.flush()
+        return refs
+
+    def close(self):
+        if self.pack is not None:
+            self.pack.close()
+            self.index.close()
+            self.pack = None
+            self.index = None
+
+
+class MemoryCropStore:
+    # nessuna scrittura su disco: i crop restano come array nel risultato (chiave "crops")
+    mode = "memory"
+
+    def put(self, image_path, crops):
+        return []
+
+
+def open_store(mode, directory=CROP_DIR, chunk_bytes=CHUNK_BYTES):
+    if mode == "files":
+        return FileCropStore(directory)
+    if mode == "archive":
+        return ArchiveCropStore(directory, chunk_bytes)
+    if mode == "memory":
+        return MemoryCropStore()
+    raise ValueError(f"Modalita' crop sconosciuta: {mode}")
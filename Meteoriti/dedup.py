@@ -0,0 +1,45 @@
+# Coded by Pietro Squilla
+# Deduplicazione dei candidati tra fotogrammi sovrapposti: i punti georeferenziati piu' vicini
+# di una distanza a terra diventano un solo candidato, rappresentato dal crop migliore; due
+# candidati dello stesso fotogramma restano distinti (sono oggetti diversi)
+
+import numpy as np
+from georef import CSV_FIELDS
+from spatial_index import SpatialIndex
+
+DEDUP_DISTANCE_M = 2.0 # metri a terra; 0 = nessuna deduplicazione
+UNIQUE_CSV_FIELDS = CSV_FIELDS + ["frames", "duplicates"]
+
+
+def candidate_quality(point):
+    # crop migliore: contrasto locale alto (se calcolato) e vicino al centro del fotogramma,
+    # dove la camera e' piu' nadirale e la posizione piu' affidabile
+    contrast = point.get("contrast")
+    base = contrast / 255.0 if contrast is not None else 1.0
+    return base * (1.0 - 0.5 * point.get("center_offset", 0.0))
+
+
+def cluster_points(points, distance=DEDUP_DISTANCE_M):
+    # restituisce un punto per gruppo (il migliore) con "frames" (fotogrammi distinti) e
+    # "duplicates" (gli altri candidati come "file#indice", separati da ";")
+    if distance <= 0 or not points:
+        return [dict(point, frames=1, duplicates="") for point in points]
+
+    # ordinati per qualita': il capogruppo di ogni gruppo e' il candidato migliore
+    ordered = sorted(points, key=candidate_quality, reverse=True)
+    lats = np.array([point["lat"] for point in ordered], dtype=float)
+    lngs = np.array([point["lng"] for point in ordered], dtype=float)
+    frames = np.unique([point["image_file"] for point in ordered], return_inverse=True)[1]
+    leaders = SpatialIndex(lats, lngs, distance).clusters(distance, frames)
+
+    groups = {}
+    for index, leader in enumerate(leaders):
+        groups.setdefault(int(leader), []).append(ordered[index])
+    unique = []
+    for members in groups.values():
+        best = dict(members[0])
+        best["frames"] = len({member["image_file"] for member in members})
+        best["duplicates"] = ";".join(f"{member['image_file']}#{member['crop_index']}" for member in members[1:])
+        unique.append(best)
+    return unique
+
@@ -0,0 +1,125 @@
+# Coded by Pietro Squilla
+# Caratteristiche di forma e tessitura dei contorni scuri e regole per scartare i falsi positivi
+# (ombre, strade, acqua) prima di salvare i crop
+
+import cv2
+import numpy as np
+
+FEATURE_NAMES = ("area", "circularity", "solidity", "aspect_ratio", "mean_intensity", "std_intensity", "contrast")
+RING_WIDTH = 5 # pixel attorno al contorno usati per il contrasto locale
+
+# regole: caratteristica -> (minimo, massimo), None = nessun limite; un candidato fuori limite e' scartato
+# con la prima regola violata come motivo
+REJECTION_RULES = {
+    "aspect_ratio": (None, 5.0), # strade, bordi di campi
+    "solidity": (0.6, None), # ombre frastagliate, vegetazione
+    "circularity": (0.2, None),
+    "contrast": (40.0, None), # acqua e ombre estese: poco piu' chiare attorno
+}
+
+
+def contour_features(gray, contours, ring_width=RING_WIDTH):
+    # caratteristiche di tutti i contorni in un solo passaggio sull'immagine etichettata:
+    # restituisce {nome: array} con un valore per contorno
+    labels = np.zeros(gray.shape[:2], dtype=np.int32)
+    for i, cnt in enumerate(contours):
+        cv2.drawContours(labels, [cnt], -1, i + 1, thickness=cv2.FILLED)
+    area = np.array([cv2.contourArea(cnt) for cnt in contours])
+    return label_features(gray, labels, contours, area, ring_width)
+
+
+def label_features(gray, labels, contours, area, ring_width=RING_WIDTH, lut=None):
+    # labels: etichette 1..n (0 = sfondo) allineate ai contorni; area: area di ciascuno;
+    # lut: eventuale rinumerazione di etichette diverse verso 1..n (0 = da ignorare)
+    count = len(contours)
+    if count == 0:
+        return {name: np.zeros(0) for name in FEATURE_NAMES}
+
+    # anello esterno: stessa etichetta nella dilatazione, fuori dal contorno
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * ring_width + 1, 2 * ring_width + 1))
+    dilation_type = np.uint16 if labels.max() < 65536 else np.float32
+    dilated = cv2.dilate(labels.astype(dilation_type), kernel).ravel()
+
+    # statistiche solo sui pixel etichettati e sui loro anelli, non sull'intera immagine
+    flat = labels.ravel()
+    values = gray.ravel()
+    inside = np.flatnonzero(flat)
+    inside_labels = flat[inside] if lut is None else lut[flat[inside]]
+    inside_values = values[inside].astype(np.float64)
+    ring = np.flatnonzero(dilated)
+    ring = ring[flat[ring] == 0]
+    ring_labels = dilated[ring].astype(np.int64)
+    if lut is not None:
+        ring_labels = lut[ring_labels]
+
+    pixels = np.bincount(inside_labels, minlength=count + 1)[1:count + 1]
+    sums = np.bincount(inside_labels, weights=inside_values, minlength=count + 1)[1:count + 1]
+    squares = np.bincount(inside_labels, weights=inside_values * inside_values, minlength=count + 1)[1:count + 1]
+    ring_pixels = np.bincount(ring_labels, minlength=count + 1)[1:count + 1]
+    ring_sums = np.bincount(ring_labels, weights=values[ring].astype(np.float64), minlength=count + 1)[1:count + 1]
+
+    safe_pixels = np.maximum(pixels, 1)
+    mean = sums / safe_pixels
+    std = np.sqrt(np.maximum(squares / safe_pixels - mean * mean, 0.0))
+    ring_mean = np.where(ring_pixels > 0, ring_sums / np.maximum(ring_pixels, 1), mean)
+
+    area = np.asarray(area, dtype=np.float64)
+    perimeter = np.array([cv2.arcLength(cnt, True) for cnt in contours])
+    hull_area = np.array([cv2.contourArea(cv2.convexHull(cnt)) for cnt in contours])
+    rects = np.array([cv2.boundingRect(cnt) for cnt in contours], dtype=np.float64).reshape(-1, 4)
+    sides = np.maximum(rects[:, 2:4], 1.0)
+
+    return {
+        "area": area,
+        "circularity": 4.0 * np.pi * area / np.maximum(perimeter * perimeter, 1e-9),
+        "solidity": area / np.maximum(hull_area, 1e-9),
+        "aspect_ratio": sides.max(axis=1) / sides.min(axis=1),
+        "mean_intensity": mean,
+        "std_intensity": std,
+        "contrast": ring_mean - mean,
+    }
+
+
+def apply_rules(features, rules=REJECTION_RULES):
+    # restituisce (maschera dei candidati tenuti, motivo dello scarto per ciascuno o None)
+    count = len(features["area"])
+    keep = np.ones(count, dtype=bool)
+    reasons = np.full(count, None, dtype=object)
+    for name, (low, high) in rules.items():
+        values = features[name]
+        failed = np.zeros(count, dtype=bool)
+        if low is not None:
+            failed |= values < low
+        if high is not None:
+            failed |= values > high
+        reasons[failed & keep] = name
+        keep &= ~failed
+    return keep, reasons
+
+
+def count_reasons(reasons, counts=None):
+    counts = {} if counts is None else counts
+    for reason in reasons:
+        if reason is not None:
+            counts[reason] = counts.get(reason, 0) + 1
+    return counts
+
+
+def feature_rows(features, mask=None):
+    # caratteristiche per candidato, come dizionari (per il report e l'indice JSON)
+    indices = range(len(features["area"])) if mask is None else np.flatnonzero(mask)
+    return [{name: round(float(features[name][i]), 3) for name in FEATURE_NAMES} for i in indices]
+
+
+def component_features(gray, labels, ids, rects, areas, ring_width=RING_WIDTH):
+    # come contour_features per le componenti connesse (cv2.connectedComponentsWithStats):
+    # ids = etichette da valutare, rects = riquadri [x, y, w, h], areas = numero di pixel
+    lut = np.zeros(labels.max() + 1, dtype=np.int64)
+    lut[ids] = np.arange(1, len(ids) + 1)
+    # contorno esterno di ogni componente, cercato solo nel suo riquadro
+    contours = []
+    for label, (x, y, w, h) in zip(ids, rects):
+        mask = (labels[y:y+h, x:x+w] == label).astype(np.uint8)
+        found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(int(x), int(y)))
+        contours.append(max(found, key=cv2.contourArea))
+    return label_features(gray, labels, contours, areas, ring_width, lut)
@@ -0,0 +1,135 @@
+# Coded by Pietro Squilla
+# Coordinate a terra di ogni candidato: camera nadirale su terreno piatto, da GPS, quota,
+# focale e direzione dell'EXIF; esportazione dei punti in GeoJSON e CSV
+
+import csv
+import json
+import numpy as np
+
+EARTH_RADIUS = 6371000.0 # metri
+FULL_FRAME_DIAGONAL_MM = 43.27 # diagonale del formato 35 mm, riferimento della focale equivalente
+GROUND_ALTITUDE_M = None # quota del terreno (s.l.m.) se l'EXIF non ha la quota relativa al decollo; None = nessuna georeferenziazione senza quota relativa
+SENSOR_WIDTH_MM = None # larghezza del sensore, serve solo se l'EXIF non ha la focale equivalente 35 mm
+DEFAULT_HEADING = 0.0 # gradi da nord se l'EXIF non ha la direzione (lato alto dell'immagine verso nord)
+
+CSV_FIELDS = ["image_file", "crop_index", "lat", "lng", "pixel_x", "pixel_y", "width_m", "height_m", "gsd_m", "center_offset", "contrast", "crop_path"]
+
+
+def height_above_ground(gps_data, ground_altitude=GROUND_ALTITUDE_M):
+    # la quota GPS e' sul livello del mare: vale come altezza dal suolo solo con la quota del terreno impostata
+    if "relative_altitude" in gps_data:
+        return gps_data["relative_altitude"]
+    if "altitude" in gps_data and ground_altitude is not None:
+        return gps_data["altitude"] - ground_altitude
+    return None
+
+
+def georef_issue(gps_data, ground_altitude=GROUND_ALTITUDE_M, sensor_width=SENSOR_WIDTH_MM):
+    # motivo per cui un fotogramma non si puo' georeferenziare, None se i dati bastano
+    if not gps_data:
+        return "GPS assente"
+    if "relative_altitude" not in gps_data:
+        if "altitude" not in gps_data:
+            return "quota assente"
+        if ground_altitude is None:
+            return "quota relativa al decollo assente e GROUND_ALTITUDE_M non impostata"
+    if height_above_ground(gps_data, ground_altitude) <= 0:
+        return "quota non sopra il terreno"
+    if not gps_data.get("focal_length_35mm") and not (gps_data.get("focal_length") and sensor_width):
+        return "focale equivalente 35 mm assente e SENSOR_WIDTH_MM non impostata"
+    return None
+
+
+def ground_sample_distance(gps_data, width, height, ground_altitude=GROUND_ALTITUDE_M, sensor_width=SENSOR_WIDTH_MM):
+    # metri a terra per pixel, None se mancano quota o focale
+    altitude = height_above_ground(gps_data, ground_altitude)
+    if altitude is None or altitude <= 0:
+        return None
+    if gps_data.get("focal_length_35mm"):
+        return altitude * FULL_FRAME_DIAGONAL_MM / (gps_data["focal_length_35mm"] * np.hypot(width, height))
+    if gps_data.get("focal_length") and sensor_width:
+        return altitude * sensor_width / (gps_data["focal_length"] * width)
+    return None
+
+
+def pixel_to_world(gps_data, pixels, width, height, ground_altitude=GROUND_ALTITUDE_M, sensor_width=SENSOR_WIDTH_MM):
+    # pixels: array (N, 2) di coordinate (x, y) nell'immagine; restituisce (lat, lng, gsd) per tutti
+    # i punti insieme, oppure None se l'EXIF non basta
+    gsd = ground_sample_distance(gps_data, width, height, ground_altitude, sensor_width)
+    if gsd is None:
+        return None
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    right = (pixels[:, 0] - width / 2.0) * gsd
+    forward = (height / 2.0 - pixels[:, 1]) * gsd
+
+    # il lato alto dell'immagine punta nella direzione di volo (gradi da nord, in senso orario)
+    heading = np.radians(gps_data.get("direction", DEFAULT_HEADING))
+    east = right * np.cos(heading) + forward * np.sin(heading)
+    north = forward * np.cos(heading) - right * np.sin(heading)
+
+    lat0 = np.radians(gps_data["lat"])
+    lat = gps_data["lat"] + np.degrees(north / EARTH_RADIUS)
+    lng = gps_data["lng"] + np.degrees(east / (EARTH_RADIUS * np.cos(lat0)))
+    return lat, lng, gsd
+
+
+def candidate_points(image_file, record):
+    # un punto per riquadro del risultato di Meteor.process_image (centro del riquadro)
+    gps_data = record.get("gps_data")
+    boxes = np.asarray(record.get("boxes") or [], dtype=np.float64).reshape(-1, 4)
+    if not gps_data or not boxes.size or "image_size" not in record:
+        return []
+    width, height = record["image_size"]
+    centers = boxes[:, :2] + boxes[:, 2:4] / 2.0
+    world = pixel_to_world(gps_data, centers, width, height)
+    if world is None:
+        return []
+    lat, lng, gsd = world
+    # distanza dal centro del fotogramma: 0 al centro, 1 negli angoli
+    offsets = np.hypot(centers[:, 0] - width / 2.0, centers[:, 1] - height / 2.0) / np.hypot(width / 2.0, height / 2.0)
+    crop_paths = record.get("crop_paths") or []
+    features = record.get("features") or []
+    points = []
+    for i in range(len(boxes)):
+        points.append({
+            "image_file": image_file,
+            "crop_index": i,
+            "lat": round(float(lat[i]), 7),
+            "lng": round(float(lng[i]), 7),
+            "pixel_x": round(float(centers[i, 0]), 1),
+            "pixel_y": round(float(centers[i, 1]), 1),
+            "width_m": round(float(boxes[i, 2] * gsd), 3),
+            "height_m": round(float(boxes[i, 3] * gsd), 3),
+            "gsd_m": round(float(gsd), 4),
+            "center_offset": round(float(offsets[i]), 3),
+            "contrast": features[i].get("contrast") if i < len(features) else None,
+            "crop_path": crop_paths[i] if i < len(crop_paths) else "",
+        })
+    return points
+
+
+class CandidateWriter:
+    # scrive i punti man mano in un GeoJSON (FeatureCollection) e in un CSV
+    def __init__(self, geojson_file="candidati.geojson", csv_file="candidati.csv", fields=CSV_FIELDS):
+        self.count = 0
+        self.geojson = open(geojson_file, "w", encoding="utf-8")
+        self.geojson.write('{"type": "FeatureCollection", "features": [\n')
+        self.csv_file = open(csv_file, "w", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.csv_file, fieldnames=fields, extrasaction="ignore")
+        self.csv.writeheader()
+
+    def add(self, points):
+        for point in points:
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [point["lng"], point["lat"]]},
+                "properties": {key: value for key, value in point.items() if key not in ("lat", "lng")},
+            }
+            self.geojson.write((",\n" if self.count else "") + json.dumps(feature, ensure_ascii=False))
+            self.csv.writerow(point)
+            self.count += 1
+
+    def close(self):
+        self.geojson.write("\n]}\n")
+        self.geojson.close()
+        self.csv_file.close()
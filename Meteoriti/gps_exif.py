@@ -0,0 +1,169 @@
+# Coded by Pietro Squilla
+# Lettura veloce dei soli dati GPS dall'EXIF (APP1 -> IFD0 -> GPS IFD), senza exifread
+
+import os
+import re
+import struct
+
+GPS_IFD_POINTER = 0x8825
+EXIF_IFD_POINTER = 0x8769
+XMP_PACKET = 700 # XMP di un TIFF (nei JPEG sta in un APP1 separato)
+
+# tag del GPS IFD
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+GPS_ALTITUDE_REF = 5
+GPS_ALTITUDE = 6
+GPS_IMG_DIRECTION = 17
+
+# tag dell'EXIF IFD usati per la georeferenziazione
+FOCAL_LENGTH = 0x920A
+FOCAL_LENGTH_35MM = 0xA405
+
+# quota relativa al punto di decollo scritta nell'XMP dai droni DJI
+RELATIVE_ALTITUDE = re.compile(rb'RelativeAltitude(?:="|>)\s*([+-]?[0-9.]+)')
+
+# tipo TIFF -> (dimensione in byte, formato struct)
+TYPES = {
+    1: (1, "B"), # BYTE
+    2: (1, "s"), # ASCII
+    3: (2, "H"), # SHORT
+    4: (4, "I"), # LONG
+    5: (8, "II"), # RATIONAL
+    7: (1, "B"), # UNDEFINED
+    9: (4, "i"), # SLONG
+    10: (8, "ii"), # SRATIONAL
+}
+
+HEADER_READ_SIZE = 128 * 1024 # l'APP1 sta all'inizio del file ed e' al massimo 64 KB
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*")
+
+
+class FileView:
+    # byte di un file aperto letti su richiesta: negli ortomosaici TIFF gli IFD possono stare in
+    # qualunque punto del file (spesso in fondo), le slice li raggiungono con seek senza leggere i pixel
+    def __init__(self, f):
+        self.f = f
+        self.size = f.seek(0, os.SEEK_END)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.size)
+        self.f.seek(start)
+        return self.f.read(max(0, stop - start))
+
+
+def find_tiff_block(data):
+    # restituisce il blocco TIFF (da "II"/"MM" in poi) di un JPEG o di un TIFF, None se assente
+    if data[:4] in TIFF_MAGIC:
+        return data
+    if data[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF: # byte di riempimento
+            offset += 1
+            continue
+        if marker in (0xD9, 0xDA): # fine immagine o inizio dati compressi: niente EXIF
+            return None
+        length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        segment = data[offset + 4:offset + 2 + length]
+        if marker == 0xE1 and segment[:6] == b"Exif\x00\x00":
+            return segment[6:]
+        offset += 2 + length
+    return None
+
+
+def read_ifd(tiff, offset, endian, wanted=None):
+    # legge le voci di un IFD: {tag: valori}; con wanted solo i tag richiesti
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, kind, n = struct.unpack(endian + "HHI", tiff[entry:entry + 8])
+        if (wanted is not None and tag not in wanted) or kind not in TYPES:
+            continue
+        size, fmt = TYPES[kind]
+        total = size * n
+        if total <= 4:
+            raw = tiff[entry + 8:entry + 8 + total]
+        else:
+            value_offset = struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+            raw = tiff[value_offset:value_offset + total]
+            if len(raw) < total:
+                continue
+        if kind == 2:
+            entries[tag] = raw.split(b"\x00", 1)[0].decode("ascii", "replace")
+        else:
+            values = struct.unpack(endian + fmt * n, raw)
+            if kind in (5, 10):
+                values = [values[j] / values[j + 1] if values[j + 1] else 0.0 for j in range(0, len(values), 2)]
+            entries[tag] = list(values)
+    return entries
+
+
+def dms_to_decimal(dms, ref):
+    degrees = dms[0] + dms[1] / 60 + dms[2] / 3600
+    return -degrees if ref in ("S", "W") else degrees
+
+
+def parse_gps(data):
+    # data: byte iniziali del file, l'intero file gia' letto o un FileView; restituisce un dizionario o None
+    tiff = find_tiff_block(data)
+    if tiff is None or len(tiff) < 8:
+        return None
+    endian = "<" if tiff[:2] == b"II" else ">"
+    ifd0_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+    ifd0 = read_ifd(tiff, ifd0_offset, endian, {GPS_IFD_POINTER, EXIF_IFD_POINTER, XMP_PACKET})
+    if GPS_IFD_POINTER not in ifd0:
+        return None
+
+    gps = read_ifd(tiff, ifd0[GPS_IFD_POINTER][0], endian)
+    if GPS_LATITUDE not in gps or GPS_LONGITUDE not in gps:
+        return None
+    result = {
+        "lat": dms_to_decimal(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF, "N")),
+        "lng": dms_to_decimal(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF, "E")),
+    }
+    if GPS_ALTITUDE in gps:
+        below_sea_level = gps.get(GPS_ALTITUDE_REF, [0])[0] == 1
+        result["altitude"] = -gps[GPS_ALTITUDE][0] if below_sea_level else gps[GPS_ALTITUDE][0]
+    if GPS_IMG_DIRECTION in gps:
+        result["direction"] = gps[GPS_IMG_DIRECTION][0]
+    if EXIF_IFD_POINTER in ifd0:
+        exif = read_ifd(tiff, ifd0[EXIF_IFD_POINTER][0], endian, {FOCAL_LENGTH, FOCAL_LENGTH_35MM})
+        if exif.get(FOCAL_LENGTH, [0])[0]:
+            result["focal_length"] = exif[FOCAL_LENGTH][0]
+        if exif.get(FOCAL_LENGTH_35MM, [0])[0]:
+            result["focal_length_35mm"] = exif[FOCAL_LENGTH_35MM][0]
+    xmp = bytes(ifd0[XMP_PACKET]) if XMP_PACKET in ifd0 else data[:HEADER_READ_SIZE]
+    match = RELATIVE_ALTITUDE.search(xmp)
+    if match:
+        try:
+            result["relative_altitude"] = float(match.group(1))
+        except ValueError:
+            pass
+    return result
+
+
+def read_gps(source):
+    # source: percorso del file oppure byte gia' letti (es. gli stessi passati a cv2.imdecode)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return parse_gps(bytes(source))
+    with open(source, "rb") as f:
+        header = f.read(HEADER_READ_SIZE)
+        if header[:4] in TIFF_MAGIC:
+            # TIFF: si seguono gli offset degli IFD nel file invece di fermarsi all'intestazione
+            return parse_gps(FileView(f))
+    return parse_gps(header)
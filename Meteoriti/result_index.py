@@ -0,0 +1,81 @@
+# Coded by Pietro Squilla
+# Indice persistente (SQLite) dei risultati per immagine: le esecuzioni successive
+# rielaborano solo le immagini nuove o modificate
+
+import hashlib
+import json
+import os
+import sqlite3
+from crop_store import crop_file
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def data_hash(data):
+    # stesso hash di file_hash, per file gia' letti in memoria
+    return hashlib.sha1(data).hexdigest()
+
+
+class ResultIndex:
+    def __init__(self, path, params):
+        # params: parametri di analisi (soglia, area minima, ...); se cambiano i risultati non valgono piu'
+        self.params = json.dumps(params, sort_keys=True)
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, hash TEXT NOT NULL, "
+            "params TEXT NOT NULL, result TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def lookup(self, path):
+        # risultato salvato se il file non e' cambiato, altrimenti None
+        path = os.path.abspath(path)
+        row = self.connection.execute("SELECT size, mtime, hash, params, result FROM results WHERE path = ?", (path,)).fetchone()
+        if row is None or row[3] != self.params:
+            self.misses += 1
+            return None
+
+        size, mtime, content_hash, _, result = row
+        stat = os.stat(path)
+        if stat.st_size != size:
+            self.misses += 1
+            return None
+        if stat.st_mtime != mtime:
+            # data cambiata ma contenuto forse identico (copia, touch): decide l'hash
+            if file_hash(path) != content_hash:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE results SET mtime = ? WHERE path = ?", (stat.st_mtime, path))
+            self.connection.commit()
+
+        result = json.loads(result)
+        paths = [crop_file(ref) for ref in result.get("crop_paths", [])] + ([result["preview_path"]] if result.get("preview_path") else [])
+        if not all(os.path.exists(path) for path in paths):
+            self.misses += 1 # crop o anteprime cancellati: va rielaborata
+            return None
+        self.hits += 1
+        return result
+
+    def store(self, path, content_hash, result):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (path, size, mtime, hash, params, result) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, content_hash, self.params, json.dumps(result)),
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,42 @@
+# Coded by Pietro Squilla
+# Test di score_candidates: lotti in ordine, errori della ricerca passati al consumatore, chiusura anticipata
+
+import threading
+import numpy as np
+import pytest
+from candidate_pipeline import PipelineStats, score_candidates
+
+
+def candidates(count, fail_after=None):
+    for i in range(count):
+        if i == fail_after:
+            raise OSError("disco scollegato")
+        yield {"image_file": f"{i}.jpg", "crop": np.full((4, 4, 3), i, dtype=np.uint8)}
+
+
+def first_pixel(crops):
+    return [float(crop[0, 0, 0]) for crop in crops]
+
+
+def test_scores_follow_the_candidates_in_batches():
+    stats = PipelineStats()
+    results = list(score_candidates(candidates(10), first_pixel, batch_size=3, max_pending=1, stats=stats))
+    assert [value for _, value in results] == [float(i) for i in range(10)]
+    assert stats.batches == 4 and stats.candidates == 10
+
+
+def test_producer_error_reaches_the_consumer():
+    seen = []
+    with pytest.raises(OSError, match="disco scollegato"):
+        for candidate, _ in score_candidates(candidates(10, fail_after=7), first_pixel, batch_size=3):
+            seen.append(candidate["image_file"])
+    # i lotti completi prima dell'errore vengono comunque consegnati
+    assert seen == [f"{i}.jpg" for i in range(6)]
+
+
+def test_closing_early_stops_the_producer():
+    before = threading.active_count()
+    results = score_candidates(candidates(1000), first_pixel, batch_size=2, max_pending=1)
+    next(results)
+    results.close()
+    assert threading.active_count() == before
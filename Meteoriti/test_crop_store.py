@@ -0,0 +1,93 @@
+# Coded by Pietro Squilla
+# Test dell'archiviazione dei crop: archivi .pack con indice .idx, file singoli, estrazione per il report
+# e data URI
+
+import base64
+import json
+import os
+import numpy as np
+import pytest
+from crop_store import ArchiveCropStore, crop_data_uri, crop_file, encode_crop, extract_crop, open_store, read_crop, read_crop_bytes
+
+
+def crops(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (int(rng.integers(8, 40)), int(rng.integers(8, 40)), 3), dtype=np.uint8) for _ in range(count)]
+
+
+def read_index(pack_path):
+    with open(f"{os.path.splitext(pack_path)[0]}.idx", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_archive_round_trip(tmp_path):
+    store = open_store("archive", str(tmp_path))
+    first, second = crops(3), crops(2, seed=1)
+    refs = store.put("voli/foto1.jpg", first) + store.put("voli/foto2.jpg", second)
+    store.close()
+
+    assert len({crop_file(ref) for ref in refs}) == 1 # un solo archivio sotto CHUNK_BYTES
+    for ref, crop in zip(refs, first + second):
+        assert read_crop_bytes(ref) == encode_crop(crop)
+        assert read_crop(ref).shape == crop.shape
+    pack = crop_file(refs[0])
+    assert os.path.getsize(pack) == sum(len(encode_crop(crop)) for crop in first + second)
+    records = read_index(pack)
+    assert [(record["image"], record["crop"]) for record in records] == [("voli/foto1.jpg", i) for i in range(3)] + [("voli/foto2.jpg", i) for i in range(2)]
+    assert [f"{pack}#{record['offset']}:{record['length']}" for record in records] == refs
+
+
+def test_archive_rolls_over_and_never_overwrites(tmp_path):
+    store = ArchiveCropStore(str(tmp_path), chunk_bytes=1)
+    refs = store.put("a.jpg", crops(2)) + store.put("b.jpg", crops(1, seed=2)) # oltre il blocco: nuovo archivio
+    store.close()
+    assert crop_file(refs[0]) == crop_file(refs[1]) != crop_file(refs[2])
+
+    # un'esecuzione successiva accoda nuovi archivi: i riferimenti gia' scritti restano validi
+    again = ArchiveCropStore(str(tmp_path))
+    new_refs = again.put("c.jpg", crops(1, seed=3))
+    again.close()
+    assert crop_file(new_refs[0]) not in {crop_file(ref) for ref in refs}
+    for ref, crop in zip(refs, crops(2) + crops(1, seed=2)):
+        assert read_crop_bytes(ref) == encode_crop(crop)
+    assert len(list(tmp_path.glob("*.pack"))) == len(list(tmp_path.glob("*.idx"))) == 3
+
+
+def test_files_and_memory_stores(tmp_path):
+    image_crops = crops(2)
+    refs = open_store("files", str(tmp_path)).put("voli/foto1.jpg", image_crops)
+    assert refs == [str(tmp_path / "foto1_crop0.jpg"), str(tmp_path / "foto1_crop1.jpg")]
+    assert crop_file(refs[0]) == refs[0]
+    assert read_crop_bytes(refs[1]) == encode_crop(image_crops[1])
+    assert open_store("memory").put("voli/foto1.jpg", image_crops) == []
+    with pytest.raises(ValueError):
+        open_store("cartelle", str(tmp_path))
+
+
+def test_extract_crop_copies_the_archived_jpeg_once(tmp_path):
+    store = open_store("archive", str(tmp_path / "crop"))
+    image_crops = crops(2)
+    refs = store.put("foto.jpg", image_crops)
+    store.close()
+    report_dir = str(tmp_path / "report_crop")
+    paths = [extract_crop(ref, report_dir) for ref in refs]
+    assert len(set(paths)) == 2 and all(os.path.dirname(path) == report_dir for path in paths)
+    for path, crop in zip(paths, image_crops):
+        with open(path, "rb") as f:
+            assert f.read() == encode_crop(crop) # stessi byte dell'archivio, nessuna ricodifica
+    os.utime(paths[0], (0, 0))
+    assert extract_crop(refs[0], report_dir) == paths[0]
+    assert os.path.getmtime(paths[0]) == 0 # gia' estratto: non riscritto
+    single = open_store("files", str(tmp_path / "singoli")).put("foto.jpg", image_crops[:1])[0]
+    assert extract_crop(single, report_dir) == single
+
+
+def test_data_uri_embeds_the_stored_jpeg(tmp_path):
+    store = open_store("archive", str(tmp_path))
+    crop = crops(1)[0]
+    ref = store.put("foto.jpg", [crop])[0]
+    store.close()
+    uri = crop_data_uri(ref)
+    assert uri.startswith("data:image/jpeg;base64,")
+    assert base64.b64decode(uri.split(",", 1)[1]) == encode_crop(crop)
+    assert crop_data_uri(crop=crop) == uri
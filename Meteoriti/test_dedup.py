@@ -0,0 +1,33 @@
+# Coded by Pietro Squilla
+# Test della deduplicazione: un candidato per oggetto visto da piu' fotogrammi, mai due oggetti dello stesso fotogramma
+
+from dedup import cluster_points
+
+METER = 1 / 111195.0 # gradi di latitudine per metro
+
+
+def point(image_file, crop_index, north_m, contrast=100.0, center_offset=0.0):
+    return {"image_file": image_file, "crop_index": crop_index, "lat": 45.0 + north_m * METER, "lng": 9.0,
+            "contrast": contrast, "center_offset": center_offset}
+
+
+def test_same_object_in_overlapping_frames_is_kept_once_with_the_best_crop():
+    points = [point("a.jpg", 0, 0.0, center_offset=0.8), point("b.jpg", 3, 0.5, center_offset=0.1), point("c.jpg", 1, 1.0, contrast=50.0)]
+    unique = cluster_points(points, distance=2.0)
+    assert len(unique) == 1
+    assert (unique[0]["image_file"], unique[0]["crop_index"]) == ("b.jpg", 3)
+    assert unique[0]["frames"] == 3
+    assert sorted(unique[0]["duplicates"].split(";")) == ["a.jpg#0", "c.jpg#1"]
+
+
+def test_close_candidates_in_the_same_frame_stay_distinct():
+    points = [point("a.jpg", 0, 0.0), point("a.jpg", 1, 1.0), point("b.jpg", 0, 0.2, contrast=90.0), point("b.jpg", 1, 1.1, contrast=90.0)]
+    unique = cluster_points(points, distance=2.0)
+    assert sorted((p["image_file"], p["crop_index"], p["duplicates"]) for p in unique) == [("a.jpg", 0, "b.jpg#0"), ("a.jpg", 1, "b.jpg#1")]
+
+
+def test_far_points_and_disabled_dedup():
+    points = [point("a.jpg", 0, 0.0), point("b.jpg", 0, 10.0)]
+    assert len(cluster_points(points, distance=2.0)) == 2
+    assert [p["frames"] for p in cluster_points(points, distance=0)] == [1, 1]
+    assert cluster_points([], distance=2.0) == []
@@ -0,0 +1,81 @@
+# Coded by Pietro Squilla
+# Test delle caratteristiche di forma e tessitura e delle regole di scarto su macchie sintetiche,
+# dai contorni e dalle componenti connesse
+
+import cv2
+import numpy as np
+import pytest
+from features import REJECTION_RULES, apply_rules, component_features, contour_features, count_reasons, feature_rows
+
+THRESHOLD = 40 # come SOGLIA_NERO in Meteor.py
+
+
+def synthetic_blobs():
+    # su fondo chiaro: un sasso scuro compatto, una strada sottile, una croce (ombra frastagliata)
+    # e una pozza scura dentro una zona quasi altrettanto scura
+    gray = np.full((200, 200), 220, dtype=np.uint8)
+    cv2.circle(gray, (40, 40), 15, 20, -1)
+    cv2.rectangle(gray, (100, 20), (103, 90), 10, -1)
+    cv2.rectangle(gray, (20, 136), (59, 143), 15, -1)
+    cv2.rectangle(gray, (36, 120), (43, 159), 15, -1)
+    cv2.circle(gray, (150, 150), 30, 60, -1)
+    cv2.circle(gray, (150, 150), 12, 30, -1)
+    return gray
+
+
+def blob_contours(gray):
+    _, thresholded = cv2.threshold(gray, THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    centers = {"sasso": (40, 40), "strada": (101, 55), "croce": (40, 140), "pozza": (150, 150)}
+    assert len(contours) == len(centers)
+    return {name: next(c for c in contours if cv2.pointPolygonTest(c, center, False) >= 0) for name, center in centers.items()}
+
+
+def test_features_of_a_compact_dark_blob():
+    gray = synthetic_blobs()
+    contours = blob_contours(gray)
+    features = contour_features(gray, [contours["sasso"]])
+    assert features["area"][0] == pytest.approx(np.pi * 14.5 ** 2, rel=0.02) # il contorno passa per i centri dei pixel di bordo
+    assert features["circularity"][0] > 0.85
+    assert features["solidity"][0] > 0.95
+    assert features["aspect_ratio"][0] == pytest.approx(1.0)
+    assert features["mean_intensity"][0] == pytest.approx(20, abs=1)
+    assert features["contrast"][0] == pytest.approx(200, abs=5)
+
+
+def test_rules_keep_the_stone_and_name_the_first_broken_rule():
+    gray = synthetic_blobs()
+    contours = blob_contours(gray)
+    names = ["sasso", "strada", "croce", "pozza"]
+    features = contour_features(gray, [contours[name] for name in names])
+    keep, reasons = apply_rules(features)
+    assert keep.tolist() == [True, False, False, False]
+    assert reasons.tolist() == [None, "aspect_ratio", "solidity", "contrast"]
+    assert count_reasons(reasons) == {"aspect_ratio": 1, "solidity": 1, "contrast": 1}
+    rows = feature_rows(features, keep)
+    assert len(rows) == 1 and rows[0]["area"] == round(float(features["area"][0]), 3)
+
+
+def test_rules_without_limits_keep_everything():
+    gray = synthetic_blobs()
+    features = contour_features(gray, list(blob_contours(gray).values()))
+    keep, reasons = apply_rules(features, {name: (None, None) for name in REJECTION_RULES})
+    assert keep.all() and all(reason is None for reason in reasons)
+    assert all(len(values) == 0 for values in contour_features(gray, []).values())
+
+
+def test_component_features_match_the_contour_features():
+    gray = synthetic_blobs()
+    _, thresholded = cv2.threshold(gray, THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(thresholded, connectivity=8)
+    ids = np.arange(1, count)
+    from_components = component_features(gray, labels, ids, stats[ids, :4], stats[ids, cv2.CC_STAT_AREA])
+    contours = blob_contours(gray)
+    names = {labels[y, x]: name for name, (x, y) in {"sasso": (40, 40), "strada": (101, 55), "croce": (40, 140), "pozza": (150, 150)}.items()}
+    from_contours = contour_features(gray, [contours[names[label]] for label in ids])
+    # stessi pixel, stesso anello: circolarita' e solidita' invece partono da un'area diversa
+    for name in ("aspect_ratio", "mean_intensity", "std_intensity", "contrast"):
+        assert from_components[name] == pytest.approx(from_contours[name]), name
+    assert from_components["area"].tolist() == stats[ids, cv2.CC_STAT_AREA].tolist() # pixel, non area del poligono
+    _, reasons = apply_rules(from_components)
+    assert {names[label]: reason for label, reason in zip(ids, reasons)} == {"sasso": None, "strada": "aspect_ratio", "croce": "solidity", "pozza": "contrast"}
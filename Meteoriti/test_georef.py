@@ -0,0 +1,63 @@
+# Coded by Pietro Squilla
+# Test della georeferenziazione: scala a terra, rotazione con la direzione di volo e quote mancanti
+
+import numpy as np
+import pytest
+from georef import EARTH_RADIUS, candidate_points, georef_issue, ground_sample_distance, pixel_to_world
+
+WIDTH, HEIGHT = 4000, 3000
+GPS = {"lat": 45.0, "lng": 9.0, "relative_altitude": 100.0, "focal_length_35mm": 24}
+
+
+def offset_m(lat, lng, gps=GPS):
+    # spostamento (est, nord) in metri dal punto di ripresa
+    north = np.radians(lat - gps["lat"]) * EARTH_RADIUS
+    east = np.radians(lng - gps["lng"]) * EARTH_RADIUS * np.cos(np.radians(gps["lat"]))
+    return east, north
+
+
+def test_ground_sample_distance_from_35mm_focal_length():
+    gsd = ground_sample_distance(GPS, WIDTH, HEIGHT)
+    # diagonale a terra = quota * diagonale 35 mm / focale equivalente
+    assert gsd * np.hypot(WIDTH, HEIGHT) == pytest.approx(100.0 * 43.27 / 24)
+    assert ground_sample_distance(dict(GPS, focal_length_35mm=None), WIDTH, HEIGHT) is None
+
+
+@pytest.mark.parametrize("direction, east, north", [
+    (0.0, 0.0, 1.0), # alto dell'immagine verso nord
+    (90.0, 1.0, 0.0), # verso est
+    (180.0, 0.0, -1.0),
+    (270.0, -1.0, 0.0),
+    (45.0, np.sqrt(0.5), np.sqrt(0.5)),
+])
+def test_heading_rotates_the_image_axes(direction, east, north):
+    gps = dict(GPS, direction=direction)
+    gsd = ground_sample_distance(gps, WIDTH, HEIGHT)
+    # punto 1000 pixel sopra il centro e punto 1000 pixel a destra
+    lat, lng, _ = pixel_to_world(gps, [[WIDTH / 2, HEIGHT / 2 - 1000], [WIDTH / 2 + 1000, HEIGHT / 2]], WIDTH, HEIGHT)
+    up = np.array(offset_m(lat[0], lng[0])) / (1000 * gsd)
+    right = np.array(offset_m(lat[1], lng[1])) / (1000 * gsd)
+    assert up == pytest.approx([east, north], abs=1e-6)
+    # il lato destro e' l'alto ruotato di 90 gradi in senso orario
+    assert right == pytest.approx([north, -east], abs=1e-6)
+
+
+def test_sea_level_altitude_needs_a_configured_ground_elevation():
+    gps = {key: value for key, value in GPS.items() if key != "relative_altitude"}
+    gps["altitude"] = 350.0
+    record = {"gps_data": gps, "boxes": [[100, 100, 20, 20]], "image_size": [WIDTH, HEIGHT]}
+    assert candidate_points("foto.jpg", record) == []
+    assert "GROUND_ALTITUDE_M" in georef_issue(gps)
+    assert georef_issue(gps, ground_altitude=250.0) is None
+    assert ground_sample_distance(gps, WIDTH, HEIGHT, ground_altitude=250.0) == pytest.approx(ground_sample_distance(GPS, WIDTH, HEIGHT))
+
+
+def test_candidate_points_at_box_centers():
+    record = {"gps_data": GPS, "boxes": [[1990, 1490, 20, 20], [0, 0, 10, 10]], "image_size": [WIDTH, HEIGHT],
+              "crop_paths": ["crop/a.jpg", "crop/b.jpg"], "features": [{"contrast": 80.0}, {"contrast": 20.0}]}
+    points = candidate_points("foto.jpg", record)
+    assert [(point["lat"], point["lng"]) for point in points][0] == (45.0, 9.0)
+    assert points[0]["center_offset"] == 0.0 and points[1]["center_offset"] > 0.99
+    assert [point["crop_path"] for point in points] == ["crop/a.jpg", "crop/b.jpg"]
+    assert points[0]["width_m"] == pytest.approx(20 * ground_sample_distance(GPS, WIDTH, HEIGHT), abs=1e-3)
+    assert georef_issue(None) == "GPS assente"
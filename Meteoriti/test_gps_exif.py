@@ -0,0 +1,71 @@
+# Coded by Pietro Squilla
+# Test del lettore GPS: JPEG con EXIF e XMP DJI, TIFF con gli IFD dopo i pixel
+
+import io
+import struct
+import numpy as np
+import pytest
+from PIL import Image
+from gps_exif import read_gps, HEADER_READ_SIZE
+
+XMP = b'<x:xmpmeta><rdf:Description drone-dji:RelativeAltitude="+61.20"/></x:xmpmeta>'
+
+
+def jpeg_with_gps():
+    exif = Image.Exif()
+    exif[0x8825] = {1: "S", 2: (45.0, 30.0, 0.0), 3: "E", 4: (9.0, 15.0, 36.0), 5: b"\x00", 6: 152.5, 17: 270.0}
+    exif.get_ifd(0x8769)[0xA405] = 24
+    buffer = io.BytesIO()
+    Image.fromarray(np.zeros((16, 16, 3), dtype=np.uint8)).save(buffer, "JPEG", exif=exif, xmp=XMP)
+    return buffer.getvalue()
+
+
+def test_jpeg_gps_focal_length_and_relative_altitude(tmp_path):
+    data = jpeg_with_gps()
+    path = tmp_path / "foto.jpg"
+    path.write_bytes(data)
+    for source in (str(path), data):
+        gps = read_gps(source)
+        assert gps["lat"] == pytest.approx(-45.5)
+        assert gps["lng"] == pytest.approx(9.26)
+        assert gps["altitude"] == pytest.approx(152.5)
+        assert gps["direction"] == pytest.approx(270.0)
+        assert gps["focal_length_35mm"] == 24
+        assert gps["relative_altitude"] == pytest.approx(61.2)
+
+
+def test_missing_gps_gives_none(tmp_path):
+    buffer = io.BytesIO()
+    Image.fromarray(np.zeros((8, 8, 3), dtype=np.uint8)).save(buffer, "JPEG")
+    assert read_gps(buffer.getvalue()) is None
+    assert read_gps(b"non e' un'immagine") is None
+
+
+def entry(tag, kind, count, value):
+    return struct.pack("<HHI", tag, kind, count) + value
+
+
+def tiff_with_ifds_after_pixels(pixel_bytes):
+    # header, pixel, GPS IFD, IFD0 con XMP: gli IFD stanno oltre HEADER_READ_SIZE come negli ortomosaici
+    gps_at = 8 + pixel_bytes
+    values_at = gps_at + 2 + 12 * 4 + 4
+    gps = struct.pack("<H", 4)
+    gps += entry(1, 2, 2, b"N\x00\x00\x00") + entry(2, 5, 3, struct.pack("<I", values_at))
+    gps += entry(3, 2, 2, b"W\x00\x00\x00") + entry(4, 5, 3, struct.pack("<I", values_at + 24)) + struct.pack("<I", 0)
+    gps += struct.pack("<6I", 45, 1, 30, 1, 0, 1) + struct.pack("<6I", 9, 1, 15, 1, 36, 1)
+    ifd0_at = gps_at + len(gps)
+    xmp_at = ifd0_at + 2 + 12 * 2 + 4
+    ifd0 = struct.pack("<H", 2) + entry(700, 1, len(XMP), struct.pack("<I", xmp_at)) + entry(0x8825, 4, 1, struct.pack("<I", gps_at))
+    ifd0 += struct.pack("<I", 0) + XMP
+    return b"II*\x00" + struct.pack("<I", ifd0_at) + b"\x00" * pixel_bytes + gps + ifd0
+
+
+def test_tiff_follows_ifd_offsets_past_the_header(tmp_path):
+    data = tiff_with_ifds_after_pixels(2 * HEADER_READ_SIZE)
+    path = tmp_path / "ortomosaico.tif"
+    path.write_bytes(data)
+    expected = {"lat": 45.5, "lng": -9.26, "relative_altitude": 61.2}
+    for source in (str(path), data):
+        gps = read_gps(source)
+        assert gps.keys() == expected.keys()
+        assert all(gps[key] == pytest.approx(value) for key, value in expected.items())
@@ -0,0 +1,45 @@
+# Coded by Pietro Squilla
+# Test di iter_directory: un'immagine illeggibile diventa un record di errore, il resto del lotto prosegue
+
+import cv2
+import numpy as np
+import pytest
+import Meteor
+from result_index import ResultIndex
+from run_metrics import RunMetrics
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Meteor, "THUMBNAIL_DIR", None)
+    monkeypatch.setattr(Meteor, "CROP_STORE", "memory")
+    directory = tmp_path / "foto"
+    directory.mkdir()
+    image = np.full((200, 200, 3), 230, dtype=np.uint8)
+    cv2.circle(image, (100, 100), 20, (0, 0, 0), -1)
+    for name in ("a.jpg", "c.jpg"):
+        cv2.imwrite(str(directory / name), image)
+    (directory / "b.jpg").write_bytes(b"non e' una foto")
+    return directory
+
+
+def test_unreadable_image_yields_an_error_record(image_dir):
+    metrics = RunMetrics("test")
+    results = dict(Meteor.iter_directory(str(image_dir), workers=1, chunksize=3, metrics=metrics))
+    assert list(results) == ["a.jpg", "b.jpg", "c.jpg"]
+    assert "Impossibile leggere" in results["b.jpg"]["error"]
+    assert results["b.jpg"]["boxes"] == [] and results["b.jpg"]["black_percentage"] == 0
+    assert len(results["a.jpg"]["boxes"]) == len(results["c.jpg"]["boxes"]) == 1
+    assert metrics.counters["immagini_elaborate"] == 2
+    assert metrics.counters["errori_immagini"] == 1
+    metrics.close()
+
+
+def test_failed_images_are_not_stored_in_the_index(image_dir, tmp_path):
+    index = ResultIndex(str(tmp_path / "indice.sqlite"), {"prova": 1})
+    list(Meteor.iter_directory(str(image_dir), workers=1, index=index))
+    index.close()
+    index = ResultIndex(str(tmp_path / "indice.sqlite"), {"prova": 1})
+    assert index.lookup(str(image_dir / "a.jpg")) is not None
+    assert index.lookup(str(image_dir / "b.jpg")) is None
+    index.close()
@@ -0,0 +1,43 @@
+# Coded by Pietro Squilla
+# Test delle anteprime: dimensioni della piramide, riuso dalla cache e anteprime a finestre degli ortomosaici
+
+import os
+import cv2
+import numpy as np
+from thumbnails import make_thumbnails, make_thumbnails_windowed
+from tiled import ArrayReader
+
+
+def photo(height, width):
+    # gradiente con qualche dettaglio, perche' la riduzione abbia qualcosa da mediare
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.stack([x * 255 // width, y * 255 // height, (x + y) % 256], axis=-1).astype(np.uint8)
+    cv2.circle(image, (width // 3, height // 2), min(height, width) // 5, (0, 0, 0), -1)
+    return image
+
+
+def test_pyramid_sizes_and_no_upscaling(tmp_path):
+    paths = make_thumbnails(photo(900, 1200), "ab12", sizes=(800, 256), directory=str(tmp_path))
+    assert cv2.imread(paths[800]).shape == (600, 800, 3)
+    assert cv2.imread(paths[256]).shape == (192, 256, 3)
+    assert os.path.dirname(paths[800]) == str(tmp_path / "ab")
+    small = make_thumbnails(photo(150, 200), "cd34", sizes=(800, 256), directory=str(tmp_path))
+    assert cv2.imread(small[800]).shape == (150, 200, 3) # mai ingrandite
+    assert cv2.imread(small[256]).shape == (150, 200, 3)
+
+
+def test_existing_thumbnails_are_not_rewritten(tmp_path):
+    paths = make_thumbnails(photo(300, 400), "ab12", sizes=(256,), directory=str(tmp_path))
+    os.utime(paths[256], (0, 0))
+    assert make_thumbnails(photo(300, 400), "ab12", sizes=(256,), directory=str(tmp_path)) == paths
+    assert os.path.getmtime(paths[256]) == 0
+
+
+def test_windowed_thumbnail_matches_the_whole_image(tmp_path):
+    image = photo(700, 1000)
+    whole = make_thumbnails(image, "intera", sizes=(300,), fmt="png", directory=str(tmp_path))
+    windowed = make_thumbnails_windowed(ArrayReader(image), "finestre", sizes=(300,), fmt="png", directory=str(tmp_path), tile_size=256)
+    expected, found = cv2.imread(whole[300]), cv2.imread(windowed[300])
+    assert found.shape == expected.shape == (210, 300, 3)
+    # differenze solo lungo le cuciture tra finestre, dove la media dei pixel cambia di poco
+    assert np.abs(found.astype(int) - expected.astype(int)).mean() < 2
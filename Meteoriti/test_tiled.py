@@ -0,0 +1,132 @@
+# Coded by Pietro Squilla
+# Test del rilevamento a finestre: stessi riquadri dell'immagine intera e lettura a finestre dei TIFF
+
+import struct
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+import tiled
+from tiled import ArrayReader, TiledArrayReader, detect_black_tiled, open_windowed
+
+
+def whole_image_boxes(image, threshold, min_area):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, thresholded = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(thresholded, connectivity=8)
+    boxes = sorted(tuple(int(value) for value in row[:4]) for row in stats[1:] if row[4] > min_area)
+    return stats[1:, cv2.CC_STAT_AREA].sum() / float(gray.size), boxes
+
+
+def synthetic_image(seed):
+    # ellissi nere di ogni dimensione (molte attraversano i bordi delle finestre) e rumore di singoli pixel
+    rng = np.random.default_rng(seed)
+    height, width = rng.integers(60, 260, 2)
+    image = np.full((height, width, 3), 230, dtype=np.uint8)
+    for _ in range(rng.integers(5, 40)):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(1, 40)), int(rng.integers(1, 10)))
+        cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, (0, 0, 0), -1)
+    image[rng.random((height, width)) < 0.01] = 0
+    return image
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("tile_size", [7, 16, 50])
+def test_stitching_across_windows_matches_the_whole_image(seed, tile_size):
+    image = synthetic_image(seed)
+    for min_area in (0, 5, 60):
+        black, boxes = detect_black_tiled(ArrayReader(image), 50, min_area, tile_size)
+        expected_black, expected_boxes = whole_image_boxes(image, 50, min_area)
+        assert black == pytest.approx(expected_black)
+        assert sorted(boxes) == expected_boxes
+
+
+def test_diagonal_contact_across_a_window_corner():
+    image = np.full((20, 20, 3), 255, dtype=np.uint8)
+    image[8:10, 8:10] = 0
+    image[10:12, 10:12] = 0 # tocca il quadrato precedente solo nell'angolo, tra quattro finestre
+    assert detect_black_tiled(ArrayReader(image), 50, 0, 10)[1] == [(8, 8, 4, 4)]
+
+
+def test_npy_mosaic_is_read_in_windows(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (70, 90, 3), dtype=np.uint8)
+    path = str(tmp_path / "mosaico.npy")
+    np.save(path, image)
+    reader = open_windowed(path)
+    assert isinstance(reader.array, np.memmap)
+    assert np.array_equal(reader.read(5, 60, 10, 80), image[5:60, 10:80])
+
+
+def test_closed_components_leave_the_union_find():
+    image = np.full((64, 64, 3), 255, dtype=np.uint8)
+    image[::4, ::4] = 0 # rumore su tutta l'immagine, anche sui bordi delle finestre
+    components = []
+    original = tiled._Components
+
+    def spy(min_area):
+        components.append(original(min_area))
+        return components[-1]
+
+    tiled._Components = spy
+    try:
+        detect_black_tiled(ArrayReader(image), 50, 3, 8)
+    finally:
+        tiled._Components = original
+    assert components[0].parent == {} and components[0].boxes == []
+
+
+def test_strip_tiff_is_memory_mapped(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (70, 90, 3), dtype=np.uint8)
+    path = str(tmp_path / "strisce.tif")
+    Image.fromarray(image[..., ::-1]).save(path)
+    reader = open_windowed(path)
+    assert isinstance(reader.array, np.memmap)
+    assert np.array_equal(reader.read(5, 60, 10, 80), image[5:60, 10:80])
+
+
+def write_tiled_tiff(path, rgb, tile_width, tile_height):
+    # TIFF a tasselli non compresso scritto a mano (Pillow salva solo a strisce)
+    height, width, samples = rgb.shape
+    down, across = -(-height // tile_height), -(-width // tile_width)
+    tiles = np.zeros((down, across, tile_height, tile_width, samples), dtype=np.uint8)
+    for ty in range(down):
+        for tx in range(across):
+            part = rgb[ty * tile_height:(ty + 1) * tile_height, tx * tile_width:(tx + 1) * tile_width]
+            tiles[ty, tx, :part.shape[0], :part.shape[1]] = part
+    count = down * across
+    tile_bytes = tile_width * tile_height * samples
+    entries = [(256, width), (257, height), (258, 8), (259, 1), (262, 2), (277, samples), (284, 1), (322, tile_width), (323, tile_height)]
+    ifd_size = 2 + 12 * (len(entries) + 2) + 4
+    offsets_at = 8 + ifd_size
+    data_at = offsets_at + 8 * count
+    ifd = struct.pack("<H", len(entries) + 2)
+    ifd += b"".join(struct.pack("<HHIHH", tag, 3, 1, value, 0) for tag, value in entries)
+    ifd += struct.pack("<HHII", 324, 4, count, offsets_at) + struct.pack("<HHII", 325, 4, count, offsets_at + 4 * count) + struct.pack("<I", 0)
+    arrays = struct.pack(f"<{count}I", *(data_at + i * tile_bytes for i in range(count))) + struct.pack(f"<{count}I", *[tile_bytes] * count)
+    with open(path, "wb") as f:
+        f.write(b"II*\x00" + struct.pack("<I", 8) + ifd + arrays + tiles.tobytes())
+
+
+def test_tiled_tiff_reads_only_the_touched_tiles(tmp_path):
+    image = np.random.default_rng(1).integers(0, 256, (70, 90, 3), dtype=np.uint8)
+    path = str(tmp_path / "tasselli.tif")
+    write_tiled_tiff(path, image[..., ::-1], 32, 16)
+    reader = open_windowed(path)
+    assert isinstance(reader, TiledArrayReader)
+    assert np.array_equal(reader.read(0, 70, 0, 90), image)
+    assert np.array_equal(reader.read(15, 33, 31, 65), image[15:33, 31:65])
+
+
+def test_large_compressed_image_is_refused_and_unreadable_file_raises(tmp_path, monkeypatch):
+    path = str(tmp_path / "compresso.tif")
+    Image.fromarray(np.zeros((40, 50, 3), dtype=np.uint8)).save(path, compression="tiff_deflate")
+    assert open_windowed(path).read(0, 40, 0, 50).shape == (40, 50, 3)
+    monkeypatch.setattr(tiled, "FULL_READ_MAX_PIXELS", 1000)
+    with pytest.raises(ValueError, match="limite di lettura completa"):
+        open_windowed(path)
+
+    broken = tmp_path / "rotto.jpg"
+    broken.write_bytes(b"non e' una foto")
+    with pytest.raises(ValueError, match="Impossibile leggere"):
+        open_windowed(str(broken))
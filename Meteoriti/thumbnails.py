@@ -0,0 +1,73 @@
+# Coded by Pietro Squilla
+# Anteprime ridotte (piramide di dimensioni) delle foto aeree per il report, in cache per hash del sorgente
+
+import os
+import cv2
+import numpy as np
+
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_SIZES = (800,) # lato lungo in pixel; 800 = larghezza massima delle immagini nel report
+THUMBNAIL_FORMAT = "webp" # "webp" oppure "jpg"
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_path(content_hash, size, fmt=THUMBNAIL_FORMAT, directory=THUMBNAIL_DIR):
+    return os.path.join(directory, content_hash[:2], f"{content_hash}_{size}.{fmt}")
+
+
+def encode_params(fmt, quality):
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+
+def scaled_shape(height, width, size):
+    scale = min(1.0, size / max(height, width))
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+def write_thumbnail(path, image, fmt, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.{fmt}"
+    cv2.imwrite(tmp_path, image, encode_params(fmt, quality))
+    os.replace(tmp_path, path)
+
+
+def make_thumbnails(image, content_hash, sizes=THUMBNAIL_SIZES, fmt=THUMBNAIL_FORMAT, directory=THUMBNAIL_DIR, quality=THUMBNAIL_QUALITY):
+    # image: immagine BGR gia' decodificata; ogni livello si ricava dal precedente (piu' grande);
+    # restituisce {dimensione: percorso}, le anteprime gia' presenti non vengono rigenerate
+    paths = {}
+    level = image
+    for size in sorted(sizes, reverse=True):
+        path = thumbnail_path(content_hash, size, fmt, directory)
+        paths[size] = path
+        if os.path.exists(path):
+            continue
+        height, width = scaled_shape(level.shape[0], level.shape[1], size)
+        if (height, width) != level.shape[:2]:
+            level = cv2.resize(level, (width, height), interpolation=cv2.INTER_AREA)
+        write_thumbnail(path, level, fmt, quality)
+    return paths
+
+
+def make_thumbnails_windowed(reader, content_hash, sizes=THUMBNAIL_SIZES, fmt=THUMBNAIL_FORMAT, directory=THUMBNAIL_DIR, quality=THUMBNAIL_QUALITY, tile_size=4096):
+    # come make_thumbnails per ortomosaici letti a finestre (tiled.open_windowed):
+    # ogni finestra viene ridotta e incollata nell'anteprima piu' grande, senza caricare l'originale
+    paths = {size: thumbnail_path(content_hash, size, fmt, directory) for size in sizes}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    largest = max(sizes)
+    height, width = scaled_shape(reader.height, reader.width, largest)
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    scale_y = height / reader.height
+    scale_x = width / reader.width
+    for y0 in range(0, reader.height, tile_size):
+        y1 = min(y0 + tile_size, reader.height)
+        for x0 in range(0, reader.width, tile_size):
+            x1 = min(x0 + tile_size, reader.width)
+            top, bottom = round(y0 * scale_y), round(y1 * scale_y)
+            left, right = round(x0 * scale_x), round(x1 * scale_x)
+            if bottom > top and right > left:
+                canvas[top:bottom, left:right] = cv2.resize(reader.read(y0, y1, x0, x1), (right - left, bottom - top), interpolation=cv2.INTER_AREA)
+    return make_thumbnails(canvas, content_hash, sizes, fmt, directory, quality)
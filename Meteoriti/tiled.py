@@ -0,0 +1,288 @@
+# Coded by Pietro Squilla
+# Rilevamento dei corpi scuri a finestre su ortomosaici molto grandi, con memoria limitata
+
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+# lettori a finestre opzionali per i formati compressi (i TIFF non compressi si leggono a finestre comunque)
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+TILE_SIZE = 4096 # lato delle finestre in pixel
+FULL_READ_MAX_PIXELS = 1 << 28 # formati senza lettura a finestre (JPEG, PNG, TIFF compressi senza rasterio) decodificati interi fino a ~268 Mpx
+Image.MAX_IMAGE_PIXELS = None # ortomosaici: dimensioni volute, niente controllo "decompression bomb" di Pillow
+
+
+def to_bgr(window, rgb=False):
+    # finestra in BGR a 3 canali come cv2.imread (grigio, RGB o con canale alfa)
+    if window.ndim == 2 or window.shape[2] == 1:
+        return cv2.cvtColor(window.reshape(window.shape[:2]), cv2.COLOR_GRAY2BGR)
+    if rgb:
+        return np.ascontiguousarray(window[..., 2::-1])
+    return np.ascontiguousarray(window[..., :3])
+
+
+class ArrayReader:
+    # immagine gia' in memoria o memory-mapped (.npy, TIFF non compressi); rgb se i canali sono in ordine RGB
+    def __init__(self, array, rgb=False):
+        self.array = array
+        self.rgb = rgb
+        self.height, self.width = array.shape[:2]
+
+    def read(self, y0, y1, x0, x1):
+        return to_bgr(np.asarray(self.array[y0:y1, x0:x1]), self.rgb)
+
+    def close(self):
+        pass
+
+
+class TiledArrayReader:
+    # TIFF a tasselli memory-mapped: array (righe di tasselli, colonne di tasselli, alto, largo, canali);
+    # una finestra copia solo le parti dei tasselli che tocca
+    def __init__(self, tiles, width, height, rgb=False):
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.rgb = rgb
+
+    def read(self, y0, y1, x0, x1):
+        tile_h, tile_w = self.tiles.shape[2:4]
+        window = np.empty((y1 - y0, x1 - x0, self.tiles.shape[4]), dtype=self.tiles.dtype)
+        for ty in range(y0 // tile_h, (y1 - 1) // tile_h + 1):
+            for tx in range(x0 // tile_w, (x1 - 1) // tile_w + 1):
+                top, bottom = max(y0, ty * tile_h), min(y1, (ty + 1) * tile_h)
+                left, right = max(x0, tx * tile_w), min(x1, (tx + 1) * tile_w)
+                window[top - y0:bottom - y0, left - x0:right - x0] = self.tiles[ty, tx, top - ty * tile_h:bottom - ty * tile_h, left - tx * tile_w:right - tx * tile_w]
+        return to_bgr(window, self.rgb)
+
+    def close(self):
+        pass
+
+
+class RasterioReader:
+    # letture a finestre tramite GDAL (GeoTIFF, JPEG2000, ...), restituisce BGR come cv2
+    def __init__(self, path):
+        self.dataset = rasterio.open(path)
+        self.height, self.width = self.dataset.height, self.dataset.width
+
+    def read(self, y0, y1, x0, x1):
+        bands = min(3, self.dataset.count)
+        data = self.dataset.read(list(range(1, bands + 1)), window=Window(x0, y0, x1 - x0, y1 - y0))
+        data = np.moveaxis(data, 0, -1)
+        if bands == 1:
+            return cv2.cvtColor(data[..., 0], cv2.COLOR_GRAY2BGR)
+        return np.ascontiguousarray(data[..., ::-1]) # RGB -> BGR
+
+    def close(self):
+        self.dataset.close()
+
+
+def raw_tiff_reader(image_path):
+    # TIFF non compresso a 8 bit (strisce o tasselli contigui, campioni interlacciati) mappato con
+    # np.memmap dagli offset letti da Pillow: nessuna decodifica, si leggono solo i byte delle finestre;
+    # None se il file ha una struttura diversa
+    with Image.open(image_path) as image:
+        tags = image.tag_v2
+        width, height = image.size
+        samples = tags.get(277, 1)
+        bits = np.atleast_1d(tags.get(258, 1))
+        photometric = tags.get(262)
+        if tags.get(259, 1) != 1 or tags.get(284, 1) != 1 or np.any(bits != 8) or photometric not in (1, 2) or samples not in (1, 3, 4):
+            return None
+        rgb = photometric == 2
+        if 273 in tags:
+            # strisce: contigue formano un unico array (altezza, larghezza, canali)
+            offsets = np.atleast_1d(tags[273]).astype(np.int64)
+            counts = np.atleast_1d(tags[279]).astype(np.int64)
+            if np.any(offsets[1:] != offsets[:-1] + counts[:-1]) or counts.sum() < height * width * samples:
+                return None
+            array = np.memmap(image_path, dtype=np.uint8, mode="r", offset=int(offsets[0]), shape=(height, width, samples))
+            return ArrayReader(array, rgb)
+        if 324 in tags:
+            # tasselli: contigui e in ordine di riga
+            tile_w, tile_h = tags[322], tags[323]
+            offsets = np.atleast_1d(tags[324]).astype(np.int64)
+            tile_bytes = tile_w * tile_h * samples
+            if np.any(offsets != offsets[0] + np.arange(len(offsets)) * tile_bytes):
+                return None
+            down, across = -(-height // tile_h), -(-width // tile_w)
+            tiles = np.memmap(image_path, dtype=np.uint8, mode="r", offset=int(offsets[0]), shape=(down, across, tile_h, tile_w, samples))
+            return TiledArrayReader(tiles, width, height, rgb)
+    return None
+
+
+def open_windowed(image_path):
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext == ".npy":
+        # array BGR salvato con np.save
+        return ArrayReader(np.load(image_path, mmap_mode="r"))
+    if ext in (".tif", ".tiff"):
+        reader = raw_tiff_reader(image_path)
+        if reader is not None:
+            return reader
+        if tifffile is not None:
+            try:
+                return ArrayReader(tifffile.memmap(image_path, mode="r"), rgb=True)
+            except ValueError:
+                pass # TIFF compresso: non mappabile
+    if rasterio is not None:
+        try:
+            return RasterioReader(image_path)
+        except rasterio.errors.RasterioIOError:
+            pass
+    # ripiego: decodifica completa, solo entro FULL_READ_MAX_PIXELS
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+    except (OSError, SyntaxError):
+        width = height = 0 # formato sconosciuto a Pillow: decide cv2
+    if width * height > FULL_READ_MAX_PIXELS:
+        raise ValueError(f"{image_path}: {width}x{height} pixel, oltre il limite di lettura completa ({FULL_READ_MAX_PIXELS} pixel); "
+                         "servono un TIFF non compresso (a strisce o a tasselli), un .npy oppure rasterio per i formati compressi")
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Impossibile leggere l'immagine {image_path}")
+    return ArrayReader(image)
+
+
+class _Components:
+    # union-find delle componenti che toccano i bordi delle finestre, le uniche che una cucitura
+    # puo' ancora unire; le componenti che la scansione ha superato vengono chiuse (riquadro se
+    # superano min_area) e rimosse, cosi' la memoria dipende dalle finestre e non dall'immagine
+    def __init__(self, min_area):
+        self.min_area = min_area
+        self.parent = {}
+        self.area = {} # solo radici
+        self.box = {} # solo radici: x0, y0, x1, y1 (estremi esclusi)
+        self.next_label = 0
+        self.boxes = [] # riquadri x, y, w, h delle componenti chiuse sopra min_area
+
+    def add(self, stats, x_offset, y_offset):
+        # etichette globali per le righe di stats (x, y, w, h, area)
+        labels = np.arange(self.next_label, self.next_label + len(stats))
+        for label, (x, y, w, h, area) in zip(labels.tolist(), stats.tolist()):
+            self.parent[label] = label
+            self.area[label] = area
+            self.box[label] = (x + x_offset, y + y_offset, x + x_offset + w, y + y_offset + h)
+        self.next_label += len(stats)
+        return labels
+
+    def emit(self, x0, y0, x1, y1, area):
+        if area > self.min_area:
+            self.boxes.append((x0, y0, x1 - x0, y1 - y0))
+
+    def find(self, label):
+        root = label
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[label] != root:
+            self.parent[label], label = root, self.parent[label]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.area[a] < self.area[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.area[a] += self.area.pop(b)
+        box_a, box_b = self.box[a], self.box.pop(b)
+        self.box[a] = (min(box_a[0], box_b[0]), min(box_a[1], box_b[1]), max(box_a[2], box_b[2]), max(box_a[3], box_b[3]))
+
+    def close(self, open_edges):
+        # chiude le componenti senza pixel sui bordi ancora da cucire (open_edges: array di etichette, -1 = sfondo)
+        labels = np.unique(np.concatenate(open_edges)) if open_edges else np.zeros(0, dtype=np.int64)
+        live = {self.find(label) for label in labels[labels >= 0].tolist()}
+        closed = [label for label in self.parent if self.find(label) not in live]
+        for label in closed:
+            if self.parent[label] == label:
+                self.emit(*self.box.pop(label), self.area.pop(label))
+        for label in closed:
+            del self.parent[label]
+
+
+def _stitch(components, edge_a, edge_b):
+    # unisce le etichette adiacenti (8-connessione) ai due lati di una cucitura
+    for shift in (-1, 0, 1):
+        if shift < 0:
+            a, b = edge_a[-shift:], edge_b[:shift]
+        elif shift > 0:
+            a, b = edge_a[:-shift], edge_b[shift:]
+        else:
+            a, b = edge_a, edge_b
+        touching = (a >= 0) & (b >= 0)
+        if np.any(touching):
+            for label_a, label_b in np.unique(np.column_stack((a[touching], b[touching])), axis=0):
+                components.union(int(label_a), int(label_b))
+
+
+def detect_black_tiled(reader, threshold, min_area, tile_size=TILE_SIZE):
+    # restituisce (percentuale di nero, lista di riquadri x, y, w, h) leggendo una finestra alla volta;
+    # le componenti che attraversano i bordi delle finestre vengono ricucite lungo le giunzioni e
+    # chiuse appena la scansione le supera, quindi in memoria restano una finestra, le etichette dei
+    # bordi e le componenti ancora aperte
+    components = _Components(min_area)
+    black_pixels = 0
+    previous_bottom = None # etichette globali dell'ultima riga della fascia precedente
+
+    for y0 in range(0, reader.height, tile_size):
+        y1 = min(y0 + tile_size, reader.height)
+        bottom = np.full(reader.width, -1, dtype=np.int64)
+        top = np.full(reader.width, -1, dtype=np.int64)
+        previous_right = None
+
+        for x0 in range(0, reader.width, tile_size):
+            x1 = min(x0 + tile_size, reader.width)
+            gray = cv2.cvtColor(reader.read(y0, y1, x0, x1), cv2.COLOR_BGR2GRAY)
+            _, thresholded = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+            del gray
+            count, labels, stats, _ = cv2.connectedComponentsWithStats(thresholded, connectivity=8)
+            stats = stats[1:]
+            black_pixels += int(stats[:, cv2.CC_STAT_AREA].sum())
+            del thresholded
+
+            # le componenti interne alla finestra sono gia' complete: riquadro (o scarto) senza union-find
+            x, y, w, h = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+            on_border = (x == 0) | (y == 0) | (x + w == x1 - x0) | (y + h == y1 - y0)
+            for bx, by, bw, bh, area in stats[~on_border].tolist():
+                components.emit(bx + x0, by + y0, bx + x0 + bw, by + y0 + bh, area)
+
+            # etichette locali -> globali per le componenti sui bordi (lo sfondo e le interne restano -1)
+            border = np.flatnonzero(on_border)
+            mapping = np.full(count, -1, dtype=np.int64)
+            mapping[border + 1] = components.add(stats[border], x0, y0)
+            left = mapping[labels[:, 0]]
+            if previous_right is not None:
+                _stitch(components, previous_right, left)
+            previous_right = mapping[labels[:, -1]]
+            top[x0:x1] = mapping[labels[0, :]]
+            bottom[x0:x1] = mapping[labels[-1, :]]
+            del labels
+            if previous_bottom is not None:
+                # giunzione con la fascia precedente, dalla colonna prima della finestra per le diagonali
+                start = max(0, x0 - 1)
+                _stitch(components, previous_bottom[start:x1], top[start:x1])
+
+            # restano aperte le componenti sull'ultima riga della fascia, sul lato destro della finestra
+            # e quelle della fascia precedente che le prossime finestre possono ancora toccare
+            open_edges = [bottom[:x1], previous_right]
+            if previous_bottom is not None:
+                open_edges.append(previous_bottom[max(0, x1 - 1):])
+            components.close(open_edges)
+
+        previous_bottom = bottom
+
+    components.close([])
+    black_percentage = black_pixels / float(reader.width * reader.height)
+    return black_percentage, components.boxes
@@ -11,22 +11,36 @@
 import googlemaps
 import os
 import requests
-from math import log2, tan, pi
-from io import BytesIO
-from PIL import Image
+from math import pi
 import numpy as np
-from jinja2 import Template
-from functools import cmp_to_key
-from googlemaps.exceptions import ApiError
 import sys
 import time
-from jinja2 import Template
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
+from green_analysis import green_percentage_from_image, decode_image
+from fetch_pipeline import BackgroundWriter, retry_with_backoff
+from thumbnails import make_thumbnails, source_hash
+from report_writer import StreamingReport
+import run_metrics
+from run_metrics import RunMetrics, timed, count
 
 #############
 #    KEY    #
 #############
 API_KEY = "XXX" # <---------------------------------------------------------------------
 
+#################
+#    OPZIONI    #
+#################
+GREEN_INDEX = "rgb" # indice di vegetazione: "rgb" (G > R e G > B), "exg" o "vari"
+REPORT_PAGE_SIZE = 500 # righe per pagina del report
+PAGE_TOKEN_DELAY = 2 # secondi di attesa prima di chiedere la pagina successiva dei risultati
+PLACE_DELAY = 2 # secondi di attesa tra un'attività e l'altra
+MAX_RETRIES = 5 # tentativi per foto satellitare prima di scartare l'attività (attesa esponenziale)
+METRICS_FILE = "metrics.json" # tempi per fase, contatori ed ETA, riscritto ogni run_metrics.FLUSH_INTERVAL secondi (None per disattivarlo)
+METRICS_PORT = None # porta locale per le metriche in formato Prometheus su /metrics (es. 9108), None per non avviare il server
+THUMBNAIL_DIR = "thumbs" # anteprime ridotte nel report, originale al click (None per le immagini intere)
+SAVE_ORIGINALS = True # False salva solo le anteprime (nessuna foto intera su disco)
+
 ##################
 #    FUNZIONI    #
 ##################
@@ -36,33 +50,17 @@ def create_folder_if_not_exists(folder_name):
         os.makedirs(folder_name)
 
 
-def save_text_file(folder_name, file_name, content):
+def save_binary_file(folder_name, file_name, content):
     create_folder_if_not_exists(folder_name)
-    with open(os.path.join(folder_name, file_name), "w", encoding="utf-8") as text_file:
-        text_file.write(content)
+    with timed("scrittura_disco"):
+        with open(os.path.join(folder_name, file_name), "wb") as binary_file:
+            binary_file.write(content)
 
 
-def download_image(url, folder_name, file_name):
+def save_text_file(folder_name, file_name, content):
     create_folder_if_not_exists(folder_name)
-    response = requests.get(url)
-    with open(os.path.join(folder_name, file_name), "wb") as img_file:
-        img_file.write(response.content)
-
-
-def calculate_green_percentage(image_path):
-    image = Image.open(image_path).convert('RGB') # forza l'rgb a prescindere
-    image_data = np.array(image)
-    
-    green_pixel_count = 0
-    total_pixel_count = image_data.shape[0] * image_data.shape[1]
-    
-    for row in image_data:
-        for pixel in row:
-            red, green, blue = pixel[:3]
-            if green > red and green > blue:
-                green_pixel_count += 1
-    
-    return (green_pixel_count / total_pixel_count) * 100
+    with open(os.path.join(folder_name, file_name), "w", encoding="utf-8") as text_file:
+        text_file.write(content)
 
 
 def search_places(client, lat, lng, radius, keyword, num_results):
@@ -74,7 +72,8 @@ def search_places(client, lat, lng, radius, keyword, num_results):
         "type": "establishment",
     }
     
-    response = client.places_nearby(**query_params)
+    with timed("api_places_ricerca"):
+        response = client.places_nearby(**query_params)
     
     for place in response["results"]:
         result.append(place)
@@ -82,9 +81,11 @@ def search_places(client, lat, lng, radius, keyword, num_results):
             break
     
     while "next_page_token" in response and len(result) < num_results:
-        time.sleep(2) # debug
+        with timed("attesa_token"):
+            time.sleep(PAGE_TOKEN_DELAY) # il token della pagina successiva non e' subito valido
         query_params["page_token"] = response["next_page_token"]
-        response = client.places_nearby(**query_params)
+        with timed("api_places_ricerca"):
+            response = client.places_nearby(**query_params)
         for place in response["results"]:
             result.append(place)
             if len(result) >= num_results:
@@ -95,7 +96,8 @@ def search_places(client, lat, lng, radius, keyword, num_results):
 
 def get_place_details(client, place_id):
     fields = ["name", "formatted_address", "formatted_phone_number", "website", "reviews", "rating"]
-    response = client.place(place_id, fields=fields)
+    with timed("api_places_dettagli"):
+        response = client.place(place_id, fields=fields)
     return response["result"]
 
 
@@ -108,20 +110,30 @@ def find_keyword_in_reviews(reviews, keyword):
     return count
 
 
-def download_satellite_image(client, lat, lng, zoom_level, folder_name, file_name):
+def fetch_image_bytes(url):
+    with timed("api_static_maps"):
+        response = requests.get(url)
+    response.raise_for_status() # una pagina di errore non e' una foto
+    count("byte_scaricati", len(response.content))
+    return response.content
+
+
+def fetch_satellite_image(client, lat, lng, zoom_level):
+    # byte della foto, analizzati dalla memoria senza passare dal disco
     scale = 2
     size = "640x640"
     map_type = "satellite"
-    url = f"https://maps.googleapis.com/maps/api/staticmap?center={lat},{lng}&zoom={zoom_level}&scale={scale}&size={size}&maptype={map_type}&key={client.key}"
-    download_image(url, folder_name, file_name)
+    url = f"{client.base_url}/maps/api/staticmap?center={lat},{lng}&zoom={zoom_level}&scale={scale}&size={size}&maptype={map_type}&key={client.key}"
+    return retry_with_backoff(fetch_image_bytes, url, retries=MAX_RETRIES)
 
 
-def generate_html_report(places_data, output_file):
-    html_template = Template("""
+# template (pagine del report in streaming)
+REPORT_PAGE_HEAD = """
         <!DOCTYPE html>
         <html>
         <head>
-            <title>Report</title>
+            <meta charset="utf-8">
+            <title>{{ title }} - pagina {{ page }}</title>
             <style>
                 table {
                     width: 100%;
@@ -140,7 +152,8 @@ def generate_html_report(places_data, output_file):
             <script src="https://cdnjs.cloudflare.com/ajax/libs/xlsx/0.17.0/xlsx.full.min.js"></script>
         </head>
         <body>
-            <h1>Report</h1>
+            <h1>{{ title }} - pagina {{ page }}</h1>
+            <p><a href="{{ index_file }}">Indice</a></p>
             <table>
                 <thead>
                     <tr>
@@ -155,24 +168,30 @@ def generate_html_report(places_data, output_file):
                     </tr>
                 </thead>
                 <tbody>
-                    {% for place_data in places_data %}
+"""
+
+REPORT_ROW = """
                     <tr>
-                        <td><input type="checkbox" class="select-place" data-index="{{ loop.index0 }}"></td>
-                        <td>{{ place_data["name"] }}</td>
-                        <td>{{ place_data["address"] }}</td>
-                        <td>{{ place_data["phone"] }}</td>
-                        <td>{{ place_data["rating"] }}</td>
-                        <td>{{ place_data["green_percentage"] }}%</td>
-                        <td>{{ place_data["keyword_count"] }}</td>
-                        <td><img src="{{ place_data["image_path"] }}" width="300"></td>
+                        <td><input type="checkbox" class="select-place" data-index="{{ index }}" data-place='{{ row|tojson }}'></td>
+                        <td>{{ row["name"] }}</td>
+                        <td>{{ row["address"] }}</td>
+                        <td>{{ row["phone"] }}</td>
+                        <td>{{ row["rating"] }}</td>
+                        <td>{{ row["green_percentage"] }}%</td>
+                        <td>{{ row["keyword_count"] }}</td>
+                        <td><a href="{{ row["image_path"] }}" target="_blank"><img src="{{ row["thumbnail_path"] | default(row["image_path"]) }}" width="300" loading="lazy"></a></td>
                     </tr>
-                    {% endfor %}
+"""
+
+REPORT_PAGE_TAIL = """
                 </tbody>
             </table>
+            <p>
+                {% if prev_page %}<a href="{{ prev_page }}">&laquo; Pagina precedente</a>{% endif %}
+                {% if next_page %}<a href="{{ next_page }}">Pagina successiva &raquo;</a>{% endif %}
+            </p>
             <button id="save-to-excel">Save to Excel</button>
             <script>
-                const placesData = {{ places_data|tojson }};
-                
                 function s2ab(s) {
                     const buf = new ArrayBuffer(s.length);
                     const view = new Uint8Array(buf);
@@ -181,8 +200,8 @@ def generate_html_report(places_data, output_file):
                 }
                 
                 document.getElementById("save-to-excel").addEventListener("click", function() {
-                    const selectedIndices = Array.from(document.querySelectorAll(".select-place:checked")).map(input => parseInt(input.dataset.index));
-                    const selectedData = selectedIndices.map(index => placesData[index]);
+                    // i dati di ogni riga sono sulla sua checkbox: niente copia dell'intero dataset nella pagina
+                    const selectedData = Array.from(document.querySelectorAll(".select-place:checked")).map(input => JSON.parse(input.dataset.place));
                     
                     const wb = XLSX.utils.book_new();
                     const ws = XLSX.utils.json_to_sheet(selectedData);
@@ -199,51 +218,20 @@ def generate_html_report(places_data, output_file):
             </script>
         </body>
         </html>
-    """)
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_template.render(places_data=places_data))
+"""
 
 
-##############
-#    MAIN    #
-##############
+def open_html_report(output_file):
+    return StreamingReport(output_file, "Report", REPORT_PAGE_HEAD, REPORT_ROW, REPORT_PAGE_TAIL, REPORT_PAGE_SIZE)
 
-# autenticazione
-client = googlemaps.Client(key=API_KEY)
-
-# input (parametri di esempio)
-num_results = 1000
-latitude, longitude = input("Lat, Lng: ").split(", ")
-latitude = float(latitude)
-longitude = float(longitude)
-radius = float(input("Raggio ricerca (km): "))
-keyword = input("Tipo attività: ")
-review_keyword = input("Keyword recensioni: ")
-meters_per_centimeter = float(input("Metri corrispondenti a 1 cm sulla foto satellitare: ")) 
-
-# calcolo del zoom_level in base alla necessitù
-print("Calcolo del livello di zoom...")
-zoom_level = int(np.log2(156543.03392 * np.cos(latitude * pi / 180) / (meters_per_centimeter / 100)))
-
-# ricerca dei luoghi
-print("Ricerca luoghi...")
-places = search_places(client, latitude, longitude, radius, keyword, num_results)
-
-# analizza i luoghi trovati
-print("Analisi luoghi...")
-places_data = []
-i = 1
-n = len(places)
-for place in places:
-    # printo la progressione dell'analisi
-    messaggio = (f"  {i} di {n}")
-    sys.stdout.write("\r" + messaggio)
-    sys.stdout.flush()
-    i = i + 1
-    
-    time.sleep(2) # debug
-    
+
+def report_sort_key(place_data):
+    # ordinamento dei risultati per percentuale di verde e recensioni trovate
+    return (-place_data["green_percentage"], -place_data["keyword_count"])
+
+
+def analyze_place(client, place, zoom_level, review_keyword, writer):
+    # dettagli, foto satellitare e verde di una attività
     place_data = {}
     place_id = place["place_id"]
     place_details = get_place_details(client, place_id)
@@ -256,29 +244,115 @@ for place in places:
     lat = place["geometry"]["location"]["lat"]
     lng = place["geometry"]["location"]["lng"]
     folder_name = f"{place_data['name'].replace(' ', '_')}_{place_id}"
-    image_path = os.path.join(folder_name, "satellite_image.png")
+    image_path = None
     
-    download_satellite_image(client, lat, lng, zoom_level, folder_name, "satellite_image.png")
-    place_data["green_percentage"] = round(calculate_green_percentage(image_path), 2)
+    data = fetch_satellite_image(client, lat, lng, zoom_level)
+    if SAVE_ORIGINALS or THUMBNAIL_DIR is None:
+        # il report collega la foto intera: scritta su disco in un altro thread
+        image_path = os.path.join(folder_name, "satellite_image.png")
+        writer.submit(save_binary_file, folder_name, "satellite_image.png", data)
+    # decodifica unica dai byte in memoria: percentuale di verde (sulla palette, se presente) e anteprima
+    with timed("decodifica_png"):
+        image = decode_image(data)
+    with timed("calcolo_verde"):
+        place_data["green_percentage"] = round(green_percentage_from_image(image, GREEN_INDEX), 2)
     place_data["keyword_count"] = find_keyword_in_reviews(place_details.get("reviews"), review_keyword)
+    if THUMBNAIL_DIR is not None:
+        with timed("anteprime"):
+            thumbnails = make_thumbnails(image, source_hash(data), directory=THUMBNAIL_DIR)
+        place_data["thumbnail_path"] = thumbnails[min(thumbnails)]
+        if image_path is None:
+            image_path = thumbnails[max(thumbnails)]
     place_data["image_path"] = image_path
     
-    places_data.append(place_data)
+    return place_data
+
 
-# ordinamento dei risultati per percentuale di verde e recensioni trovate
-def compare(a, b):
-    if a["green_percentage"] > b["green_percentage"]:
-        return -1
-    elif a["green_percentage"] < b["green_percentage"]:
-        return 1
-    else:
-        return b["keyword_count"] - a["keyword_count"]
+##############
+#    MAIN    #
+##############
 
-places_data.sort(key=cmp_to_key(compare))
+def run_rgb(client, latitude, longitude, radius, keyword, review_keyword, meters_per_centimeter, num_results=1000, output_file="report.html"):
+    # ricerca in un solo cerchio (raggio in km), analisi sequenziale e report;
+    # restituisce un riepilogo con tempi e conteggi
+    start_time = time.perf_counter()
+    metrics = run_metrics.activate(RunMetrics("googlemaprgb", METRICS_FILE))
+    if METRICS_PORT is not None:
+        print(f"Metriche su {metrics.serve(METRICS_PORT)}")
+    
+    # calcolo del zoom_level in base alla necessitù
+    print("Calcolo del livello di zoom...")
+    zoom_level = int(np.log2(156543.03392 * np.cos(latitude * pi / 180) / (meters_per_centimeter / 100)))
+    
+    # ricerca dei luoghi
+    print("Ricerca luoghi...")
+    places = search_places(client, latitude, longitude, radius, keyword, num_results)
+    
+    # analizza i luoghi trovati
+    print("Analisi luoghi...")
+    report = open_html_report(output_file) # consultabile gia' durante l'analisi
+    places_data = []
+    errors = 0
+    writer = BackgroundWriter() # foto intere salvate mentre si analizza la successiva
+    metrics.start_phase("analisi", len(places))
+    for place in places:
+        # printo la progressione dell'analisi (ETA sulle attività gia' completate)
+        sys.stdout.write("\r" + metrics.progress_line())
+        sys.stdout.flush()
+        
+        with timed("attesa_fissa"):
+            time.sleep(PLACE_DELAY) # debug
+        
+        try:
+            place_data = analyze_place(client, place, zoom_level, review_keyword, writer)
+        except Exception as e:
+            print(f"\nErrore durante l'analisi di {place['place_id']}, scartato.\n{e}")
+            errors += 1
+            metrics.count("errori_attivita")
+            metrics.advance()
+            continue
+        
+        places_data.append(place_data)
+        with timed("report"):
+            report.add_row(place_data)
+        metrics.advance()
+    sys.stdout.write("\r" + metrics.progress_line())
+    write_errors = writer.close()
+    if write_errors:
+        print(f"\n{len(write_errors)} foto non salvate su disco: {write_errors[0]}")
+    
+    # rapporto sui risultati, riordinato per percentuale di verde e recensioni trovate
+    print("\nCreazione report...")
+    places_data.sort(key=report_sort_key)
+    with timed("report"):
+        report.rewrite_sorted(report_sort_key)
+    
+    print(f"\nTempi per fase in {time.perf_counter() - start_time:.1f} s:")
+    for line in metrics.summary_lines():
+        print(line)
+    metrics.close()
+    run_metrics.deactivate()
+    
+    print("\nFine\nConsultare il file:", output_file)
+    return {
+        "places": len(places_data),
+        "errors": errors,
+        "elapsed": time.perf_counter() - start_time,
+    }
 
-# rapporto sui risultati
-print("\nCreazione report...")
-output_file = "report.html"
-generate_html_report(places_data, output_file)
 
-print("\nFine\nConsultare il file:", output_file)
+if __name__ == "__main__":
+    # autenticazione
+    client = googlemaps.Client(key=API_KEY)
+    
+    # input (parametri di esempio)
+    num_results = 1000
+    latitude, longitude = input("Lat, Lng: ").split(", ")
+    latitude = float(latitude)
+    longitude = float(longitude)
+    radius = float(input("Raggio ricerca (km): "))
+    keyword = input("Tipo attività: ")
+    review_keyword = input("Keyword recensioni: ")
+    meters_per_centimeter = float(input("Metri corrispondenti a 1 cm sulla foto satellitare: ")) 
+    
+    run_rgb(client, latitude, longitude, radius, keyword, review_keyword, meters_per_centimeter, num_results)
@@ -12,17 +12,26 @@
 import googlemaps
 import os
 import requests
-from math import log2, tan, pi
-from io import BytesIO
-from PIL import Image
+from math import pi
 import numpy as np
-from jinja2 import Template
-from functools import cmp_to_key
 from googlemaps.exceptions import ApiError
 import sys
 import time
-from jinja2 import Template
-import math
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
+from green_analysis import green_percentage_from_image, sampled_green_percentage, decode_image
+from thumbnails import make_thumbnails, source_hash
+from fetch_pipeline import TokenBucket, BackgroundWriter, is_transient, retry_with_backoff, run_pipeline
+from places_cache import PlacesCache, cached_call, DAY
+from tile_cache import TileCache
+from hex_grid import calculate_circle_centers, calculate_polygon_centers, polygon_center
+from adaptive_search import adaptive_search, api_calls_for, fixed_grid_calls
+from run_journal import RunJournal
+from screening import refine_screened
+from place_groups import dedup_places, assign_shared_tiles
+from report_writer import StreamingReport
+import run_metrics
+from run_metrics import RunMetrics, timed, count
+import atexit
 import re
 
 #############
@@ -30,6 +39,41 @@ import re
 #############
 API_KEY = "xxx" # <--------------------------------------------------------------------------------------------------------
 
+#################
+#    OPZIONI    #
+#################
+GREEN_INDEX = "rgb" # indice di vegetazione: "rgb" (G > R e G > B), "exg" o "vari"
+MAX_WORKERS = 8 # richieste contemporanee
+PLACES_QPS = 10 # richieste al secondo verso le Places API
+STATIC_MAPS_QPS = 10 # richieste al secondo verso le Static Maps API
+MAX_RETRIES = 5 # tentativi per richiesta prima di scartarla (attesa esponenziale)
+REQUEST_TIMEOUT = 30 # secondi di attesa massima per una risposta, poi la richiesta fallisce e viene ritentata
+PLACES_CACHE_FILE = "places_cache.sqlite" # cache persistente delle risposte Places (None per disattivarla)
+PLACES_CACHE_TTL_DAYS = 30 # validità delle risposte in cache
+PLACES_CACHE_MAX_ENTRIES = 200000 # oltre questo limite vengono rimosse le voci meno usate
+TILE_CACHE_DIR = "tile_cache" # cache condivisa delle foto satellitari (None per la vecchia cartella per attività)
+TILE_CACHE_MAX_GB = 2 # budget di disco della cache, oltre vengono rimosse le immagini meno usate delle esecuzioni precedenti
+STUDY_AREA_GEOJSON = None # file GeoJSON (Polygon/MultiPolygon) con l'area di studio al posto del cerchio
+ADAPTIVE_SEARCH = True # suddivide solo i cerchi che raggiungono il limite di 60 risultati delle Places API
+MIN_SEARCH_RADIUS_KM = 0.1 # raggio minimo dei cerchi ottenuti per suddivisione
+MERGE_DISTANCE_M = 0 # unisce i luoghi (con place_id diversi) piu' vicini di questa distanza, 0 = solo doppioni esatti
+SHARED_TILE_DISTANCE_M = 0 # luoghi entro questa distanza (metri) condividono la stessa foto satellitare, 0 = una foto per luogo
+REPORT_PAGE_SIZE = 500 # righe per pagina del report
+PAGE_TOKEN_DELAY = 2 # secondi di attesa prima di chiedere la pagina successiva dei risultati
+THUMBNAIL_DIR = "thumbs" # anteprime ridotte nel report, originale al click (None per le immagini intere)
+SAVE_ORIGINALS = True # senza cache delle immagini: False salva solo le anteprime (nessuna foto intera su disco)
+SCREENING = False # prima passata veloce (foto ridotte, verde stimato a campione), poi piena risoluzione solo per le prime
+SCREEN_SCALE = 1 # scale delle Static Maps nella prima passata: stessa area, 1/4 dei pixel rispetto a scale=2
+SCREEN_MAX_ERROR = 1.0 # errore massimo della stima a campione, in punti percentuali (95%)
+SCREEN_TOP_N = 100 # attività rianalizzate a piena risoluzione, piu' quelle con intervallo sovrapposto all'ultima
+SCREEN_MARGIN_FACTOR = 1.5 # moltiplica lo scarto massimo misurato sulle prime attività affinate: il massimo di un campione sottostima quello di tutte le stime
+SCREEN_MAX_FRACTION = 0.3 # tetto della seconda passata: al massimo questa frazione delle attività (e almeno SCREEN_TOP_N)
+JOURNAL_DIR = "journal" # diario delle esecuzioni per riprendere un'analisi interrotta (None per disattivarlo)
+METRICS_FILE = "metrics.json" # tempi per fase, contatori ed ETA, riscritto ogni run_metrics.FLUSH_INTERVAL secondi (None per disattivarlo)
+METRICS_PORT = None # porta locale per le metriche in formato Prometheus su /metrics (es. 9108), None per non avviare il server
+
+PLACE_DETAILS_FIELDS = ["name", "formatted_address", "formatted_phone_number", "website", "reviews", "rating"]
+
 ##################
 #    FUNZIONI    #
 ##################
@@ -39,36 +83,39 @@ def create_folder_if_not_exists(folder_name):
         os.makedirs(folder_name)
 
 
+def save_binary_file(folder_name, file_name, content):
+    create_folder_if_not_exists(folder_name)
+    with timed("scrittura_disco"):
+        with open(os.path.join(folder_name, file_name), "wb") as binary_file:
+            binary_file.write(content)
+
+
 def save_text_file(folder_name, file_name, content):
     create_folder_if_not_exists(folder_name)
     with open(os.path.join(folder_name, file_name), "w", encoding="utf-8") as text_file:
         text_file.write(content)
 
 
-def download_image(url, folder_name, file_name):
-    create_folder_if_not_exists(folder_name)
-    response = requests.get(url)
-    with open(os.path.join(folder_name, file_name), "wb") as img_file:
-        img_file.write(response.content)
+def make_client(key, **kwargs):
+    # client senza tentativi propri, cosi' decide solo retry_with_backoff (con il limiter e MAX_RETRIES):
+    # niente ripetizioni sugli OVER_QUERY_LIMIT e, con retry_timeout minimo, un HTTP 5xx diventa subito
+    # un Timeout (transitorio per is_transient) invece di essere ripetuto dal client
+    return googlemaps.Client(key=key, retry_over_query_limit=False, retry_timeout=0.01, timeout=REQUEST_TIMEOUT, **kwargs)
 
 
-def calculate_green_percentage(image_path):
-    image = Image.open(image_path).convert('RGB') # forza l'rgb a prescindere
-    image_data = np.array(image)
-    
-    green_pixel_count = 0
-    total_pixel_count = image_data.shape[0] * image_data.shape[1]
-    
-    for row in image_data:
-        for pixel in row:
-            red, green, blue = pixel[:3]
-            if green > red and green > blue:
-                green_pixel_count += 1
-    
-    return (green_pixel_count / total_pixel_count) * 100
+def places_nearby(client, query_params):
+    with timed("api_places_ricerca"):
+        return client.places_nearby(**query_params)
 
 
-def search_places(client, lat, lng, radius, keyword, num_results):
+def page_token_retry(error):
+    # INVALID_REQUEST su una pagina successiva: il token non e' ancora valido, si ritenta come un errore transitorio
+    return is_transient(error) or (isinstance(error, ApiError) and error.status == "INVALID_REQUEST")
+
+
+def search_places(client, lat, lng, radius, keyword, num_results, limiter=None, retries=MAX_RETRIES):
+    # ogni pagina e' una richiesta a se': prende un token dal limiter e viene ritentata da sola,
+    # senza ricominciare dalla prima pagina
     result = []
     query_params = {
         "location": f"{lat},{lng}",
@@ -77,7 +124,7 @@ def search_places(client, lat, lng, radius, keyword, num_results):
         "type": "establishment",
     }
     
-    response = client.places_nearby(**query_params)
+    response = retry_with_backoff(places_nearby, client, query_params, limiter=limiter, retries=retries)
     
     for place in response["results"]:
         result.append(place)
@@ -85,9 +132,10 @@ def search_places(client, lat, lng, radius, keyword, num_results):
             break
     
     while "next_page_token" in response and len(result) < num_results:
-        time.sleep(2) # debug
+        with timed("attesa_token"):
+            time.sleep(PAGE_TOKEN_DELAY) # il token della pagina successiva non e' subito valido
         query_params["page_token"] = response["next_page_token"]
-        response = client.places_nearby(**query_params)
+        response = retry_with_backoff(places_nearby, client, query_params, limiter=limiter, retries=retries, retry_if=page_token_retry)
         for place in response["results"]:
             result.append(place)
             if len(result) >= num_results:
@@ -97,8 +145,8 @@ def search_places(client, lat, lng, radius, keyword, num_results):
 
 
 def get_place_details(client, place_id):
-    fields = ["name", "formatted_address", "formatted_phone_number", "website", "reviews", "rating"]
-    response = client.place(place_id, fields=fields)
+    with timed("api_places_dettagli"):
+        response = client.place(place_id, fields=PLACE_DETAILS_FIELDS)
     return response["result"]
 
 
@@ -111,81 +159,29 @@ def find_keyword_in_reviews(reviews, keyword):
     return count
 
 
-def download_satellite_image(client, lat, lng, zoom_level, folder_name, file_name):
-    scale = 2
-    size = "640x640"
-    map_type = "satellite"
-    url = f"https://maps.googleapis.com/maps/api/staticmap?center={lat},{lng}&zoom={zoom_level}&scale={scale}&size={size}&maptype={map_type}&key={client.key}"
-    download_image(url, folder_name, file_name)
+def satellite_image_url(client, lat, lng, zoom_level, scale=2, size="640x640", map_type="satellite"):
+    return f"{client.base_url}/maps/api/staticmap?center={lat},{lng}&zoom={zoom_level}&scale={scale}&size={size}&maptype={map_type}&key={client.key}"
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371  # raggio della terra in km
-    
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(dlat / 2) * math.sin(dlat / 2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) * math.sin(dlon / 2))
-    
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+def fetch_image_bytes(url):
+    with timed("api_static_maps"):
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status() # non mettere in cache le pagine di errore
+    count("byte_scaricati", len(response.content))
+    return response.content
 
-def destination_point(lat, lon, distance, angle):
-    R = 6371  # raggio della terra in km
-    d = distance / R
-    
-    lat1 = math.radians(lat)
-    lon1 = math.radians(lon)
-    
-    lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(math.radians(angle)))
-    lon2 = lon1 + math.atan2(math.sin(math.radians(angle)) * math.sin(d) * math.cos(lat1), math.cos(d) - math.sin(lat1) * math.sin(lat2))
-    
-    return math.degrees(lat2), math.degrees(lon2)
 
-def calculate_circle_centers(outer_radius, small_radius, center_latitude, center_longitude):
-    circle_centers = []
-    angle = 60
-    
-    # da metri a km
-    outer_radius /= 1000
-    small_radius /= 1000
-    
-    # calcola il raggio del cerchio circoscritto all'esagono
-    circumscribed_radius = small_radius / math.cos(math.radians(angle / 2))
-    
-    y_offset = math.sqrt(3) * circumscribed_radius
-    x_offset = 2 * circumscribed_radius * math.cos(math.radians(angle))
+def cached_satellite_image(client, lat, lng, zoom_level, tile_cache, maps_limiter, writer=None, scale=2):
+    # restituisce (byte, percorso); le immagini nuove vengono scritte nella cache dal writer
+    size = "640x640"
+    map_type = "satellite"
     
-    max_grid_width = int(2 * math.ceil(outer_radius / x_offset))
-    max_grid_height = int(2 * math.ceil(outer_radius / y_offset))
+    def fetch(q_lat, q_lng):
+        url = satellite_image_url(client, q_lat, q_lng, zoom_level, scale, size, map_type)
+        return retry_with_backoff(fetch_image_bytes, url, limiter=maps_limiter, retries=MAX_RETRIES)
     
-    for i in range(-max_grid_height, max_grid_height + 1):
-        for j in range(-max_grid_width, max_grid_width + 1):
-            lat_shift = (i * y_offset) + (y_offset / 2 * (j % 2))
-            lon_shift = j * x_offset
-            
-            lat_new, lon_new = destination_point(center_latitude, center_longitude, lat_shift, 0)
-            lat_new, lon_new = destination_point(lat_new, lon_new, lon_shift, 90)
-            
-            # distanze su una sfera
-            if haversine_distance(center_latitude, center_longitude, lat_new, lon_new) <= outer_radius:
-                circle_centers.append((lat_new, lon_new))
-    
-    return circle_centers
-
+    return tile_cache.get_bytes_or_fetch(lat, lng, zoom_level, scale, size, map_type, fetch, writer)
 
-def remove_duplicates(places):
-    seen_ids = set()
-    unique_places = []
-    
-    for place in places:
-        place_id = place["place_id"]
-        if place_id not in seen_ids:
-            seen_ids.add(place_id)
-            unique_places.append(place)
-    
-    return unique_places
 
 # debug
 def clean_folder_name(folder_name):
@@ -193,13 +189,83 @@ def clean_folder_name(folder_name):
     cleaned_name = re.sub(r'[\\/:*?"<>|]', "-", folder_name)
     return cleaned_name
 
-# template
-def generate_html_report(places_data, output_file):
-    html_template = Template("""
+def analyze_place(client, place, zoom_level, review_keyword, places_limiter, maps_limiter, places_cache=None, tile_cache=None, writer=None, screening=False):
+    place_data = {}
+    place_id = place["place_id"]
+    details_key = ("details", place_id, PLACE_DETAILS_FIELDS)
+    place_details = cached_call(places_cache, details_key, retry_with_backoff, get_place_details, client, place_id, limiter=places_limiter, retries=MAX_RETRIES)
+    
+    place_data["name"] = place_details["name"]
+    place_data["address"] = place_details["formatted_address"]
+    place_data["phone"] = place_details.get("formatted_phone_number", "")
+    place_data["rating"] = place_details.get("rating", "N/A")
+    place_data["website"] = place_details.get("website", "N/A")
+    place_data["keyword_count"] = find_keyword_in_reviews(place_details.get("reviews"), review_keyword)
+    place_data.update(score_place_image(client, place, place_data["name"], zoom_level, maps_limiter, tile_cache, writer, screening))
+    
+    return place_data
+
+
+def score_place_image(client, place, place_name, zoom_level, maps_limiter, tile_cache=None, writer=None, screening=False):
+    # foto satellitare dell'attività e percentuale di verde; con screening foto a SCREEN_SCALE e
+    # stima a campione con il suo errore, altrimenti piena risoluzione e valore esatto
+    place_data = {}
+    place_id = place["place_id"]
+    scale = SCREEN_SCALE if screening else 2
+    lat = place["geometry"]["location"]["lat"]
+    lng = place["geometry"]["location"]["lng"]
+    if "tile_center" in place:
+        # foto condivisa con i luoghi vicini
+        lat, lng = place["tile_center"]
+    if tile_cache is not None:
+        # immagine condivisa tra attività vicine e tra esecuzioni diverse
+        data, image_path = cached_satellite_image(client, lat, lng, zoom_level, tile_cache, maps_limiter, writer, scale)
+    else:
+        #folder_name = f"{place_data['name'].replace(' ', '_')}_{place_id}" # WinError123
+        cleaned_place_name = clean_folder_name(place_name) # debug
+        folder_name = f"{cleaned_place_name.replace(' ', '_')}_{place_id}" # debug
+        data = retry_with_backoff(fetch_image_bytes, satellite_image_url(client, lat, lng, zoom_level, scale), limiter=maps_limiter, retries=MAX_RETRIES)
+        image_path = None
+        if SAVE_ORIGINALS or THUMBNAIL_DIR is None:
+            # il report collega la foto intera: scritta su disco senza fermare l'analisi
+            image_path = os.path.join(folder_name, "satellite_image.png")
+            if writer is not None:
+                writer.submit(save_binary_file, folder_name, "satellite_image.png", data)
+            else:
+                save_binary_file(folder_name, "satellite_image.png", data)
+    
+    # decodifica unica dai byte in memoria: percentuale di verde (sulla palette, se presente) e anteprima
+    with timed("decodifica_png"):
+        image = decode_image(data)
+    with timed("calcolo_verde"):
+        if screening:
+            green_percentage, green_error, _ = sampled_green_percentage(image, GREEN_INDEX, max_error=SCREEN_MAX_ERROR)
+            place_data["green_percentage"] = round(green_percentage, 2)
+            place_data["green_error"] = round(green_error, 2)
+            place_data["screened"] = True
+        else:
+            place_data["green_percentage"] = round(green_percentage_from_image(image, GREEN_INDEX), 2)
+            if SCREENING:
+                # valore esatto della seconda passata
+                place_data["green_error"] = 0.0
+                place_data["screened"] = False
+    if THUMBNAIL_DIR is not None:
+        with timed("anteprime"):
+            thumbnails = make_thumbnails(image, source_hash(data), directory=THUMBNAIL_DIR)
+        place_data["thumbnail_path"] = thumbnails[min(thumbnails)]
+        if image_path is None:
+            image_path = thumbnails[max(thumbnails)]
+    place_data["image_path"] = image_path
+    
+    return place_data
+
+# template (pagine del report in streaming)
+REPORT_PAGE_HEAD = """
     <!DOCTYPE html>
     <html>
     <head>
-        <title>Report</title>
+        <meta charset="utf-8">
+        <title>{{ title }} - pagina {{ page }}</title>
         <style>
             table {
                 width: 100%;
@@ -230,7 +296,8 @@ def generate_html_report(places_data, output_file):
         <script src="https://cdnjs.cloudflare.com/ajax/libs/xlsx/0.17.0/xlsx.full.min.js"></script>
     </head>
     <body>
-        <h1>Report</h1>
+        <h1>{{ title }} - pagina {{ page }}</h1>
+        <p><a href="{{ index_file }}">Indice</a></p>
         <table>
             <thead>
                 <tr>
@@ -245,27 +312,34 @@ def generate_html_report(places_data, output_file):
                 </tr>
             </thead>
             <tbody>
-                {% for place_data in places_data %}
+"""
+
+REPORT_ROW = """
                 <tr>
-                    <td>{{ place_data["name"] }}</td>
-                    <td>{{ place_data["address"] }}</td>
-                    <td>{{ place_data["phone"] }}</td>
-                    <td>{{ place_data["rating"] }}</td>
-                    <td>{{ place_data["green_percentage"] }}%</td>
-                    <td><a href="{{ place_data["website"] }}" target="_blank">link</a></td>
-                    <td><input type="text" class="annotations" data-index="{{ loop.index0 }}" value="{{ place_data["annotations"] | default('') }}"></td>
+                    <td>{{ row["name"] }}</td>
+                    <td>{{ row["address"] }}</td>
+                    <td>{{ row["phone"] }}</td>
+                    <td>{{ row["rating"] }}</td>
+                    <td>{{ row["green_percentage"] }}%{% if row["green_error"] %} &plusmn; {{ row["green_error"] }}{% endif %}</td>
+                    <td><a href="{{ row["website"] }}" target="_blank">link</a></td>
+                    <td><input type="text" class="annotations" data-index="{{ index }}" value="{{ row["annotations"] | default('') }}"></td>
                     <td>
-                        <input type="checkbox" class="select-place" data-index="{{ loop.index0 }}" id="select-place-{{ loop.index0 }}">
-                        <label class="image-label" for="select-place-{{ loop.index0 }}"><img src="{{ place_data["image_path"] }}" width="300"></label>
+                        <input type="checkbox" class="select-place" data-index="{{ index }}" data-place='{{ row|tojson }}' id="select-place-{{ index }}">
+                        <label class="image-label" for="select-place-{{ index }}"><img src="{{ row["thumbnail_path"] | default(row["image_path"]) }}" width="300" loading="lazy"></label>
+                        <a href="{{ row["image_path"] }}" target="_blank">originale</a>
                     </td>
                 </tr>
-                {% endfor %}
+"""
+
+REPORT_PAGE_TAIL = """
             </tbody>
         </table>
+        <p>
+            {% if prev_page %}<a href="{{ prev_page }}">&laquo; Pagina precedente</a>{% endif %}
+            {% if next_page %}<a href="{{ next_page }}">Pagina successiva &raquo;</a>{% endif %}
+        </p>
         <button id="save-to-excel">Save to Excel</button>
         <script>
-            const placesData = {{ places_data|tojson }};
-            
             function s2ab(s) {
                 const buf = new ArrayBuffer(s.length);
                 const view = new Uint8Array(buf);
@@ -274,10 +348,10 @@ def generate_html_report(places_data, output_file):
             }
             
             document.getElementById("save-to-excel").addEventListener("click", function() {
-                const selectedIndices = Array.from(document.querySelectorAll(".select-place:checked")).map(input => parseInt(input.dataset.index));
-                const selectedData = selectedIndices.map(index => {
-                    const annotations = document.querySelector(`.annotations[data-index="${index}"]`).value;
-                    return { ...placesData[index], annotations };
+                // i dati di ogni riga sono sulla sua checkbox: niente copia dell'intero dataset nella pagina
+                const selectedData = Array.from(document.querySelectorAll(".select-place:checked")).map(input => {
+                    const annotations = document.querySelector(`.annotations[data-index="${input.dataset.index}"]`).value;
+                    return { ...JSON.parse(input.dataset.place), annotations };
                 });
                 
                 const wb = XLSX.utils.book_new();
@@ -295,123 +369,270 @@ def generate_html_report(places_data, output_file):
         </script>
     </body>
     </html>
-    """)
+"""
+
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_template.render(places_data=places_data))
+def open_html_report(output_file):
+    return StreamingReport(output_file, "Report", REPORT_PAGE_HEAD, REPORT_ROW, REPORT_PAGE_TAIL, REPORT_PAGE_SIZE)
+
+
+def report_sort_key(place_data):
+    # ordinamento dei risultati per percentuale di verde e recensioni trovate
+    return (-place_data["green_percentage"], -place_data["keyword_count"])
 
 
 ##############
 #    MAIN    #
 ##############
 
-# autenticazione
-client = googlemaps.Client(key=API_KEY)
-
-# input
-num_results = 5000 # nuovo limite per il traffico giornaliero
-center_latitude, center_longitude = input("Lat, Lng: ").split(", ")
-center_latitude = float(center_latitude)
-center_longitude = float(center_longitude)
-outer_radius = float(input("Raggio complessivo di ricerca (km): ")) * 1000
-small_radius = float(input("Raggio dei cerchi piccoli (km): ")) * 1000
-keyword = input("Tipo attività: ")
-review_keyword = input("Keyword recensioni: ")
-meters_per_centimeter = float(input("Metri corrispondenti a 1 cm sulla foto satellitare: ")) 
-
-# calcolo del zoom_level in base alla necessitù
-print("\nCalcolo del livello di zoom...")
-zoom_level = int(np.log2(156543.03392 * np.cos(center_latitude * pi / 180) / (meters_per_centimeter / 100)))
-
-# calcola i centri dei cerchi
-circle_centers_lat_lng = calculate_circle_centers(outer_radius, small_radius, center_latitude, center_longitude)
-
-# ricerca dei luoghi
-print("\nRicerca luoghi...")
-all_places = []
-i = 1
-for lat, lng in circle_centers_lat_lng:
-    analysis_done = False
-    while not analysis_done:
-        try:
-            # printo la progressione dell'analisi
-            messaggio = (f"  {i} lotti")
-            sys.stdout.write("\r" + messaggio)
-            sys.stdout.flush()
-            
-            places = search_places(client, lat, lng, small_radius / 1000, keyword, num_results)
-            all_places.extend(places)
-            i = i + 1
-            analysis_done = True
-        except Exception as e:
-            print(f"\nErrore durante l'analisi del lotto {i}.\n{e}\nRiprovo...")
-            time.sleep(5)  # attendi 5 secondi prima di riprovare
-
-# rimuovi i duplicati
-n = len(all_places)
-print(f"\n\nControllo duplicati su {n} attività trovate...")
-all_places = remove_duplicates(all_places)
-
-# analizza i luoghi trovati
-print("\nAnalisi attività...")
-places_data = []
-i = 1
-n = len(all_places) # numero di attività senza duplicati
-for place in all_places:
-    analysis_done = False
-    while not analysis_done:
-        try:
-            # printo la progressione dell'analisi
-            messaggio = (f"  {i} di {n}")
-            sys.stdout.write("\r" + messaggio)
-            sys.stdout.flush()
-            
-            time.sleep(2)  # debug
-            
-            place_data = {}
-            place_id = place["place_id"]
-            place_details = get_place_details(client, place_id)
-            
-            place_data["name"] = place_details["name"]
-            place_data["address"] = place_details["formatted_address"]
-            place_data["phone"] = place_details.get("formatted_phone_number", "")
-            place_data["rating"] = place_details.get("rating", "N/A")
-            place_data["website"] = place_details.get("website", "N/A")
-            
-            lat = place["geometry"]["location"]["lat"]
-            lng = place["geometry"]["location"]["lng"]
-            #folder_name = f"{place_data['name'].replace(' ', '_')}_{place_id}" # WinError123
-            cleaned_place_name = clean_folder_name(place_data['name']) # debug
-            folder_name = f"{cleaned_place_name.replace(' ', '_')}_{place_id}" # debug
-            image_path = os.path.join(folder_name, "satellite_image.png")
-            
-            download_satellite_image(client, lat, lng, zoom_level, folder_name, "satellite_image.png")
-            place_data["green_percentage"] = round(calculate_green_percentage(image_path), 2)
-            place_data["keyword_count"] = find_keyword_in_reviews(place_details.get("reviews"), review_keyword)
-            place_data["image_path"] = image_path
-            
-            places_data.append(place_data)
-            i = i + 1
-            analysis_done = True
-        except Exception as e:
-            print(f"\nErrore durante l'analisi del luogo {i}.\n{e}\nRiprovo...")
-            time.sleep(5)  # attendi 5 secondi prima di riprovare
-
-# ordinamento dei risultati per percentuale di verde e recensioni trovate
-def compare(a, b):
-    if a["green_percentage"] > b["green_percentage"]:
-        return -1
-    elif a["green_percentage"] < b["green_percentage"]:
-        return 1
+def run_hexagon(client, center_latitude, center_longitude, outer_radius, small_radius, keyword, review_keyword, meters_per_centimeter, num_results=5000, output_file="report.html"):
+    # intera analisi (ricerca, analisi delle attività e report); raggi in metri, outer_radius
+    # ignorato con STUDY_AREA_GEOJSON; restituisce un riepilogo con tempi e conteggi
+    start_time = time.perf_counter()
+    metrics = run_metrics.activate(RunMetrics("hexagon2", METRICS_FILE))
+    if METRICS_PORT is not None:
+        print(f"Metriche su {metrics.serve(METRICS_PORT)}")
+    if STUDY_AREA_GEOJSON is not None and center_latitude is None:
+        center_latitude, center_longitude = polygon_center(STUDY_AREA_GEOJSON)
+
+    # calcolo del zoom_level in base alla necessitù
+    print("\nCalcolo del livello di zoom...")
+    zoom_level = int(np.log2(156543.03392 * np.cos(center_latitude * pi / 180) / (meters_per_centimeter / 100)))
+
+    # calcola i centri dei cerchi
+    if STUDY_AREA_GEOJSON is None:
+        circle_centers_lat_lng = calculate_circle_centers(outer_radius, small_radius, center_latitude, center_longitude)
     else:
-        return b["keyword_count"] - a["keyword_count"]
-
-places_data.sort(key=cmp_to_key(compare))
-
-# rapporto sui risultati
-print("\n\nCreazione report...")
-output_file = "report.html"
-generate_html_report(places_data, output_file)
+        circle_centers_lat_lng = calculate_polygon_centers(STUDY_AREA_GEOJSON, small_radius)
+
+    # limitatori di frequenza condivisi tra i thread
+    places_limiter = TokenBucket(PLACES_QPS)
+    maps_limiter = TokenBucket(STATIC_MAPS_QPS)
+
+    # cache persistente delle risposte Places
+    places_cache = None
+    if PLACES_CACHE_FILE is not None:
+        places_cache = PlacesCache(PLACES_CACHE_FILE, PLACES_CACHE_TTL_DAYS * DAY, PLACES_CACHE_MAX_ENTRIES)
+        metrics.watch("cache_places", places_cache.stats)
+
+    # cache delle foto satellitari
+    tile_cache = None
+    if TILE_CACHE_DIR is not None:
+        tile_cache = TileCache(TILE_CACHE_DIR, int(TILE_CACHE_MAX_GB * 1024 ** 3))
+        metrics.watch("cache_immagini", tile_cache.stats)
+
+    # diario dell'esecuzione: stessi parametri -> ripresa dal punto di interruzione
+    journal = None
+    if JOURNAL_DIR is not None:
+        run_params = {
+            "center": [center_latitude, center_longitude],
+            "outer_radius": outer_radius if STUDY_AREA_GEOJSON is None else None,
+            "study_area": STUDY_AREA_GEOJSON,
+            "small_radius": small_radius,
+            "keyword": keyword,
+            "review_keyword": review_keyword,
+            "zoom_level": zoom_level,
+            "green_index": GREEN_INDEX,
+            "adaptive": ADAPTIVE_SEARCH,
+            "screening": [SCREEN_SCALE, SCREEN_MAX_ERROR, SCREEN_TOP_N, SCREEN_MARGIN_FACTOR, SCREEN_MAX_FRACTION] if SCREENING else None,
+        }
+        journal = RunJournal(JOURNAL_DIR, run_params, max_age=PLACES_CACHE_TTL_DAYS * DAY)
+        atexit.register(journal.close) # salva su disco anche in caso di Ctrl-C
+        if journal.discarded == "scaduto":
+            print(f"\nDiario {journal.path} piu' vecchio di {PLACES_CACHE_TTL_DAYS} giorni: analisi ripresa da zero")
+        if journal.cells or journal.places:
+            print(f"\nRipresa dal diario {journal.path}: {len(journal.cells)} lotti e {len(journal.places)} attività già completati")
+
+    # ricerca dei luoghi
+    print("\nRicerca luoghi...")
+    metrics.start_phase("lotti")
+    def search_cell(cell):
+        # restituisce (luoghi, richieste inviate): i lotti dal diario o dalla cache non costano chiamate
+        if journal is not None:
+            places = journal.cell_result(cell)
+            if places is not None:
+                return places, 0
+        lat, lng, radius = cell
+        search_key = ("search", round(lat, 6), round(lng, 6), round(radius * 1000, 1), keyword, num_results)
+        calls = []
+        def fetch():
+            places = search_places(client, lat, lng, radius, keyword, num_results, places_limiter, MAX_RETRIES)
+            calls.append(api_calls_for(places))
+            return places
+        return cached_call(places_cache, search_key, fetch), sum(calls)
+
+    def on_cell(level, cell, places, error):
+        # printo la progressione dell'analisi
+        metrics.advance()
+        messaggio = (f"{metrics.progress_line()} (livello {level})")
+        sys.stdout.write("\r" + messaggio)
+        sys.stdout.flush()
+
+        if error is not None:
+            metrics.count("errori_lotti")
+            print(f"\nErrore durante l'analisi del lotto ({cell[0]:.6f}, {cell[1]:.6f}), scartato.\n{error}")
+        elif journal is not None and journal.cell_result(cell) is None:
+            journal.record_cell(cell, places)
+
+    # senza ricerca adattiva nessun cerchio scende sotto il raggio iniziale
+    min_search_radius = MIN_SEARCH_RADIUS_KM if ADAPTIVE_SEARCH else small_radius / 1000
+    all_places, search_stats = adaptive_search(circle_centers_lat_lng, small_radius / 1000, search_cell, min_search_radius, MAX_WORKERS, on_cell=on_cell)
+
+    # confronto con una griglia fissa al raggio piu' piccolo raggiunto: per ogni cerchio le pagine dei luoghi
+    # trovati che contiene (negativo se la ricerca adattiva costa di piu')
+    finest_radius = search_stats["finest_radius"] * 1000
+    if STUDY_AREA_GEOJSON is None:
+        fixed_centers = calculate_circle_centers(outer_radius, finest_radius, center_latitude, center_longitude)
+    else:
+        fixed_centers = calculate_polygon_centers(STUDY_AREA_GEOJSON, finest_radius)
+    fixed_calls = fixed_grid_calls(fixed_centers, search_stats["finest_radius"], dedup_places(all_places))
+    print(f"\n\nChiamate Places: {search_stats['calls']} inviate per {search_stats['cells']} cerchi ({search_stats['reused']} dal diario o dalla cache, {search_stats['subdivided']} suddivisi, {search_stats['truncated']} ancora saturi)")
+    print(f"Griglia fissa a {finest_radius / 1000:.3f} km: {fixed_calls} chiamate stimate per {len(fixed_centers)} cerchi contro {search_stats['planned_calls']} della ricerca adattiva, risparmiate {fixed_calls - search_stats['planned_calls']}")
+
+    # rimuovi i duplicati
+    n = len(all_places)
+    print(f"\n\nControllo duplicati su {n} attività trovate...")
+    # ordine fisso (i lotti terminano in ordine casuale): stessi capigruppo e stesse foto tra un'esecuzione e l'altra
+    all_places.sort(key=lambda place: place["place_id"])
+    all_places = dedup_places(all_places, MERGE_DISTANCE_M)
+    shared_tiles = assign_shared_tiles(all_places, SHARED_TILE_DISTANCE_M)
+    if shared_tiles:
+        print(f"{shared_tiles} foto satellitari per {len(all_places)} attività")
+
+    # analizza i luoghi trovati
+    print("\nAnalisi attività...")
+    report = open_html_report(output_file) # consultabile gia' durante l'analisi
+    places_data = []
+    analyzed = {} # place_id -> dati, per la seconda passata
+    places_by_id = {place["place_id"]: place for place in all_places}
+    errors = 0
+    if journal is not None:
+        # attività già analizzate in un'esecuzione precedente
+        pending_places = []
+        for place in all_places:
+            place_data = journal.place_result(place["place_id"])
+            if place_data is None:
+                pending_places.append(place)
+            else:
+                places_data.append(place_data)
+                analyzed[place["place_id"]] = place_data
+                report.add_row(place_data)
+        all_places = pending_places
+        metrics.count("attivita_dal_diario", len(places_data))
+    # l'ETA considera solo le attività ancora da analizzare
+    metrics.start_phase("analisi", len(all_places))
+    writer = BackgroundWriter()
+    def analyze(place):
+        return analyze_place(client, place, zoom_level, review_keyword, places_limiter, maps_limiter, places_cache, tile_cache, writer, SCREENING)
+
+    for index, place_data, error in run_pipeline(all_places, analyze, MAX_WORKERS):
+        # printo la progressione dell'analisi
+        metrics.advance()
+        sys.stdout.write("\r" + metrics.progress_line())
+        sys.stdout.flush()
+
+        if error is not None:
+            print(f"\nErrore durante l'analisi del luogo {index + 1}, scartato.\n{error}")
+            errors += 1
+            metrics.count("errori_attivita")
+            continue
+        places_data.append(place_data)
+        analyzed[all_places[index]["place_id"]] = place_data
+        with timed("report"):
+            report.add_row(place_data)
+        if journal is not None:
+            journal.record_place(all_places[index]["place_id"], place_data)
+
+    if SCREENING:
+        # seconda passata: foto a piena risoluzione e valore esatto solo per le attività in cima alla classifica.
+        # L'errore della stima copre il campionamento, non il passaggio di risoluzione: lo scarto misurato
+        # nel primo turno allarga la selezione una sola volta, entro SCREEN_MAX_FRACTION delle attività
+        def refine(place_id):
+            return score_place_image(client, places_by_id[place_id], analyzed[place_id]["name"], zoom_level, maps_limiter, tile_cache, writer)
+
+        def refine_batch(refine_ids, margin):
+            print(f"\nSeconda passata a piena risoluzione su {len(refine_ids)} di {len(analyzed)} attività (margine {margin:.2f} punti)...")
+            metrics.start_phase("affinamento", len(refine_ids))
+            for index, image_data, error in run_pipeline(refine_ids, refine, MAX_WORKERS):
+                metrics.advance()
+                sys.stdout.write("\r" + metrics.progress_line())
+                sys.stdout.flush()
+                place_id = refine_ids[index]
+                if error is not None:
+                    print(f"\nErrore durante la seconda passata su {analyzed[place_id]['name']}, resta la stima.\n{error}")
+                    metrics.count("errori_affinamento")
+                    yield place_id, None
+                    continue
+                metrics.count("attivita_affinate")
+                yield place_id, image_data
+
+        def on_refined(place_id, place_data):
+            if journal is not None:
+                journal.record_place(place_id, place_data)
+
+        print("\n")
+        refine_screened(analyzed, refine_batch, report_sort_key, SCREEN_TOP_N, SCREEN_MARGIN_FACTOR, SCREEN_MAX_FRACTION, on_refined)
+
+    # foto ancora in coda di scrittura
+    write_errors = writer.close()
+    if write_errors:
+        metrics.count("errori_scrittura", len(write_errors))
+        print(f"\n{len(write_errors)} foto non salvate su disco: {write_errors[0]}")
+
+    if places_cache is not None:
+        stats = places_cache.stats()
+        print(f"\n\nCache Places: {stats['hits']} hit, {stats['misses']} miss ({stats['hit_rate'] * 100:.1f}%)")
+        places_cache.close()
+
+    if tile_cache is not None:
+        stats = tile_cache.stats()
+        print(f"Cache immagini: {stats['hits']} hit, {stats['misses']} miss ({stats['hit_rate'] * 100:.1f}%)")
+        tile_cache.close()
+
+    # rapporto sui risultati, riordinato per percentuale di verde e recensioni trovate
+    print("\n\nCreazione report...")
+    places_data.sort(key=report_sort_key)
+    with timed("report"):
+        # righe dalla memoria: con lo screening contengono i valori della seconda passata
+        report.rewrite_sorted(report_sort_key, places_data)
+    if journal is not None:
+        # esecuzione completa: la prossima con gli stessi parametri riparte da zero (e rispetta il TTL delle cache)
+        journal.complete()
+        atexit.unregister(journal.close)
+
+    # dove e' andato il tempo (fasi sommate sui thread)
+    print(f"\nTempi per fase in {time.perf_counter() - start_time:.1f} s ({MAX_WORKERS} thread):")
+    for line in metrics.summary_lines():
+        print(line)
+    metrics.close()
+    run_metrics.deactivate()
+
+    print("\nFine. Consultare il file:", output_file)
+    return {
+        "places": len(places_data),
+        "errors": errors,
+        "search": search_stats,
+        "elapsed": time.perf_counter() - start_time,
+    }
 
-print("\nFine. Consultare il file:", output_file)
 
+if __name__ == "__main__":
+    # autenticazione; tutti i tentativi li gestisce retry_with_backoff, non il client
+    client = make_client(API_KEY)
+    
+    # input
+    num_results = 5000 # nuovo limite per il traffico giornaliero
+    outer_radius = None
+    if STUDY_AREA_GEOJSON is None:
+        center_latitude, center_longitude = input("Lat, Lng: ").split(", ")
+        center_latitude = float(center_latitude)
+        center_longitude = float(center_longitude)
+        outer_radius = float(input("Raggio complessivo di ricerca (km): ")) * 1000
+    else:
+        center_latitude, center_longitude = polygon_center(STUDY_AREA_GEOJSON)
+    small_radius = float(input("Raggio dei cerchi piccoli (km): ")) * 1000
+    keyword = input("Tipo attività: ")
+    review_keyword = input("Keyword recensioni: ")
+    meters_per_centimeter = float(input("Metri corrispondenti a 1 cm sulla foto satellitare: ")) 
+    
+    run_hexagon(client, center_latitude, center_longitude, outer_radius, small_radius, keyword, review_keyword, meters_per_centimeter, num_results)
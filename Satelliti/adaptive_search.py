@@ -0,0 +1,80 @@
+# Coded by Pietro Squilla
+# Pianificazione adattiva delle ricerche: si parte da celle grandi e si suddividono
+# solo quelle che raggiungono il limite di risultati delle Places API
+
+import math
+import numpy as np
+from hex_grid import destination_point
+from fetch_pipeline import run_pipeline
+from place_groups import place_coordinates
+from spatial_index import SpatialIndex
+
+PLACES_RESULT_CAP = 60 # places_nearby restituisce al massimo 3 pagine da 20 risultati
+PAGE_SIZE = 20
+COVER_MARGIN = 1.02 # piccolo margine sul ricoprimento a 7 cerchi
+
+
+def child_cells(lat, lng, radius):
+    # 7 cerchi di raggio radius/2 (uno centrale e 6 a distanza radius*sqrt(3)/2) ricoprono il cerchio padre
+    child_radius = radius / 2 * COVER_MARGIN
+    bearings = np.arange(0, 360, 60)
+    lats, lngs = destination_point(lat, lng, np.full(6, radius * math.sqrt(3) / 2), bearings)
+    return [(lat, lng, child_radius)] + [(float(a), float(b), child_radius) for a, b in zip(lats, lngs)]
+
+
+def api_calls_for(places):
+    # pagine richieste per ottenere questi risultati (almeno una)
+    return max(1, math.ceil(len(places) / PAGE_SIZE))
+
+
+def fixed_grid_calls(centers, radius, places, cap=PLACES_RESULT_CAP):
+    # pagine richieste da una griglia fissa di cerchi di raggio radius (km) per trovare gli stessi luoghi:
+    # per ogni cerchio quelle dei luoghi che contiene, fino al limite di risultati
+    if not len(places):
+        return len(centers)
+    lats, lngs = place_coordinates(places)
+    index = SpatialIndex(lats, lngs, radius * 1000)
+    return sum(api_calls_for(index.query_radius(lat, lng, radius * 1000)[:cap]) for lat, lng in centers)
+
+
+def adaptive_search(centers, radius, search, min_radius, max_workers=8, cap=PLACES_RESULT_CAP, on_cell=None):
+    # centers: array (N, 2) della griglia grossolana, radius e min_radius in km;
+    # search(cell) con cell = (lat, lng, radius_km) restituisce (luoghi trovati, richieste di rete inviate),
+    # con 0 richieste per i risultati ripresi da una cache o dal diario;
+    # stats: "calls" richieste inviate, "planned_calls" quelle che il piano richiede senza cache
+    cells = [(float(lat), float(lng), radius) for lat, lng in centers]
+    all_places = []
+    stats = {"calls": 0, "planned_calls": 0, "reused": 0, "cells": 0, "subdivided": 0, "truncated": 0, "failed": 0, "levels": [], "finest_radius": radius}
+    level = 0
+
+    while cells:
+        stats["levels"].append(len(cells))
+        next_cells = []
+        for index, result, error in run_pipeline(cells, search, max_workers):
+            cell = cells[index]
+            places, calls = result if error is None else (None, 0)
+            stats["cells"] += 1
+            if on_cell is not None:
+                on_cell(level, cell, places, error)
+            if error is not None:
+                stats["failed"] += 1
+                continue
+
+            stats["calls"] += calls
+            stats["planned_calls"] += api_calls_for(places)
+            if calls == 0:
+                stats["reused"] += 1
+            all_places.extend(places)
+            if len(places) >= cap:
+                if cell[2] / 2 >= min_radius:
+                    stats["subdivided"] += 1
+                    next_cells.extend(child_cells(*cell))
+                else:
+                    stats["truncated"] += 1 # cella ancora satura ma gia' al raggio minimo
+
+        if next_cells:
+            stats["finest_radius"] = next_cells[0][2]
+        cells = next_cells
+        level += 1
+
+    return all_places, stats
@@ -0,0 +1,63 @@
+# Coded by Pietro Squilla
+# Micro-benchmark di calculate_green_percentage e calculate_circle_centers su dati sintetici;
+# la prima esecuzione salva la baseline, le successive la confrontano (codice 1 se ci sono regressioni)
+import os
+import sys
+import tempfile
+import numpy as np
+from PIL import Image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
+from green_analysis import calculate_green_percentage, green_percentage_from_array, load_rgb_array
+from hex_grid import calculate_circle_centers
+from microbench import measure, run_suite
+
+BASELINE_FILE = os.path.join("bench_results", "bench_micro_baseline.json") # relativo alla cartella dello script (ignorato da git), oppure percorso come primo argomento
+UPDATE_BASELINE = False # True per sostituire la baseline con i risultati correnti
+TILE_SIZES = [640, 1280, 2560] # lato delle foto sintetiche (1280 = 640x640 con scale=2, come le Static Maps)
+GREEN_FRACTION = 0.35 # frazione di pixel verdi nelle foto sintetiche
+GRIDS = [(5000, 500), (20000, 500), (50000, 250)] # (raggio esterno, raggio dei cerchi) in metri
+CENTER = (45.4642, 9.19)
+
+
+def synthetic_tile(size, green_fraction=GREEN_FRACTION, seed=0):
+    # foto con una frazione nota di pixel in cui G supera sia R sia B, a macchie come la vegetazione
+    rng = np.random.default_rng(seed)
+    blocks = rng.random((size // 8, size // 8)) < green_fraction
+    green = np.kron(blocks, np.ones((8, 8), dtype=bool))
+    image = rng.integers(60, 200, size=(size, size, 3), dtype=np.uint8)
+    top = image.max(axis=2)
+    image[..., 1] = np.where(green, np.minimum(top.astype(np.int16) + 20, 255), np.minimum(image[..., 1], np.minimum(image[..., 0], image[..., 2])))
+    return image, float(green.mean()) * 100
+
+
+def write_tile(directory, size):
+    image, expected = synthetic_tile(size)
+    path = os.path.join(directory, f"tile_{size}.png")
+    Image.fromarray(image).save(path, compress_level=1)
+    found = calculate_green_percentage(path)
+    if abs(found - expected) > 0.5:
+        raise RuntimeError(f"Foto sintetica {size}x{size}: attesi {expected:.2f}% di verde, trovati {found:.2f}%")
+    return path
+
+
+def build_cases(directory):
+    cases = []
+    for size in TILE_SIZES:
+        path = write_tile(directory, size)
+        cases.append((f"calculate_green_percentage png {size}x{size}", lambda path=path: measure(calculate_green_percentage, (path,), unit="foto")))
+
+    # solo la maschera, senza decodifica del PNG, per ogni indice
+    image = load_rgb_array(os.path.join(directory, "tile_1280.png"))
+    for index in ("rgb", "exg", "vari"):
+        cases.append((f"green_percentage_from_array {index} 1280", lambda index=index: measure(green_percentage_from_array, (image, index), unit="foto")))
+
+    for outer_radius, small_radius in GRIDS:
+        count = len(calculate_circle_centers(outer_radius, small_radius, *CENTER))
+        cases.append((f"calculate_circle_centers {outer_radius}/{small_radius} m", lambda outer_radius=outer_radius, small_radius=small_radius, count=count: measure(calculate_circle_centers, (outer_radius, small_radius, *CENTER), items=count, unit="centri")))
+    return cases
+
+
+if __name__ == "__main__":
+    baseline_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE)
+    with tempfile.TemporaryDirectory() as directory:
+        run_suite(build_cases(directory), baseline_path, UPDATE_BASELINE)
@@ -0,0 +1,92 @@
+# Coded by Pietro Squilla
+# Benchmark end-to-end di GoogleMapRGB.py e Hexagon2.py contro il server stand-in locale:
+# attivita' al secondo, chiamate alle API e tempo totale, senza chiave Google
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import googlemaps
+import requests
+import standin_server
+import GoogleMapRGB
+import Hexagon2
+
+CENTER = (45.4642, 9.19) # centro delle ricerche di prova
+KEYWORD = "ristorante"
+REVIEW_KEYWORD = "verde"
+METERS_PER_CENTIMETER = 5
+RGB_RADIUS_KM = 0.5
+HEXAGON_OUTER_RADIUS_M = 1500
+HEXAGON_SMALL_RADIUS_M = 500
+SERVER_LATENCY = 0.05 # secondi per risposta
+SERVER_ERROR_RATE = 0.01 # frazione di risposte HTTP 500
+PAGE_TOKEN_DELAY = 0.2 # ridotto rispetto ai 2 s di Google per tenere brevi le prove
+QUIET = True # nasconde l'output degli script durante le prove
+SCREEN_TOP_N = 50 # attività affinate nello scenario con screening
+
+
+def server_stats(base_url):
+    return requests.get(f"{base_url}/stats").json()
+
+
+def run_scenario(name, base_url, func, *args, **kwargs):
+    before = server_stats(base_url)
+    output = io.StringIO() if QUIET else sys.stdout
+    with contextlib.redirect_stdout(output):
+        try:
+            summary = func(*args, **kwargs)
+        except Exception as e:
+            # es. GoogleMapRGB non ritenta le ricerche Places fallite
+            summary = {"places": 0, "errors": 1, "elapsed": 0.0, "failure": f"{type(e).__name__}: {e}"}
+    after = server_stats(base_url)
+    calls = {key: after[key] - before[key] for key in after}
+    return {"name": name, "summary": summary, "calls": calls}
+
+
+def print_results(results):
+    print(f"{'scenario':<28}{'tempo s':>9}{'attivita':>10}{'att./s':>9}{'nearby':>8}{'details':>9}{'mappe':>7}{'errori':>8}")
+    for result in results:
+        summary = result["summary"]
+        calls = result["calls"]
+        rate = summary["places"] / summary["elapsed"] if summary["elapsed"] else 0.0
+        print(f"{result['name']:<28}{summary['elapsed']:>9.2f}{summary['places']:>10}{rate:>9.2f}{calls['nearbysearch']:>8}{calls['details']:>9}{calls['staticmap']:>7}{calls['errors']:>8}")
+        if "failure" in summary:
+            print(f"  interrotto: {summary['failure']}")
+
+
+if __name__ == "__main__":
+    server, base_url = standin_server.start_process(LATENCY=SERVER_LATENCY, ERROR_RATE=SERVER_ERROR_RATE, PAGE_TOKEN_DELAY=PAGE_TOKEN_DELAY)
+    client = googlemaps.Client(key="AIza-standin", base_url=base_url, retry_over_query_limit=False)
+    hexagon_client = Hexagon2.make_client("AIza-standin", base_url=base_url) # tentativi solo in retry_with_backoff
+
+    GoogleMapRGB.PAGE_TOKEN_DELAY = PAGE_TOKEN_DELAY
+    GoogleMapRGB.PLACE_DELAY = 0
+    Hexagon2.PAGE_TOKEN_DELAY = PAGE_TOKEN_DELAY
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # report, cache e immagini nella cartella temporanea
+        os.chdir(work_dir)
+
+        results.append(run_scenario("GoogleMapRGB (sequenziale)", base_url, GoogleMapRGB.run_rgb, client, *CENTER, RGB_RADIUS_KM, KEYWORD, REVIEW_KEYWORD, METERS_PER_CENTIMETER, output_file="rgb.html"))
+
+        # prima esecuzione a cache vuote, poi la stessa ricerca con le cache piene (senza diario,
+        # che altrimenti salterebbe l'intero lavoro)
+        Hexagon2.JOURNAL_DIR = None
+        hexagon_args = (hexagon_client, *CENTER, HEXAGON_OUTER_RADIUS_M, HEXAGON_SMALL_RADIUS_M, KEYWORD, REVIEW_KEYWORD, METERS_PER_CENTIMETER)
+        results.append(run_scenario("Hexagon2 (cache vuote)", base_url, Hexagon2.run_hexagon, *hexagon_args, output_file="hexagon_cold.html"))
+        results.append(run_scenario("Hexagon2 (cache piene)", base_url, Hexagon2.run_hexagon, *hexagon_args, output_file="hexagon_warm.html"))
+
+        Hexagon2.PLACES_CACHE_FILE = None
+        Hexagon2.TILE_CACHE_DIR = None
+        results.append(run_scenario("Hexagon2 (senza cache)", base_url, Hexagon2.run_hexagon, *hexagon_args, output_file="hexagon_nocache.html"))
+        # foto ridotte e stima campionata per tutte, piena risoluzione solo per la cima della classifica
+        Hexagon2.SCREENING = True
+        Hexagon2.SCREEN_TOP_N = SCREEN_TOP_N
+        results.append(run_scenario("Hexagon2 (screening)", base_url, Hexagon2.run_hexagon, *hexagon_args, output_file="hexagon_screening.html"))
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    server.terminate()
+    print(f"Server stand-in: latenza {SERVER_LATENCY * 1000:.0f} ms, errori {SERVER_ERROR_RATE * 100:.0f}%, token pagina {PAGE_TOKEN_DELAY} s")
+    print_results(results)
@@ -0,0 +1,8 @@
+# Coded by Pietro Squilla
+# I test importano i moduli della cartella direttamente: common/ va aggiunto al percorso di import
+# come fanno gli script
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")) # moduli condivisi tra Satelliti e Meteoriti
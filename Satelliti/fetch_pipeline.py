@@ -0,0 +1,137 @@
+# Coded by Pietro Squilla
+# Pipeline concorrente per le richieste alle API con limitatore a token bucket
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+from run_metrics import timed, count
+
+TRANSIENT_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"} # stati delle API che un nuovo tentativo puo' risolvere
+TRANSIENT_HTTP_CODES = {429, 500, 502, 503, 504} # codici HTTP da ritentare
+
+
+class TokenBucket:
+    # rate = token (richieste) al secondo, capacity = raffica massima consentita
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def is_transient(error):
+    # timeout, errori di rete, HTTP 429/5xx e quota momentaneamente esaurita; INVALID_REQUEST,
+    # REQUEST_DENIED, chiave non valida e gli altri 4xx non cambiano ritentando
+    if isinstance(error, ApiError):
+        return error.status in TRANSIENT_STATUSES
+    if isinstance(error, HTTPError):
+        return error.status_code in TRANSIENT_HTTP_CODES
+    if isinstance(error, (Timeout, TransportError)):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TRANSIENT_HTTP_CODES
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+def retry_with_backoff(func, *args, limiter=None, retries=5, base_delay=1.0, max_delay=60.0, retry_if=is_transient, **kwargs):
+    # ritenta func con attesa esponenziale (con jitter) se retry_if(errore) e' vero; ogni tentativo
+    # prende un token dal limiter; rilancia subito gli errori definitivi e l'ultimo a tentativi esauriti
+    attempt = 0
+    while True:
+        if limiter is not None:
+            with timed("attesa_limitatore"):
+                limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            attempt += 1
+            if attempt > retries or not retry_if(error):
+                count("richieste_fallite")
+                raise
+            count("retry")
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            with timed("attesa_retry"):
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+class BackgroundWriter:
+    # scritture su disco in un thread dedicato, cosi' l'analisi non aspetta il disco;
+    # max_pending limita i contenuti in attesa (e quindi la memoria occupata dai buffer)
+    def __init__(self, max_pending=64):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.errors = []
+        self.written = 0
+
+    def submit(self, func, *args):
+        self.slots.acquire()
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.slots.release()
+        error = future.exception()
+        if error is not None:
+            self.errors.append(error)
+        else:
+            self.written += 1
+
+    def close(self):
+        # attende le scritture in coda; restituisce gli errori incontrati
+        self.executor.shutdown(wait=True)
+        return self.errors
+
+
+def run_pipeline(items, worker, max_workers=8, max_pending=None):
+    # esegue worker(item) su un pool di thread limitando i task in volo;
+    # restituisce (indice, risultato, errore) man mano che i task terminano
+    if max_pending is None:
+        max_pending = max_workers * 2
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        iterator = iter(enumerate(items))
+        exhausted = False
+
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        index, item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(worker, item)] = index
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    yield index, (None if error else future.result()), error
+        finally:
+            # interruzione (es. Ctrl-C): non avviare i task ancora in coda
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,152 @@
+# Coded by Pietro Squilla
+# Analisi vettorializzata della copertura verde nelle foto satellitari
+
+import threading
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# indici di vegetazione disponibili:
+#     "rgb"  -> regola originale, pixel verde se G > R e G > B
+#     "exg"  -> Excess Green, 2G - R - B (valori 0-255)
+#     "vari" -> Visible Atmospherically Resistant Index, (G - R) / (G + R - B)
+GREEN_INDICES = ("rgb", "exg", "vari")
+
+# soglie di default per gli indici continui
+DEFAULT_THRESHOLDS = {
+    "exg": 20,
+    "vari": 0.05,
+}
+
+SAMPLE_STRIDE = 8 # passo iniziale (righe e colonne) della stima a campione
+SAMPLE_MAX_ERROR = 1.0 # errore massimo della stima a campione, in punti percentuali (95%)
+Z_95 = 1.96
+
+scratch = threading.local() # maschere booleane riutilizzate da ogni thread per l'indice "rgb"
+
+
+def load_rgb_array(image_path):
+    image = Image.open(image_path).convert('RGB') # forza l'rgb a prescindere
+    return np.asarray(image)
+
+
+def green_mask(image_data, index="rgb", threshold=None):
+    # accetta sia una singola immagine (H, W, 3) sia una pila (N, H, W, 3)
+    if index not in GREEN_INDICES:
+        raise ValueError(f"Indice di vegetazione sconosciuto: {index}")
+
+    red = image_data[..., 0]
+    green = image_data[..., 1]
+    blue = image_data[..., 2]
+
+    if index == "rgb":
+        # confronto diretto su uint8, nessuna copia in virgola mobile
+        return (green > red) & (green > blue)
+
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS[index]
+
+    if index == "exg":
+        exg = 2 * green.astype(np.int16) - red - blue
+        return exg > threshold
+
+    # vari
+    red = red.astype(np.float32)
+    green = green.astype(np.float32)
+    blue = blue.astype(np.float32)
+    denominator = green + red - blue
+    vari = np.divide(green - red, denominator, out=np.zeros_like(denominator), where=denominator != 0)
+    return vari > threshold
+
+
+def green_percentage_from_array(image_data, index="rgb", threshold=None):
+    if index == "rgb" and image_data.ndim == 3:
+        # G > R e G > B scritti in due buffer del thread: nessuna allocazione per foto della stessa dimensione
+        shape = image_data.shape[:2]
+        if getattr(scratch, "shape", None) != shape:
+            scratch.shape = shape
+            scratch.first = np.empty(shape, dtype=bool)
+            scratch.second = np.empty(shape, dtype=bool)
+        green = image_data[..., 1]
+        np.greater(green, image_data[..., 0], out=scratch.first)
+        np.greater(green, image_data[..., 2], out=scratch.second)
+        np.logical_and(scratch.first, scratch.second, out=scratch.first)
+        return float(np.count_nonzero(scratch.first)) / scratch.first.size * 100
+    mask = green_mask(image_data, index, threshold)
+    return float(np.count_nonzero(mask)) / mask.size * 100
+
+
+def green_percentage_from_image(image, index="rgb", threshold=None):
+    # PIL.Image gia' decodificata; con palette (PNG a 8 bit, il formato predefinito delle Static Maps)
+    # l'indice si valuta sulle sole 256 voci e si contano i pixel per voce, senza espandere in RGB
+    if image.mode == "P":
+        indices = np.asarray(image)
+        counts = np.bincount(indices.ravel(), minlength=256)
+        return float(counts[palette_lut(image, index, threshold)].sum()) / indices.size * 100
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return green_percentage_from_array(np.asarray(image), index, threshold)
+
+
+def palette_lut(image, index="rgb", threshold=None):
+    # maschera di verde per le 256 voci della palette (voci mancanti nere, come convert("RGB"))
+    entries = np.array(image.getpalette("RGB") or [], dtype=np.uint8).reshape(-1, 3)[:256]
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    palette[:len(entries)] = entries
+    return green_mask(palette, index, threshold)
+
+
+def sampled_green_percentage(image, index="rgb", threshold=None, max_error=SAMPLE_MAX_ERROR, stride=SAMPLE_STRIDE):
+    # stima sui pixel di una griglia a passo stride, dimezzato finche' l'errore supera max_error;
+    # restituisce (percentuale, errore, passo usato), con passo 1 il valore e' esatto ed errore 0.
+    # L'errore e' l'intervallo binomiale al 95% (Agresti-Coull) del campione: vale per la foto
+    # analizzata, non per la differenza tra una foto a risoluzione ridotta e quella piena
+    if image.mode == "P":
+        lut = palette_lut(image, index, threshold)
+        data = np.asarray(image)
+        classify = lambda sample: lut[sample]
+    else:
+        data = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        classify = lambda sample: green_mask(sample, index, threshold)
+    stride = max(1, int(stride))
+    while True:
+        sample = data[::stride, ::stride]
+        n = sample.shape[0] * sample.shape[1]
+        green = int(np.count_nonzero(classify(sample)))
+        if stride == 1:
+            return green / n * 100, 0.0, 1
+        adjusted = (green + Z_95 ** 2 / 2) / (n + Z_95 ** 2)
+        error = Z_95 * np.sqrt(adjusted * (1 - adjusted) / (n + Z_95 ** 2)) * 100
+        if error <= max_error:
+            return green / n * 100, float(error), stride
+        stride //= 2
+
+
+def decode_image(data):
+    # decodifica unica dei byte scaricati (o letti dalla cache), senza passare dal disco
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image
+
+
+def calculate_green_percentage(image_path, index="rgb", threshold=None):
+    with Image.open(image_path) as image:
+        return green_percentage_from_image(image, index, threshold)
+
+
+def calculate_green_percentages(images, index="rgb", threshold=None):
+    # batch: accetta una pila (N, H, W, 3) oppure una lista di percorsi/array
+    if isinstance(images, np.ndarray) and images.ndim == 4:
+        stack = images
+    else:
+        arrays = [load_rgb_array(image) if isinstance(image, str) else np.asarray(image)[..., :3] for image in images]
+        if not arrays:
+            return np.zeros(0)
+        if len({array.shape for array in arrays}) > 1:
+            # dimensioni diverse: niente pila, un'immagine alla volta
+            return np.array([green_percentage_from_array(array, index, threshold) for array in arrays])
+        stack = np.stack(arrays)
+
+    mask = green_mask(stack, index, threshold)
+    pixels_per_image = mask.shape[1] * mask.shape[2]
+    return np.count_nonzero(mask.reshape(mask.shape[0], -1), axis=1) / pixels_per_image * 100
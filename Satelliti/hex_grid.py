@@ -0,0 +1,177 @@
+# Coded by Pietro Squilla
+# Generazione vettorializzata (NumPy) della griglia esagonale di ricerca su cerchio o poligono GeoJSON
+
+import json
+import numpy as np
+
+R = 6371 # raggio della terra in km
+KM_PER_DEGREE = R * np.pi / 180
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def destination_point(lat, lon, distance, angle):
+    d = np.asarray(distance) / R
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    angle = np.radians(angle)
+
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(d) + np.cos(lat1) * np.sin(d) * np.cos(angle))
+    lon2 = lon1 + np.arctan2(np.sin(angle) * np.sin(d) * np.cos(lat1), np.cos(d) - np.sin(lat1) * np.sin(lat2))
+    return np.degrees(lat2), np.degrees(lon2)
+
+
+def hex_offsets(small_radius):
+    # passo della griglia (km) per cerchi di raggio small_radius (km) che coprono il piano
+    angle = 60
+    circumscribed_radius = small_radius / np.cos(np.radians(angle / 2))
+    y_offset = np.sqrt(3) * circumscribed_radius
+    x_offset = 2 * circumscribed_radius * np.cos(np.radians(angle))
+    return x_offset, y_offset
+
+
+def hex_grid(center_latitude, center_longitude, small_radius, half_width, half_height, max_radius=None):
+    # centri esagonali (km) attorno all'origine; con max_radius scarta subito le celle fuori dal disco
+    x_offset, y_offset = hex_offsets(small_radius)
+    rows = int(np.ceil(half_height / y_offset)) + 1
+    cols = int(np.ceil(half_width / x_offset)) + 1
+
+    i, j = np.meshgrid(np.arange(-rows, rows + 1), np.arange(-cols, cols + 1), indexing="ij")
+    lat_shift = i * y_offset + y_offset / 2 * (j % 2)
+    lon_shift = j * x_offset
+
+    if max_radius is not None:
+        # spostamento di a verso nord e poi di b verso est: triangolo sferico rettangolo, quindi la distanza
+        # dal centro e' esattamente R acos(cos(a/R) cos(b/R)); il millimetro di tolleranza lascia decidere
+        # alla haversine finale i centri sul bordo
+        inside = np.cos(lat_shift / R) * np.cos(lon_shift / R) >= np.cos((max_radius + 1e-6) / R)
+        lat_shift = lat_shift[inside]
+        lon_shift = lon_shift[inside]
+
+    lat_shift = lat_shift.ravel()
+    lon_shift = lon_shift.ravel()
+    lat_new, lon_new = destination_point(center_latitude, center_longitude, lat_shift, 0)
+    lat_new, lon_new = destination_point(lat_new, lon_new, lon_shift, 90)
+    return np.column_stack((lat_new, lon_new))
+
+
+def calculate_circle_centers(outer_radius, small_radius, center_latitude, center_longitude):
+    # raggi in metri come nello script originale; restituisce un array (N, 2) di (lat, lng)
+    outer_radius /= 1000
+    small_radius /= 1000
+
+    centers = hex_grid(center_latitude, center_longitude, small_radius, outer_radius, outer_radius, max_radius=outer_radius)
+    # distanze su una sfera
+    inside = haversine_distance(center_latitude, center_longitude, centers[:, 0], centers[:, 1]) <= outer_radius
+    return centers[inside]
+
+
+def load_geojson_polygons(geojson):
+    # accetta un percorso o un dizionario GeoJSON (FeatureCollection, Feature, Polygon, MultiPolygon);
+    # restituisce una lista di poligoni, ciascuno lista di anelli (M, 2) in (lng, lat)
+    if isinstance(geojson, str):
+        with open(geojson, "r", encoding="utf-8") as f:
+            geojson = json.load(f)
+
+    kind = geojson["type"]
+    if kind == "FeatureCollection":
+        return [polygon for feature in geojson["features"] for polygon in load_geojson_polygons(feature)]
+    if kind == "Feature":
+        return load_geojson_polygons(geojson["geometry"])
+    if kind == "Polygon":
+        return [[np.asarray(ring, dtype=float)[:, :2] for ring in geojson["coordinates"]]]
+    if kind == "MultiPolygon":
+        return [[np.asarray(ring, dtype=float)[:, :2] for ring in polygon] for polygon in geojson["coordinates"]]
+    raise ValueError(f"Geometria GeoJSON non supportata: {kind}")
+
+
+def points_in_polygons(lats, lngs, polygons):
+    # ray casting pari/dispari (i buchi sono anelli interni), vettorializzato sui punti
+    result = np.zeros(lats.shape, dtype=bool)
+    for polygon in polygons:
+        inside = np.zeros(lats.shape, dtype=bool)
+        for ring in polygon:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            for ax, ay, bx, by in zip(x1, y1, x2, y2):
+                if ay == by:
+                    continue
+                crosses = (ay > lats) != (by > lats)
+                x_cross = ax + (lats - ay) * (bx - ax) / (by - ay)
+                inside ^= crosses & (lngs < x_cross)
+        result |= inside
+    return result
+
+
+def distance_to_rings(lats, lngs, polygons):
+    # distanza minima (km) dei punti dai lati degli anelli, in proiezione equirettangolare locale
+    lng_scale = KM_PER_DEGREE * np.cos(np.radians(lats))
+    best = np.full(lats.shape, np.inf)
+    for polygon in polygons:
+        for ring in polygon:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            for ax, ay, bx, by in zip(x1, y1, x2, y2):
+                px, py = (ax - lngs) * lng_scale, (ay - lats) * KM_PER_DEGREE
+                dx, dy = (bx - ax) * lng_scale, (by - ay) * KM_PER_DEGREE
+                length = dx ** 2 + dy ** 2
+                if ax == bx and ay == by:
+                    t = 0.0 # anello chiuso: l'ultimo vertice ripete il primo
+                else:
+                    t = np.clip(-(px * dx + py * dy) / length, 0, 1)
+                best = np.minimum(best, np.hypot(px + t * dx, py + t * dy))
+    return best
+
+
+def polygon_bounds(polygons):
+    # (min_lat, min_lng, max_lat, max_lng) degli anelli esterni
+    points = np.concatenate([polygon[0] for polygon in polygons])
+    min_lng, min_lat = points.min(axis=0)
+    max_lng, max_lat = points.max(axis=0)
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def polygon_center(geojson):
+    # centro del riquadro che contiene l'area di studio (per il calcolo dello zoom)
+    min_lat, min_lng, max_lat, max_lng = polygon_bounds(load_geojson_polygons(geojson))
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def grid_half_extents(center_latitude, center_longitude, min_lat, min_lng, max_lat, max_lng, reach):
+    # semiampiezze (km) della griglia "prima a nord, poi a est" che raggiunge ogni punto del riquadro
+    # e ogni centro entro reach km da esso: b e' la distanza dal meridiano del centro, a la posizione del
+    # piede della perpendicolare su quel meridiano; sul riquadro gli estremi cadono agli angoli, sul
+    # meridiano del centro o all'equatore
+    lats = [min_lat, max_lat] + ([0.0] if min_lat <= 0 <= max_lat else [])
+    lngs = [min_lng - center_longitude, 0.0, max_lng - center_longitude]
+    lats, dlngs = np.radians(np.meshgrid(lats, lngs))
+    b = np.arcsin(np.cos(lats) * np.abs(np.sin(dlngs)))
+    a = np.arctan2(np.sin(lats), np.cos(lats) * np.cos(dlngs)) - np.radians(center_latitude)
+    # in queste coordinate ds^2 = db^2 + cos^2(b) da^2: lontano dal meridiano a varia piu' della distanza
+    max_b = b.max() + reach / R
+    return R * b.max() + reach, R * np.abs(a).max() + reach / np.cos(max_b)
+
+
+def calculate_polygon_centers(geojson, small_radius):
+    # raggio in metri; centri delle celle il cui cerchio tocca l'area di studio (centro dentro
+    # o a meno di small_radius da un lato)
+    small_radius /= 1000
+    polygons = load_geojson_polygons(geojson)
+    min_lat, min_lng, max_lat, max_lng = polygon_bounds(polygons)
+
+    center_latitude = (min_lat + max_lat) / 2
+    center_longitude = (min_lng + max_lng) / 2
+    half_width, half_height = grid_half_extents(center_latitude, center_longitude, min_lat, min_lng, max_lat, max_lng, small_radius)
+
+    centers = hex_grid(center_latitude, center_longitude, small_radius, half_width, half_height)
+    lats, lngs = centers[:, 0], centers[:, 1]
+    keep = points_in_polygons(lats, lngs, polygons)
+    outside = ~keep
+    keep[outside] = distance_to_rings(lats[outside], lngs[outside], polygons) <= small_radius
+    return centers[keep]
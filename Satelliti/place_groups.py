@@ -0,0 +1,44 @@
+# Coded by Pietro Squilla
+# Raggruppamento dei luoghi Places vicini: doppioni da unire e foto satellitari condivise
+
+import numpy as np
+from spatial_index import SpatialIndex
+
+
+def place_coordinates(places):
+    lats = np.array([place["geometry"]["location"]["lat"] for place in places], dtype=float)
+    lngs = np.array([place["geometry"]["location"]["lng"] for place in places], dtype=float)
+    return lats, lngs
+
+
+def dedup_places(places, merge_distance=0):
+    # rimuove i doppioni per place_id e, se merge_distance > 0 (metri), unisce i luoghi piu' vicini
+    # di merge_distance tenendo il primo e annotando gli altri in "merged_place_ids"
+    by_id = {}
+    for place in places:
+        by_id.setdefault(place["place_id"], place)
+    unique_places = list(by_id.values())
+    if merge_distance <= 0 or len(unique_places) < 2:
+        return unique_places
+
+    lats, lngs = place_coordinates(unique_places)
+    leaders = SpatialIndex(lats, lngs, merge_distance).clusters(merge_distance)
+    merged = []
+    for index, place in enumerate(unique_places):
+        leader = leaders[index]
+        if leader == index:
+            merged.append(place)
+        else:
+            unique_places[leader].setdefault("merged_place_ids", []).append(place["place_id"])
+    return merged
+
+
+def assign_shared_tiles(places, share_distance):
+    # i luoghi entro share_distance metri dal capogruppo usano la sua immagine ("tile_center")
+    if share_distance <= 0 or not places:
+        return 0
+    lats, lngs = place_coordinates(places)
+    leaders = SpatialIndex(lats, lngs, share_distance).clusters(share_distance)
+    for index, place in enumerate(places):
+        place["tile_center"] = (float(lats[leaders[index]]), float(lngs[leaders[index]]))
+    return len(np.unique(leaders))
@@ -0,0 +1,115 @@
+# Coded by Pietro Squilla
+# Cache persistente (SQLite) delle risposte delle Places API
+
+import json
+import sqlite3
+import threading
+import time
+
+DAY = 24 * 60 * 60
+EVICTION_INTERVAL = 100 # inserimenti tra due controlli di scadenza/dimensione
+
+
+def make_key(key):
+    # chiave stabile a partire da tuple/liste/dizionari serializzabili
+    return json.dumps(key, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def cached_call(cache, key, func, *args, **kwargs):
+    # chiama func solo se la chiave non e' in cache (cache None = nessuna cache)
+    if cache is None:
+        return func(*args, **kwargs)
+    value = cache.get(key)
+    if value is None:
+        value = func(*args, **kwargs)
+        cache.set(key, value)
+    return value
+
+
+class PlacesCache:
+    # clock: sorgente dell'ora in secondi (time.time), sostituibile nei test
+    def __init__(self, path="places_cache.sqlite", ttl=30 * DAY, max_entries=200000, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.inserts = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.connection.commit()
+
+    def get(self, key):
+        key = make_key(key)
+        now = self.clock()
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if now - created > self.ttl:
+                self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.connection.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        key = make_key(key)
+        now = self.clock()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self.inserts += 1
+            if self.inserts % EVICTION_INTERVAL == 0:
+                self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        # rimuove le voci scadute e poi le meno usate di recente oltre il limite
+        cursor = self.connection.execute("DELETE FROM cache WHERE created < ?", (self.clock() - self.ttl,))
+        self.expired += cursor.rowcount
+        count = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            self.evicted += excess
+
+    def flush(self):
+        with self.lock:
+            self._evict()
+            self.connection.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
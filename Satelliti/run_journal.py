@@ -0,0 +1,130 @@
+# Coded by Pietro Squilla
+# Diario append-only delle esecuzioni: permette di riprendere un'analisi interrotta
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def run_id(params):
+    # stessa ricerca (stessi parametri) -> stesso diario
+    encoded = json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+def cell_key(cell):
+    lat, lng, radius = cell
+    return f"{lat:.6f},{lng:.6f},{radius:.4f}"
+
+
+class RunJournal:
+    def __init__(self, directory, params, flush_every=50, flush_interval=5.0, max_age=None):
+        # si riprende solo un'esecuzione interrotta: un diario completato, o piu' vecchio di max_age
+        # secondi (es. il TTL della cache Places), viene scartato e l'esecuzione riparte da zero
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"run_{run_id(params)}.jsonl")
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.cells = {}
+        self.places = {}
+        self.discarded = None # motivo per cui il diario trovato non e' stato ripreso
+        self.lock = threading.Lock()
+        self._load()
+
+        self.file = open(self.path, "a", encoding="utf-8")
+        if self.file.tell() == 0:
+            self._write({"type": "run", "params": params, "started": time.time()})
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    break # ultima riga troncata da un'interruzione
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+                if record["type"] == "run" and self.max_age is not None and time.time() - record["started"] > self.max_age:
+                    self.discarded = "scaduto"
+                    break
+                if record["type"] == "done":
+                    # esecuzione terminata ma diario non rimosso (interruzione durante complete)
+                    self.discarded = "completato"
+                    break
+                if record["type"] == "cell":
+                    self.cells[record["key"]] = record["places"]
+                elif record["type"] == "place":
+                    self.places[record["place_id"]] = record["data"]
+        if self.discarded is not None:
+            self.cells = {}
+            self.places = {}
+            valid_size = 0
+        # scarta la coda incompleta prima di riprendere ad accodare
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_size)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def cell_result(self, cell):
+        return self.cells.get(cell_key(cell))
+
+    def place_result(self, place_id):
+        return self.places.get(place_id)
+
+    def record_cell(self, cell, places):
+        key = cell_key(cell)
+        with self.lock:
+            self.cells[key] = places
+            self._write({"type": "cell", "key": key, "places": places})
+            self._maybe_flush()
+
+    def record_place(self, place_id, data):
+        with self.lock:
+            self.places[place_id] = data
+            self._write({"type": "place", "place_id": place_id, "data": data})
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        # fsync a blocchi: al piu' flush_every record o flush_interval secondi persi in caso di crash
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush()
+                self.file.close()
+
+    def complete(self):
+        # esecuzione terminata: marcatore di fine e rimozione del diario (il marcatore basta a non
+        # riprenderlo se la rimozione non avviene)
+        with self.lock:
+            if not self.file.closed:
+                self._write({"type": "done", "finished": time.time()})
+                self._flush()
+                self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,48 @@
+# Coded by Pietro Squilla
+# Seconda passata dello screening: quali attività stimate sulle foto ridotte rifare a piena risoluzione
+
+
+def select_for_refinement(places_data, sort_key, top_n, margin=0.0):
+    # place_id delle prime top_n attività stimate e di quelle che, entro l'errore (piu' margin per le
+    # stime), potrebbero superare l'ultima selezionata; places_data: {place_id: dati}
+    def spread(place_data):
+        return place_data.get("green_error", 0.0) + (margin if place_data.get("screened") else 0.0)
+
+    ranked = sorted(places_data.items(), key=lambda item: sort_key(item[1]))
+    if len(ranked) <= top_n:
+        selected = ranked
+    else:
+        cutoff = ranked[top_n - 1][1]
+        floor = cutoff["green_percentage"] - spread(cutoff)
+        selected = ranked[:top_n] + [item for item in ranked[top_n:] if item[1]["green_percentage"] + spread(item[1]) >= floor]
+    # le attività gia' a piena risoluzione (es. riprese dal diario) non si rifanno
+    return [place_id for place_id, place_data in selected if place_data.get("screened")]
+
+
+def refine_screened(places_data, refine_batch, sort_key, top_n, margin_factor, max_fraction, on_refined=None):
+    # al massimo due turni: le prime top_n (piu' quelle vicine entro l'errore di campionamento), poi una sola
+    # estensione con lo scarto tra stima e piena risoluzione misurato nel primo turno, per margin_factor;
+    # in tutto non piu' di max(top_n, max_fraction delle attività).
+    # refine_batch(place_ids, margin) produce (place_id, dati a piena risoluzione, o None se falliti);
+    # on_refined(place_id, dati aggiornati) dopo ogni affinamento; restituisce i place_id tentati
+    limit = max(top_n, int(len(places_data) * max_fraction))
+    attempted = []
+    margin = 0.0
+    for first_round in (True, False):
+        refine_ids = [place_id for place_id in select_for_refinement(places_data, sort_key, top_n, margin * margin_factor) if place_id not in attempted]
+        refine_ids = refine_ids[:limit - len(attempted)]
+        if not refine_ids:
+            break
+        attempted.extend(refine_ids)
+        measured = 0.0
+        for place_id, image_data in refine_batch(refine_ids, margin * margin_factor):
+            if image_data is None:
+                continue # resta la stima della prima passata
+            estimate = places_data[place_id]
+            measured = max(measured, abs(image_data["green_percentage"] - estimate["green_percentage"]) - estimate["green_error"])
+            estimate.update(image_data)
+            if on_refined is not None:
+                on_refined(place_id, estimate)
+        if first_round:
+            margin = measured
+    return attempted
@@ -0,0 +1,249 @@
+# Coded by Pietro Squilla
+# Server locale che imita Places API (nearbysearch a pagine, details) e Static Maps,
+# con latenza ed errori configurabili: permette di provare e misurare gli script senza chiave Google
+
+import json
+import math
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from PIL import Image
+
+R = 6371000 # raggio della terra in metri
+PLACES_PER_KM2 = 40 # densita' delle attivita' simulate (all'equatore, cresce di 1/cos(lat) verso i poli)
+CELL_SIZE_M = 250 # lato delle celle in cui vengono generate le attivita'
+PAGE_SIZE = 20 # risultati per pagina, come le Places API
+MAX_RESULTS = 60 # limite di risultati per ricerca, come le Places API
+PAGE_TOKEN_DELAY = 2.0 # secondi prima che next_page_token diventi valido
+LATENCY = 0.05 # latenza media di ogni risposta in secondi
+LATENCY_JITTER = 0.5 # variazione relativa della latenza (0.5 = +-50%)
+ERROR_RATE = 0.0 # frazione di risposte HTTP 500
+OVER_QUERY_LIMIT_RATE = 0.0 # frazione di risposte OVER_QUERY_LIMIT
+REVIEW_WORDS = ["ottimo", "giardino", "parcheggio", "verde", "piscina", "servizio", "prezzi", "terrazza"]
+
+
+def cell_places(cx, cy, density=PLACES_PER_KM2, cell_size=CELL_SIZE_M):
+    # attivita' deterministiche di una cella (coordinate in metri lungo meridiano ed equatore)
+    rng = random.Random(cx * 1000003 + cy)
+    expected = density * (cell_size / 1000.0) ** 2
+    count = int(expected) + (1 if rng.random() < expected - int(expected) else 0)
+    places = []
+    for k in range(count):
+        x = (cx + rng.random()) * cell_size
+        y = (cy + rng.random()) * cell_size
+        places.append((f"standin_{cx}_{cy}_{k}", y, x))
+    return places
+
+
+def to_meters(lat, lng):
+    # piano fisso (senza il coseno della latitudine della ricerca): ogni attivita' ha sempre le
+    # stesse coordinate, qualunque sia la ricerca che la trova
+    return math.radians(lat) * R, math.radians(lng) * R
+
+
+def to_degrees(y, x):
+    return math.degrees(y / R), math.degrees(x / R)
+
+
+def nearby_places(lat, lng, radius, keyword=""):
+    # attivita' entro radius metri, dalla piu' vicina, come lista di risultati Places
+    y0, x0 = to_meters(lat, lng)
+    cos_lat = math.cos(math.radians(lat))
+    reach_y = int(math.ceil(radius / CELL_SIZE_M))
+    reach_x = int(math.ceil(radius / (CELL_SIZE_M * cos_lat)))
+    cx0, cy0 = int(math.floor(x0 / CELL_SIZE_M)), int(math.floor(y0 / CELL_SIZE_M))
+    found = []
+    for cx in range(cx0 - reach_x, cx0 + reach_x + 1):
+        for cy in range(cy0 - reach_y, cy0 + reach_y + 1):
+            for place_id, y, x in cell_places(cx, cy):
+                distance = math.hypot((x - x0) * cos_lat, y - y0)
+                if distance <= radius:
+                    found.append((distance, place_id, y, x))
+    found.sort()
+    results = []
+    for _, place_id, y, x in found:
+        place_lat, place_lng = to_degrees(y, x)
+        results.append({
+            "place_id": place_id,
+            "name": f"{keyword or 'Attivita'} {place_id[8:]}",
+            "geometry": {"location": {"lat": place_lat, "lng": place_lng}},
+        })
+    return results
+
+
+def place_details(place_id):
+    rng = random.Random(place_id)
+    reviews = []
+    for _ in range(rng.randint(0, 5)):
+        words = rng.sample(REVIEW_WORDS, 3)
+        reviews.append({"author_name": f"Utente {rng.randint(1, 9999)}", "text": " ".join(words), "rating": rng.randint(1, 5)})
+    return {
+        "name": f"Attivita {place_id[8:]}",
+        "formatted_address": f"Via Simulata {rng.randint(1, 200)}, Stand-in",
+        "formatted_phone_number": f"+39 0{rng.randint(100000000, 999999999)}",
+        "website": f"https://{place_id}.example",
+        "rating": round(rng.uniform(1, 5), 1),
+        "reviews": reviews,
+    }
+
+
+def static_map_png(lat, lng, size, scale, image_format="png"):
+    # immagine sintetica con chiazze di verde, ripetibile per lo stesso centro; come le Static Maps,
+    # scale cambia solo la densita' dei pixel (stesso contenuto), "png" e "png8" sono PNG a 8 bit
+    # con palette, "png32" a colori pieni
+    base_width, base_height = (int(value) for value in size.split("x"))
+    width, height = base_width * scale, base_height * scale
+    rng = np.random.default_rng(abs(hash((round(lat, 6), round(lng, 6)))) % 2 ** 32)
+    small = rng.integers(0, 256, size=(base_height // 16 + 1, base_width // 16 + 1, 3), dtype=np.uint8)
+    small[..., 1] = np.maximum(small[..., 1], rng.integers(0, 256, size=small.shape[:2], dtype=np.uint8))
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    if image_format != "png32":
+        image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class StandinState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {} # token -> (istante di validita', risultati restanti)
+        self.calls = {"nearbysearch": 0, "details": 0, "staticmap": 0, "errors": 0, "invalid_tokens": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.calls)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    state = None # StandinState del server
+
+    def log_message(self, format, *args):
+        pass # niente log per richiesta
+
+    def send_json(self, payload, code=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/stats":
+            self.send_json(self.state.stats())
+            return
+
+        time.sleep(max(0.0, LATENCY * random.uniform(1 - LATENCY_JITTER, 1 + LATENCY_JITTER)))
+        roll = random.random()
+        if roll < ERROR_RATE:
+            self.state.count("errors")
+            self.send_json({"status": "UNKNOWN_ERROR"}, 500)
+            return
+        if roll < ERROR_RATE + OVER_QUERY_LIMIT_RATE:
+            self.state.count("errors")
+            self.send_json({"status": "OVER_QUERY_LIMIT", "results": []})
+            return
+
+        if url.path == "/maps/api/place/nearbysearch/json":
+            self.state.count("nearbysearch")
+            self.nearby(params)
+        elif url.path == "/maps/api/place/details/json":
+            self.state.count("details")
+            # googlemaps invia "placeid", la documentazione delle API "place_id"
+            self.send_json({"status": "OK", "result": place_details(params.get("placeid", params.get("place_id", "")))})
+        elif url.path == "/maps/api/staticmap":
+            self.state.count("staticmap")
+            lat, lng = (float(value) for value in params["center"].split(","))
+            body = static_map_png(lat, lng, params.get("size", "640x640"), int(params.get("scale", 1)), params.get("format", "png"))
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json({"status": "NOT_FOUND"}, 404)
+
+    def nearby(self, params):
+        if "pagetoken" in params:
+            with self.state.lock:
+                entry = self.state.tokens.get(params["pagetoken"])
+                if entry is not None and time.monotonic() >= entry[0]:
+                    del self.state.tokens[params["pagetoken"]]
+            if entry is None or time.monotonic() < entry[0]:
+                # come Google: token sconosciuto o chiesto troppo presto
+                self.state.count("invalid_tokens")
+                self.send_json({"status": "INVALID_REQUEST", "results": []})
+                return
+            results = entry[1]
+        else:
+            lat, lng = (float(value) for value in params["location"].split(","))
+            results = nearby_places(lat, lng, float(params.get("radius", 1000)), params.get("keyword", ""))[:MAX_RESULTS]
+
+        payload = {"status": "OK" if results else "ZERO_RESULTS", "results": results[:PAGE_SIZE]}
+        if len(results) > PAGE_SIZE:
+            token = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.tokens[token] = (time.monotonic() + PAGE_TOKEN_DELAY, results[PAGE_SIZE:])
+            payload["next_page_token"] = token
+        self.send_json(payload)
+
+
+def serve(port, host="127.0.0.1", **settings):
+    # server nel processo corrente fino all'interruzione; settings: LATENCY, ERROR_RATE, ... di questo modulo
+    globals().update(settings)
+    server, _ = start_server(host, port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def start_process(host="127.0.0.1", **settings):
+    # server in un processo separato, per non sottrarre CPU (e GIL) allo script misurato;
+    # restituisce (processo, base_url); le statistiche sono su base_url + "/stats"
+    with socket.socket() as probe:
+        probe.bind((host, 0))
+        port = probe.getsockname()[1]
+    process = multiprocessing.Process(target=serve, args=(port, host), kwargs=settings, daemon=True)
+    process.start()
+    base_url = f"http://{host}:{port}"
+    for _ in range(100):
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                break
+        except OSError:
+            time.sleep(0.05)
+    return process, base_url
+
+
+def start_server(host="127.0.0.1", port=0):
+    # avvia il server in un thread; restituisce (server, base_url) da passare a googlemaps.Client(base_url=...)
+    state = StandinState()
+    handler = type("Handler", (StandinHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = 8765
+    print(f"Server stand-in in ascolto su http://127.0.0.1:{port} (Ctrl-C per terminare)")
+    print(f"  googlemaps.Client(key=\"AIza-standin\", base_url=\"http://127.0.0.1:{port}\")")
+    serve(port)
@@ -0,0 +1,22 @@
+# Coded by Pietro Squilla
+# Test del confronto con la griglia fissa: pagine per cerchio secondo i luoghi che contiene
+
+import numpy as np
+from adaptive_search import fixed_grid_calls
+
+METER = 1 / 111195.0 # gradi di latitudine per metro
+
+
+def places_around(lat, lng, count, spread_m=50.0, prefix="p"):
+    rng = np.random.default_rng(count)
+    offsets = rng.uniform(-spread_m, spread_m, (count, 2)) * METER
+    return [{"place_id": f"{prefix}{i}", "geometry": {"location": {"lat": lat + north, "lng": lng + east}}} for i, (north, east) in enumerate(offsets)]
+
+
+def test_pages_follow_the_places_in_each_circle():
+    centers = np.array([[45.0, 9.0], [45.02, 9.0], [45.04, 9.0]])
+    places = places_around(45.0, 9.0, 45, prefix="a") + places_around(45.02, 9.0, 200, prefix="b")
+    # 45 luoghi: 3 pagine; 200 oltre il limite di 60: 3 pagine; cerchio vuoto: 1 chiamata
+    assert fixed_grid_calls(centers, 0.5, places) == 3 + 3 + 1
+    assert fixed_grid_calls(centers, 0.5, places[:20]) == 1 + 1 + 1
+    assert fixed_grid_calls(centers, 0.5, []) == 3
@@ -0,0 +1,160 @@
+# Coded by Pietro Squilla
+# Test della pipeline concorrente: token bucket, tentativi con attesa esponenziale, task in volo limitati
+# e scritture in background
+
+import threading
+import pytest
+import requests
+from googlemaps.exceptions import ApiError, HTTPError, Timeout
+import fetch_pipeline
+from fetch_pipeline import TokenBucket, BackgroundWriter, is_transient, retry_with_backoff, run_pipeline
+
+
+class FakeTime:
+    # orologio finto: sleep fa avanzare il tempo invece di attendere
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(fetch_pipeline, "time", fake)
+    monkeypatch.setattr(fetch_pipeline.random, "uniform", lambda low, high: high) # jitter al massimo
+    return fake
+
+
+def flaky(failures, error):
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        if len(calls) <= failures:
+            raise error
+        return "ok"
+    return call, calls
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 0.0
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    call, calls = flaky(5, Timeout())
+    assert retry_with_backoff(call, retries=5, base_delay=1.0, max_delay=5.0) == "ok"
+    assert len(calls) == 6
+    assert clock.sleeps == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_last_error_is_raised_when_retries_run_out(clock):
+    call, calls = flaky(10, Timeout())
+    with pytest.raises(Timeout):
+        retry_with_backoff(call, retries=3)
+    assert len(calls) == 4 and len(clock.sleeps) == 3
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize("error, transient", [
+    (ApiError("OVER_QUERY_LIMIT"), True),
+    (ApiError("UNKNOWN_ERROR"), True),
+    (ApiError("REQUEST_DENIED"), False),
+    (ApiError("INVALID_REQUEST"), False),
+    (HTTPError(503), True),
+    (HTTPError(403), False),
+    (http_error(429), True),
+    (http_error(404), False),
+    (requests.ConnectionError(), True),
+    (Timeout(), True),
+    (ValueError(), False),
+])
+def test_transient_errors(error, transient):
+    assert is_transient(error) is transient
+
+
+def test_permanent_errors_are_raised_on_the_first_attempt(clock):
+    call, calls = flaky(1, ApiError("REQUEST_DENIED"))
+    with pytest.raises(ApiError):
+        retry_with_backoff(call)
+    assert len(calls) == 1 and clock.sleeps == []
+
+
+def test_retry_if_decides_what_is_retried(clock):
+    # INVALID_REQUEST si ritenta solo sulle pagine successive, dove il token non e' ancora valido
+    call, calls = flaky(2, ApiError("INVALID_REQUEST"))
+    next_page = lambda error: isinstance(error, ApiError) and error.status == "INVALID_REQUEST"
+    assert retry_with_backoff(call, retry_if=next_page) == "ok"
+    assert len(calls) == 3
+    call, calls = flaky(1, Timeout())
+    with pytest.raises(Timeout):
+        retry_with_backoff(call, retry_if=next_page)
+    assert len(calls) == 1
+
+
+def test_pipeline_bounds_the_tasks_in_flight():
+    pulled = []
+
+    def items():
+        for item in range(20):
+            pulled.append(item)
+            yield item
+
+    results = []
+    for index, result, error in run_pipeline(items(), lambda item: item * item, max_workers=2, max_pending=3):
+        assert len(pulled) - len(results) <= 3 # task inviati e non ancora restituiti
+        results.append((index, result, error))
+    assert sorted(results) == [(item, item * item, None) for item in range(20)]
+
+
+def test_pipeline_yields_index_result_error_as_tasks_finish():
+    release = threading.Event()
+
+    def worker(item):
+        if item == "lento":
+            assert release.wait(5) # finisce solo dopo che gli altri due sono stati restituiti
+        if item == "rotto":
+            raise ValueError(item)
+        return item.upper()
+
+    results = []
+    for result in run_pipeline(["lento", "veloce", "rotto"], worker, max_workers=3):
+        results.append(result)
+        if len(results) == 2:
+            release.set()
+    assert results[-1] == (0, "LENTO", None)
+    by_index = {index: (result, error) for index, result, error in results}
+    assert by_index[1] == ("VELOCE", None)
+    assert by_index[2][0] is None and isinstance(by_index[2][1], ValueError)
+
+
+def test_background_writer_returns_the_failed_writes(tmp_path):
+    def write(name, data):
+        if name == "rotto":
+            raise OSError("disco pieno")
+        (tmp_path / name).write_bytes(data)
+
+    writer = BackgroundWriter(max_pending=2)
+    for name in ("a", "rotto", "b"):
+        writer.submit(write, name, b"x")
+    errors = writer.close()
+    assert [str(error) for error in errors] == ["disco pieno"]
+    assert writer.written == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a", "b"]
@@ -0,0 +1,84 @@
+# Coded by Pietro Squilla
+# Test della griglia esagonale: stessi centri del ciclo originale sul cerchio, copertura e bordo sul poligono
+
+import math
+import numpy as np
+import pytest
+from hex_grid import calculate_circle_centers, calculate_polygon_centers, haversine_distance, KM_PER_DEGREE
+
+
+def original_circle_centers(outer_radius, small_radius, center_latitude, center_longitude):
+    # ciclo dello script originale (Hexagon2.py prima della vettorializzazione)
+    def destination_point(lat, lon, distance, angle):
+        d = distance / 6371
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(math.radians(angle)))
+        lon2 = lon1 + math.atan2(math.sin(math.radians(angle)) * math.sin(d) * math.cos(lat1), math.cos(d) - math.sin(lat1) * math.sin(lat2))
+        return math.degrees(lat2), math.degrees(lon2)
+
+    outer_radius /= 1000
+    small_radius /= 1000
+    circumscribed_radius = small_radius / math.cos(math.radians(30))
+    y_offset = math.sqrt(3) * circumscribed_radius
+    x_offset = 2 * circumscribed_radius * math.cos(math.radians(60))
+    max_grid_width = int(2 * math.ceil(outer_radius / x_offset))
+    max_grid_height = int(2 * math.ceil(outer_radius / y_offset))
+    centers = []
+    for i in range(-max_grid_height, max_grid_height + 1):
+        for j in range(-max_grid_width, max_grid_width + 1):
+            lat_new, lon_new = destination_point(center_latitude, center_longitude, i * y_offset + y_offset / 2 * (j % 2), 0)
+            lat_new, lon_new = destination_point(lat_new, lon_new, j * x_offset, 90)
+            if haversine_distance(center_latitude, center_longitude, lat_new, lon_new) <= outer_radius:
+                centers.append((lat_new, lon_new))
+    return np.array(centers)
+
+
+@pytest.mark.parametrize("outer_radius, small_radius, lat, lng", [
+    (5000, 1000, 45.0, 9.0),
+    (20000, 1500, 60.0, 10.0),
+    (12000, 700, -33.9, 151.2),
+    (8000, 2000, 0.0, -179.9),
+])
+def test_circle_matches_original_loop(outer_radius, small_radius, lat, lng):
+    expected = original_circle_centers(outer_radius, small_radius, lat, lng)
+    found = calculate_circle_centers(outer_radius, small_radius, lat, lng)
+    assert len(found) == len(expected)
+    key = lambda centers: sorted(map(tuple, np.round(centers, 9)))
+    assert key(found) == key(expected)
+
+
+def rectangle(min_lng, min_lat, max_lng, max_lat):
+    return {"type": "Polygon", "coordinates": [[[min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]]]}
+
+
+def distance_to_rectangle(lats, lngs, min_lng, min_lat, max_lng, max_lat):
+    # distanza (km) da un rettangolo in gradi, nella stessa proiezione locale usata per il bordo
+    dx = np.maximum.reduce([min_lng - lngs, np.zeros_like(lngs), lngs - max_lng]) * KM_PER_DEGREE * np.cos(np.radians(lats))
+    dy = np.maximum.reduce([min_lat - lats, np.zeros_like(lats), lats - max_lat]) * KM_PER_DEGREE
+    return np.hypot(dx, dy)
+
+
+def test_polygon_keeps_exactly_the_circles_touching_the_area():
+    bounds = (9.0, 45.0, 9.1, 45.05)
+    small_radius = 800
+    centers = calculate_polygon_centers(rectangle(*bounds), small_radius)
+    distances = distance_to_rectangle(centers[:, 0], centers[:, 1], *bounds)
+    assert np.all(distances <= small_radius / 1000 + 1e-9)
+
+    # ogni punto dell'area e' coperto da almeno un cerchio
+    lats, lngs = np.meshgrid(np.linspace(45.0, 45.05, 40), np.linspace(9.0, 9.1, 40))
+    lats, lngs = lats.ravel(), lngs.ravel()
+    nearest = haversine_distance(lats[:, None], lngs[:, None], centers[None, :, 0], centers[None, :, 1]).min(axis=1)
+    assert np.all(nearest <= small_radius / 1000 + 1e-6)
+
+
+def test_polygon_with_hole_skips_cells_far_inside_the_hole():
+    outer = [[9.0, 45.0], [9.2, 45.0], [9.2, 45.2], [9.0, 45.2], [9.0, 45.0]]
+    hole = [[9.05, 45.05], [9.15, 45.05], [9.15, 45.15], [9.05, 45.15], [9.05, 45.05]]
+    centers = calculate_polygon_centers({"type": "Polygon", "coordinates": [outer, hole]}, 500)
+    inside_hole = (centers[:, 0] > 45.05) & (centers[:, 0] < 45.15) & (centers[:, 1] > 9.05) & (centers[:, 1] < 9.15)
+    # nel buco restano solo le celle a meno di un raggio dal bordo del buco
+    hole_edge = np.minimum.reduce([centers[:, 0] - 45.05, 45.15 - centers[:, 0]]) * KM_PER_DEGREE
+    hole_edge = np.minimum(hole_edge, np.minimum(centers[:, 1] - 9.05, 9.15 - centers[:, 1]) * KM_PER_DEGREE * np.cos(np.radians(centers[:, 0])))
+    assert np.any(inside_hole)
+    assert np.all(hole_edge[inside_hole] <= 0.5 + 1e-9)
@@ -0,0 +1,61 @@
+# Coded by Pietro Squilla
+# Test dell'indice spaziale (common/spatial_index.py) e dei raggruppamenti dei luoghi Places
+
+import numpy as np
+from place_groups import dedup_places, assign_shared_tiles
+from spatial_index import SpatialIndex, project
+
+
+def random_points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return 45.0 + rng.uniform(0, 0.01, count), 9.0 + rng.uniform(0, 0.01, count)
+
+
+def place(place_id, lat, lng):
+    return {"place_id": place_id, "geometry": {"location": {"lat": lat, "lng": lng}}}
+
+
+def test_query_radius_matches_brute_force():
+    lats, lngs = random_points(500)
+    index = SpatialIndex(lats, lngs, 50)
+    points = project(lats, lngs, index.origin_lat)
+    for i in range(0, 500, 25):
+        for radius in (10, 50, 175):
+            expected = np.flatnonzero(np.hypot(*(points - points[i]).T) <= radius)
+            assert np.array_equal(index.query_radius(lats[i], lngs[i], radius), expected)
+
+
+def test_clusters_join_every_point_to_a_close_leader():
+    lats, lngs = random_points(400, seed=1)
+    index = SpatialIndex(lats, lngs, 40)
+    leaders = index.clusters(40)
+    points = project(lats, lngs, index.origin_lat)
+    assert np.all(leaders[leaders] == leaders) # i capogruppo guidano se stessi
+    assert np.all(np.hypot(*(points - points[leaders]).T) <= 40)
+    # due capogruppo non sono mai entro il raggio: il secondo sarebbe stato assorbito dal primo
+    heads = np.unique(leaders)
+    distances = np.hypot(*(points[heads, None] - points[None, heads]).transpose(2, 0, 1))
+    assert np.all(distances[~np.eye(len(heads), dtype=bool)] > 40)
+
+
+def test_clusters_take_one_point_per_group():
+    lats = np.array([45.0, 45.00001, 45.00002, 45.00003])
+    lngs = np.full(4, 9.0)
+    leaders = SpatialIndex(lats, lngs, 10).clusters(10, np.array([0, 0, 1, 1]))
+    assert leaders.tolist() == [0, 1, 0, 1]
+
+
+def test_dedup_places_merges_by_id_and_distance():
+    places = [place("a", 45.0, 9.0), place("a", 45.0, 9.0), place("b", 45.00001, 9.0), place("c", 45.01, 9.0)]
+    assert [p["place_id"] for p in dedup_places([dict(p) for p in places])] == ["a", "b", "c"]
+    merged = dedup_places(places, merge_distance=5)
+    assert [p["place_id"] for p in merged] == ["a", "c"]
+    assert merged[0]["merged_place_ids"] == ["b"]
+
+
+def test_assign_shared_tiles_points_at_the_leader():
+    places = [place("a", 45.0, 9.0), place("b", 45.0002, 9.0), place("c", 45.01, 9.0)]
+    assert assign_shared_tiles(places, 0) == 0 and "tile_center" not in places[0]
+    assert assign_shared_tiles(places, 50) == 2
+    assert places[1]["tile_center"] == (45.0, 9.0)
+    assert places[2]["tile_center"] == (45.01, 9.0)
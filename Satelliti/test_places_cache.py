@@ -0,0 +1,66 @@
+# Coded by Pietro Squilla
+# Test della cache delle risposte Places con un orologio finto: scadenza, rimozione LRU e cached_call
+
+import places_cache
+from places_cache import PlacesCache, cached_call, DAY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    clock = FakeClock()
+    cache = PlacesCache(str(tmp_path / "cache.sqlite"), ttl=DAY, clock=clock)
+    cache.set(["details", "a"], {"name": "Parco"})
+    clock.now += DAY - 1
+    assert cache.get(["details", "a"]) == {"name": "Parco"}
+    clock.now += 2
+    assert cache.get(["details", "a"]) is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted_every_interval(tmp_path):
+    clock = FakeClock()
+    cache = PlacesCache(str(tmp_path / "cache.sqlite"), max_entries=50, clock=clock)
+    for i in range(places_cache.EVICTION_INTERVAL - 1):
+        clock.now += 1
+        cache.set(i, i)
+    assert cache.stats()["evicted"] == 0 # nessun controllo prima dell'intervallo
+    clock.now += 1
+    for i in range(10):
+        assert cache.get(i) == i # le prime voci tornano le piu' recenti
+    clock.now += 1
+    cache.set("ultima", 0)
+    assert cache.stats()["evicted"] == places_cache.EVICTION_INTERVAL - 50
+    assert [cache.get(i) for i in range(10)] == list(range(10))
+    assert cache.get(10) is None
+    assert [cache.get(i) for i in range(60, 99)] == list(range(60, 99)) # con le 10 toccate e "ultima" fanno 50
+    cache.close()
+
+
+def test_cached_call_calls_the_api_once(tmp_path):
+    calls = []
+
+    def fetch(place_id):
+        calls.append(place_id)
+        return {"place_id": place_id}
+
+    cache = PlacesCache(str(tmp_path / "cache.sqlite"), clock=FakeClock())
+    assert cached_call(cache, ["details", "a"], fetch, "a") == {"place_id": "a"}
+    assert cached_call(cache, ["details", "a"], fetch, "a") == {"place_id": "a"}
+    assert calls == ["a"]
+    cache.close()
+
+    reopened = PlacesCache(str(tmp_path / "cache.sqlite"), clock=FakeClock())
+    assert cached_call(reopened, ["details", "a"], fetch, "a") == {"place_id": "a"}
+    assert calls == ["a"]
+    reopened.close()
+    assert cached_call(None, ["details", "a"], fetch, "a") == {"place_id": "a"}
+    assert calls == ["a", "a"]
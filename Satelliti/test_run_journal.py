@@ -0,0 +1,78 @@
+# Coded by Pietro Squilla
+# Test del diario delle esecuzioni: ripresa dopo un'interruzione, coda troncata, diari completati o scaduti
+
+import json
+import os
+import time
+from run_journal import RunJournal
+
+PARAMS = {"keyword": "campo", "lat": 45.0, "lng": 9.0}
+CELL = (45.0, 9.0, 1.5)
+
+
+def interrupted_run(directory):
+    journal = RunJournal(directory, PARAMS)
+    journal.record_cell(CELL, ["a", "b"])
+    journal.record_place("a", {"green_percentage": 12.5})
+    journal.close()
+    return journal.path
+
+
+def test_resumes_an_interrupted_run(tmp_path):
+    interrupted_run(tmp_path)
+    journal = RunJournal(tmp_path, PARAMS)
+    assert journal.discarded is None
+    assert journal.cell_result(CELL) == ["a", "b"]
+    assert journal.place_result("a") == {"green_percentage": 12.5}
+    assert RunJournal(tmp_path / "altro", dict(PARAMS, keyword="bosco")).cell_result(CELL) is None
+
+
+def test_torn_last_record_is_dropped_and_appending_continues(tmp_path):
+    path = interrupted_run(tmp_path)
+    with open(path, "ab") as f:
+        f.write(b'{"type": "place", "place_id": "b", "da') # scrittura interrotta a meta'
+    journal = RunJournal(tmp_path, PARAMS)
+    assert journal.place_result("b") is None
+    assert journal.place_result("a") == {"green_percentage": 12.5}
+    journal.record_place("c", {"green_percentage": 3.0})
+    journal.close()
+
+    # il file resta JSONL valido: la coda troncata non si mescola ai nuovi record
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record.get("place_id") for record in records if record["type"] == "place"] == ["a", "c"]
+    assert RunJournal(tmp_path, PARAMS).place_result("c") == {"green_percentage": 3.0}
+
+
+def test_completed_run_is_not_resumed(tmp_path):
+    journal = RunJournal(tmp_path, PARAMS)
+    journal.record_cell(CELL, ["a"])
+    journal.complete()
+    assert not os.path.exists(journal.path)
+    assert RunJournal(tmp_path, PARAMS).cell_result(CELL) is None
+
+
+def test_done_marker_discards_a_journal_that_was_not_removed(tmp_path):
+    path = interrupted_run(tmp_path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "done", "finished": time.time()}) + "\n")
+    journal = RunJournal(tmp_path, PARAMS)
+    assert journal.discarded == "completato"
+    assert journal.cell_result(CELL) is None
+    journal.close()
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["type"] for line in f] == ["run"]
+
+
+def test_expired_run_starts_over(tmp_path):
+    path = interrupted_run(tmp_path)
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    header = json.loads(lines[0])
+    header["started"] -= 3600
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines([json.dumps(header) + "\n"] + lines[1:])
+    journal = RunJournal(tmp_path, PARAMS, max_age=60)
+    assert journal.discarded == "scaduto"
+    assert journal.cell_result(CELL) is None
+    assert RunJournal(tmp_path, PARAMS, max_age=7200).cell_result(CELL) is None # il diario scaduto e' stato azzerato
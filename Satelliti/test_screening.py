@@ -0,0 +1,63 @@
+# Coded by Pietro Squilla
+# Test della seconda passata dello screening: quante attività vengono rifatte a piena risoluzione
+
+import numpy as np
+from screening import refine_screened, select_for_refinement
+
+
+def sort_key(place_data):
+    return (-place_data["green_percentage"], -place_data["keyword_count"])
+
+
+def screened_places(count, seed=0, error=1.0):
+    # stime a campione con verde fitto, come in una zona di parchi e giardini
+    rng = np.random.default_rng(seed)
+    return {f"p{i}": {"green_percentage": float(value), "green_error": error, "keyword_count": 0, "screened": True}
+            for i, value in enumerate(rng.uniform(20.0, 40.0, count))}
+
+
+def refiner(places, shift, calls, fail=()):
+    # piena risoluzione spostata di shift punti rispetto alla stima; conta le foto richieste
+    def refine_batch(refine_ids, margin):
+        for place_id in refine_ids:
+            calls.append(place_id)
+            yield place_id, None if place_id in fail else {"green_percentage": places[place_id]["green_percentage"] + shift, "green_error": 0.0, "screened": False}
+    return refine_batch
+
+
+def test_exact_screening_refines_only_the_top_and_its_overlap():
+    places = screened_places(321, error=0.2)
+    calls = []
+    attempted = refine_screened(places, refiner(places, 0.0, calls), sort_key, 40, 1.5, 0.3)
+    # nessuno scarto di risoluzione: un solo turno, le prime 40 e le poche entro l'errore dell'ultima
+    assert calls == attempted
+    assert attempted == select_for_refinement(screened_places(321, error=0.2), sort_key, 40)
+    assert 40 < len(attempted) < 50
+
+
+def test_resolution_error_widens_once_and_stays_under_the_cap():
+    places = screened_places(321)
+    calls = []
+    rounds = []
+    attempted = refine_screened(places, refiner(places, -6.0, calls), sort_key, 40, 1.5, 0.3, on_refined=lambda place_id, data: rounds.append(place_id))
+    # uno scarto di 6 punti su valori tra 20 e 40 selezionerebbe quasi tutte le attività: vale il tetto
+    assert len(calls) == len(set(calls)) == len(attempted) == int(321 * 0.3)
+    assert rounds == calls
+
+
+def test_failed_refinements_are_not_retried():
+    places = screened_places(150)
+    calls = []
+    ranked = select_for_refinement(places, sort_key, 10)
+    attempted = refine_screened(places, refiner(places, 0.0, calls, fail=set(ranked[:3])), sort_key, 10, 1.5, 0.5)
+    assert len(calls) == len(set(calls)) == len(attempted)
+    assert all(places[place_id]["screened"] for place_id in ranked[:3])
+
+
+def test_places_already_at_full_resolution_are_skipped():
+    places = screened_places(20)
+    for place_id in ("p0", "p1"):
+        places[place_id].update(green_percentage=99.0, green_error=0.0, screened=False)
+    selected = select_for_refinement(places, sort_key, 5)
+    assert "p0" not in selected and "p1" not in selected
+    assert len(selected) >= 3
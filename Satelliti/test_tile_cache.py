@@ -0,0 +1,71 @@
+# Coded by Pietro Squilla
+# Test della cache delle immagini satellitari: quantizzazione, riuso, contenuti condivisi e rimozione LRU
+
+import os
+from tile_cache import TileCache, quantize_center
+
+TILE = (17, 2, "640x640", "satellite") # zoom, scala, dimensione, tipo di mappa
+
+
+def fetcher(calls):
+    def fetch(lat, lng):
+        calls.append((lat, lng))
+        return f"{lat:.7f},{lng:.7f}".encode() * 100
+    return fetch
+
+
+def test_close_centers_share_one_quantized_tile():
+    q_lat, q_lng, x, y = quantize_center(45.0, 9.0, 17)
+    assert (x % 8, y % 8) == (0, 0)
+    assert quantize_center(q_lat, q_lng, 17)[2:] == (x, y)
+    assert quantize_center(45.0000001, 9.0000001, 17)[2:] == (x, y)
+
+
+def test_second_request_is_served_from_disk(tmp_path):
+    cache = TileCache(tmp_path)
+    calls = []
+    content, path = cache.get_bytes_or_fetch(45.0, 9.0, *TILE, fetcher(calls))
+    again, same_path = cache.get_bytes_or_fetch(45.0000001, 9.0, *TILE, fetcher(calls))
+    assert len(calls) == 1 and again == content and same_path == path
+    assert cache.stats()["hits"] == 1
+    cache.close()
+
+    reopened = TileCache(tmp_path)
+    assert reopened.get_bytes_or_fetch(45.0, 9.0, *TILE, fetcher(calls))[0] == content
+    assert len(calls) == 1
+    reopened.close()
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = TileCache(tmp_path)
+    first = cache.put("a", b"x" * 1000)
+    second = cache.put("b", b"x" * 1000)
+    assert first == second
+    assert cache.total_bytes() == 1000
+    cache.close()
+
+
+def test_eviction_keeps_the_current_run_tiles(tmp_path):
+    old_run = TileCache(tmp_path, max_bytes=10 ** 6)
+    old_paths = [old_run.put(f"old{i}", bytes([i]) * 1000) for i in range(5)]
+    old_run.close()
+
+    # nuova esecuzione con budget di 3 immagini: si rimuovono le vecchie, meno usate per prime
+    cache = TileCache(tmp_path, max_bytes=3000)
+    kept = cache.get("old4")
+    new_paths = [cache.put(f"new{i}", bytes([100 + i]) * 1000) for i in range(2)]
+    assert all(os.path.exists(path) for path in new_paths + [kept])
+    assert [os.path.exists(path) for path in old_paths[:4]] == [False] * 4
+    assert cache.total_bytes() == 3000
+
+    # oltre il budget con sole immagini della esecuzione in corso: restano tutte
+    more = [cache.put(f"more{i}", bytes([200 + i]) * 1000) for i in range(2)]
+    assert all(os.path.exists(path) for path in new_paths + more + [kept])
+    assert cache.total_bytes() == 5000
+    cache.close()
+
+    # l'esecuzione successiva rientra nel budget
+    after = TileCache(tmp_path, max_bytes=3000)
+    after.put("last", b"z" * 1000)
+    assert after.total_bytes() == 3000
+    after.close()
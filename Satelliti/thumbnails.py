@@ -0,0 +1,43 @@
+# Coded by Pietro Squilla
+# Anteprime ridotte (piramide di dimensioni) delle foto satellitari per i report, in cache per hash del sorgente
+
+import hashlib
+import os
+from PIL import Image
+
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_SIZES = (600,) # lato lungo in pixel, dal piu' grande al piu' piccolo
+THUMBNAIL_FORMAT = "webp" # "webp" oppure "jpeg"
+THUMBNAIL_QUALITY = 80
+
+
+def source_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def thumbnail_path(content_hash, size, fmt=THUMBNAIL_FORMAT, directory=THUMBNAIL_DIR):
+    ext = "jpg" if fmt == "jpeg" else fmt
+    return os.path.join(directory, content_hash[:2], f"{content_hash}_{size}.{ext}")
+
+
+def make_thumbnails(image, content_hash, sizes=THUMBNAIL_SIZES, fmt=THUMBNAIL_FORMAT, directory=THUMBNAIL_DIR, quality=THUMBNAIL_QUALITY):
+    # image: PIL.Image gia' decodificata; ogni livello si ricava dal precedente (piu' grande);
+    # restituisce {dimensione: percorso}, le anteprime gia' presenti non vengono rigenerate
+    paths = {}
+    level = image
+    for size in sorted(sizes, reverse=True):
+        path = thumbnail_path(content_hash, size, fmt, directory)
+        paths[size] = path
+        if os.path.exists(path):
+            continue
+        if level.mode != "RGB":
+            # palette (PNG a 8 bit) espansa solo se l'anteprima manca: il ridimensionamento LANCZOS vuole l'RGB
+            level = level.convert("RGB")
+        if max(level.size) > size:
+            level = level.copy() if level is image else level
+            level.thumbnail((size, size), Image.LANCZOS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(level)}.tmp"
+        level.save(tmp_path, format=fmt.upper(), quality=quality)
+        os.replace(tmp_path, path)
+    return paths
@@ -0,0 +1,148 @@
+# Coded by Pietro Squilla
+# Cache su disco delle immagini satellitari, indirizzata per contenuto (sha256) e con rimozione LRU
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from run_metrics import timed
+
+TILE_SIZE = 256 # pixel di una tile Web Mercator a zoom 0
+
+
+def quantize_center(lat, lng, zoom, quantum=8):
+    # arrotonda il centro ad una griglia di `quantum` pixel (Web Mercator) allo zoom richiesto,
+    # cosi' centri quasi coincidenti condividono la stessa immagine
+    world = TILE_SIZE * 2 ** zoom
+    x = (lng + 180) / 360 * world
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * world
+
+    x = round(x / quantum) * quantum
+    y = round(y / quantum) * quantum
+
+    q_lng = x / world * 360 - 180
+    q_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / world))))
+    return round(q_lat, 7), round(q_lng, 7), int(x), int(y)
+
+
+class TileCache:
+    def __init__(self, directory="tile_cache", max_bytes=2 * 1024 ** 3, quantum=8):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self.pinned = set() # hash letti o scritti da questa esecuzione: il report li collega, non si rimuovono
+        self.only_pinned_left = False # oltre il budget con sole immagini di questa esecuzione
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tiles (key TEXT PRIMARY KEY, hash TEXT NOT NULL, accessed REAL NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, size INTEGER NOT NULL, ext TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tiles_hash ON tiles (hash)")
+        self.connection.commit()
+
+    def blob_path(self, content_hash, ext="png"):
+        return os.path.join(self.directory, content_hash[:2], f"{content_hash}.{ext}")
+
+    def tile_key(self, lat, lng, zoom, scale, size, maptype):
+        _, _, x, y = quantize_center(lat, lng, zoom, self.quantum)
+        return f"{zoom}/{x}/{y}/{scale}/{size}/{maptype}"
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT tiles.hash, blobs.ext FROM tiles JOIN blobs ON tiles.hash = blobs.hash WHERE tiles.key = ?", (key,)
+            ).fetchone()
+            if row is None or not os.path.exists(self.blob_path(*row)):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE tiles SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            self.pinned.add(row[0])
+            self.hits += 1
+            return self.blob_path(*row)
+
+    def put(self, key, content, ext="png", content_hash=None):
+        if content_hash is None:
+            content_hash = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(content_hash, ext)
+        if not os.path.exists(path):
+            # scrittura atomica: file temporaneo e rinomina
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with timed("scrittura_disco"):
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+
+        with self.lock:
+            self.pinned.add(content_hash)
+            self.connection.execute("INSERT OR IGNORE INTO blobs (hash, size, ext) VALUES (?, ?, ?)", (content_hash, len(content), ext))
+            self.connection.execute("INSERT OR REPLACE INTO tiles (key, hash, accessed) VALUES (?, ?, ?)", (key, content_hash, time.time()))
+            self._evict()
+            self.connection.commit()
+        return path
+
+    def get_bytes_or_fetch(self, lat, lng, zoom, scale, size, maptype, fetch, writer=None):
+        # fetch(lat, lng) deve restituire i byte dell'immagine per il centro (quantizzato) indicato;
+        # restituisce (byte, percorso): le immagini scaricate si analizzano dalla memoria e, con un
+        # writer (es. fetch_pipeline.BackgroundWriter), si salvano in un altro thread;
+        # il percorso e' quello definitivo anche se la scrittura non e' ancora terminata
+        key = self.tile_key(lat, lng, zoom, scale, size, maptype)
+        path = self.get(key)
+        if path is not None:
+            with timed("lettura_disco"):
+                with open(path, "rb") as f:
+                    return f.read(), path
+        q_lat, q_lng, _, _ = quantize_center(lat, lng, zoom, self.quantum)
+        content = fetch(q_lat, q_lng)
+        content_hash = hashlib.sha256(content).hexdigest()
+        if writer is None:
+            return content, self.put(key, content, content_hash=content_hash)
+        writer.submit(self.put, key, content, "png", content_hash)
+        return content, self.blob_path(content_hash)
+
+    def total_bytes(self):
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _evict(self):
+        # rimuove le chiavi meno usate finche' i contenuti stanno nel budget di disco; le immagini di
+        # questa esecuzione restano anche oltre il budget (il report in scrittura le collega) e
+        # diventano rimovibili dall'esecuzione successiva
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes or self.only_pinned_left:
+            return
+        rows = self.connection.execute("SELECT key, hash FROM tiles ORDER BY accessed").fetchall()
+        for key, content_hash in rows:
+            if total <= self.max_bytes:
+                break
+            if content_hash in self.pinned:
+                continue
+            self.connection.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            still_used = self.connection.execute("SELECT 1 FROM tiles WHERE hash = ? LIMIT 1", (content_hash,)).fetchone()
+            if still_used is None:
+                size, ext = self.connection.execute("SELECT size, ext FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+                self.connection.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+                try:
+                    os.remove(self.blob_path(content_hash, ext))
+                except FileNotFoundError:
+                    pass
+                total -= size
+        # restano solo immagini di questa esecuzione: inutile riscorrere l'indice ad ogni scrittura
+        self.only_pinned_left = total > self.max_bytes
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,148 @@
+# Coded by Pietro Squilla
+# Micro-benchmark delle funzioni piu' usate: latenza (media e percentili), throughput e picco di
+# memoria per caso, con una baseline salvata su file e il confronto con l'esecuzione corrente
+
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+REPEAT = 20 # misure per caso (dopo il riscaldamento)
+WARMUP = 2 # esecuzioni scartate prima delle misure (cache del disco, import, allocazioni)
+TOLERANCE = 0.20 # variazione relativa del tempo migliore oltre la quale un caso e' segnalato
+MIN_DELTA_MS = 0.05 # differenze assolute piu' piccole sono rumore del timer, mai segnalate
+MIN_SAMPLE_MS = 20 # le funzioni piu' rapide sono ripetute in ciclo fino a questa durata per misura
+MEMORY_TOLERANCE = 0.25 # variazione relativa del picco di memoria oltre la quale un caso e' segnalato
+
+
+def measure(function, args=(), kwargs=None, items=1, unit="chiamate", repeat=REPEAT, warmup=WARMUP):
+    # items: elementi elaborati da una chiamata (immagini, centri, ...) per il throughput;
+    # il picco di memoria e' misurato con tracemalloc in una chiamata separata, perche' il
+    # tracciamento rallenta le allocazioni (conta la memoria Python e NumPy, non i buffer interni di OpenCV)
+    kwargs = kwargs or {}
+    for _ in range(warmup):
+        function(*args, **kwargs)
+
+    # chiamate per misura, come timeit: le funzioni da pochi microsecondi sono sotto la risoluzione utile del timer
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function(*args, **kwargs)
+        if (time.perf_counter() - start) * 1000 >= MIN_SAMPLE_MS or number >= 10000:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(*args, **kwargs)
+        samples.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    samples = np.array(samples)
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {
+        "min_ms": float(samples.min()) * 1000,
+        "mean_ms": float(samples.mean()) * 1000,
+        "p50_ms": float(p50) * 1000,
+        "p90_ms": float(p90) * 1000,
+        "p99_ms": float(p99) * 1000,
+        "throughput": items / float(samples.mean()),
+        "unit": unit,
+        "peak_mb": peak / 1024 ** 2,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, indent=2)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(result, reference, tolerance=TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    # confronta il tempo migliore (il meno disturbato dagli altri processi; media e percentili
+    # restano nel report) e il picco di memoria; restituisce (rapporto tempo, rapporto memoria, esito)
+    time_ratio = result["min_ms"] / reference["min_ms"] if reference["min_ms"] else 1.0
+    if abs(result["min_ms"] - reference["min_ms"]) < MIN_DELTA_MS:
+        time_ratio = 1.0
+    memory_ratio = result["peak_mb"] / reference["peak_mb"] if reference["peak_mb"] else 1.0
+    if time_ratio > 1 + tolerance or memory_ratio > 1 + memory_tolerance:
+        status = "REGRESSIONE"
+    elif time_ratio < 1 - tolerance:
+        status = "piu' veloce"
+    else:
+        status = "invariato"
+    return time_ratio, memory_ratio, status
+
+
+def print_result(name, result, reference=None):
+    line = f"{name:<44}{result['min_ms']:>10.2f}{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['throughput']:>12.1f} {result['unit']:<9}{result['peak_mb']:>9.1f}"
+    if reference is not None:
+        time_ratio, memory_ratio, status = compare(result, reference)
+        line += f"  x{time_ratio:.2f} tempo, x{memory_ratio:.2f} memoria, {status}"
+    print(line, flush=True)
+
+
+def run_suite(cases, baseline_path, update_baseline=False):
+    # cases: lista di (nome, funzione senza argomenti che restituisce il risultato di measure);
+    # senza baseline (o con update_baseline) salva i risultati come nuova baseline, altrimenti
+    # confronta e termina con codice 1 se almeno un caso e' regredito
+    baseline = load_baseline(baseline_path)
+    reference_results = baseline["results"] if baseline is not None and not update_baseline else {}
+    if reference_results:
+        print(f"Baseline: {baseline_path} ({baseline['created']}, Python {baseline['environment']['python']}, NumPy {baseline['environment']['numpy']})")
+        if baseline["environment"] != environment():
+            print("  attenzione: baseline registrata in un ambiente diverso, i confronti sono indicativi")
+    print(f"{'caso':<44}{'min ms':>10}{'media ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'throughput':>12} {'':<9}{'picco MB':>9}")
+
+    results = {}
+    regressions = []
+    for name, case in cases:
+        result = case()
+        reference = reference_results.get(name)
+        if reference is not None and compare(result, reference)[2] == "REGRESSIONE":
+            # seconda misura di conferma: su una macchina condivisa un picco di carico basta a superare la tolleranza
+            retry = case()
+            if retry["min_ms"] < result["min_ms"]:
+                result = retry
+            if compare(result, reference)[2] == "REGRESSIONE":
+                regressions.append(name)
+        results[name] = result
+        print_result(name, result, reference)
+
+    if not reference_results:
+        save_baseline(results, baseline_path)
+        print(f"Baseline salvata in {baseline_path}")
+        return results
+    missing = [name for name in reference_results if name not in results]
+    if missing:
+        print(f"Casi della baseline non eseguiti: {', '.join(missing)}")
+    if regressions:
+        print(f"{len(regressions)} regressioni oltre la tolleranza ({TOLERANCE * 100:.0f}% tempo, {MEMORY_TOLERANCE * 100:.0f}% memoria): {', '.join(regressions)}")
+        sys.exit(1)
+    print("Nessuna regressione rispetto alla baseline")
+    return results
@@ -0,0 +1,121 @@
+# Coded by Pietro Squilla
+# Report HTML in streaming: le righe vengono scritte man mano che arrivano, suddivise in pagine
+# con un indice, e i dati completi finiscono in un file JSONL a parte
+
+import json
+import os
+from jinja2 import Template
+
+PAGE_SIZE = 500 # righe per pagina
+
+INDEX_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{{ title }}</title>
+    {% if not complete %}<meta http-equiv="refresh" content="30">{% endif %}
+</head>
+<body>
+    <h1>{{ title }}</h1>
+    <p>{{ rows }} righe{% if not complete %} (analisi in corso, pagina aggiornata ogni 30 secondi){% endif %}</p>
+    <p>Dati completi: <a href="{{ data_file }}">{{ data_file }}</a></p>
+    <ul>
+    {% for page in pages %}
+        <li><a href="{{ page.file }}">Pagina {{ loop.index }}</a> ({{ page.rows }} righe)</li>
+    {% endfor %}
+    </ul>
+</body>
+</html>
+""")
+
+
+class StreamingReport:
+    # page_head/page_tail: template Jinja scritti prima e dopo le righe di ogni pagina
+    # (variabili: title, page, prev_page, next_page, index_file); row_template riceve row e index,
+    # piu' le eventuali variabili extra di add_row (solo nella pagina, non nel file dati)
+    def __init__(self, output_file, title, page_head, row_template, page_tail, page_size=PAGE_SIZE):
+        self.output_file = output_file
+        self.base = os.path.splitext(output_file)[0]
+        self.directory = os.path.dirname(output_file)
+        self.data_file = f"{self.base}_data.jsonl"
+        self.title = title
+        self.page_head = Template(page_head)
+        self.row_template = Template(row_template)
+        self.page_tail = Template(page_tail)
+        self.page_size = page_size
+        self.pages = []
+        self.rows = 0
+        self.page = None
+        self.data = open(self.data_file, "w", encoding="utf-8")
+        self.write_index(complete=False)
+
+    def page_file(self, number):
+        return f"{self.base}_{number:04d}.html"
+
+    def _open_page(self):
+        number = len(self.pages) + 1
+        path = self.page_file(number)
+        self.pages.append({"file": os.path.relpath(path, self.directory or "."), "rows": 0})
+        self.page = open(path, "w", encoding="utf-8")
+        self.page.write(self.page_head.render(self._page_vars(number, last=True)))
+
+    def _close_page(self, last):
+        number = len(self.pages)
+        self.page.write(self.page_tail.render(self._page_vars(number, last)))
+        self.page.close()
+        self.page = None
+
+    def _page_vars(self, number, last):
+        return {
+            "title": self.title,
+            "page": number,
+            "prev_page": self.pages[number - 2]["file"] if number > 1 else None,
+            "next_page": None if last else os.path.relpath(self.page_file(number + 1), self.directory or "."),
+            "index_file": os.path.basename(self.output_file),
+        }
+
+    def add_row(self, row, extra=None):
+        if self.page is None:
+            self._open_page()
+        self.page.write(self.row_template.render(row=row, index=self.pages[-1]["rows"], **(extra or {})))
+        self.page.flush()
+        self.data.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.data.flush()
+        self.pages[-1]["rows"] += 1
+        self.rows += 1
+        if self.pages[-1]["rows"] >= self.page_size:
+            self._close_page(last=False)
+            self.write_index(complete=False)
+
+    def write_index(self, complete):
+        with open(self.output_file, "w", encoding="utf-8") as f:
+            f.write(INDEX_TEMPLATE.render(
+                title=self.title,
+                rows=self.rows,
+                pages=self.pages,
+                complete=complete,
+                data_file=os.path.relpath(self.data_file, self.directory or "."),
+            ))
+
+    def close(self):
+        if self.page is not None:
+            self._close_page(last=True)
+        self.data.close()
+        self.write_index(complete=True)
+
+    def rewrite_sorted(self, key, rows=None):
+        # riscrive pagine e file dati in ordine (es. per percentuale di verde) a fine analisi;
+        # rows sostituisce le righe scritte finora (es. aggiornate dopo la scrittura)
+        self.close()
+        if rows is None:
+            with open(self.data_file, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        rows = sorted(rows, key=key)
+        for page in self.pages:
+            os.remove(os.path.join(self.directory, page["file"]))
+        self.pages = []
+        self.rows = 0
+        self.data = open(self.data_file, "w", encoding="utf-8")
+        for row in rows:
+            self.add_row(row)
+        self.close()
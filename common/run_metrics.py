@@ -0,0 +1,243 @@
+# Coded by Pietro Squilla
+# Strumentazione delle esecuzioni lunghe: tempi per fase, contatori (chiamate, byte, retry, ...),
+# avanzamento con throughput misurato ed ETA, file di metriche aggiornato periodicamente ed
+# endpoint locale opzionale in formato testo Prometheus
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FLUSH_INTERVAL = 10 # secondi tra due scritture del file di metriche
+RATE_WINDOW = 50 # elementi completati usati per il throughput (media mobile) e quindi per l'ETA
+
+active = None # RunMetrics del processo corrente, usato da timed() e count() (None = nessuna misura)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class RunMetrics:
+    def __init__(self, name, metrics_file=None, flush_interval=FLUSH_INTERVAL):
+        # name: prefisso delle metriche Prometheus (es. "hexagon2")
+        self.name = name
+        self.metrics_file = metrics_file
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.stages = {} # fase -> [chiamate, secondi] (sommati sui thread)
+        self.counters = {} # contatore -> valore
+        self.sources = {} # nome -> funzione che restituisce un dizionario di valori (es. statistiche delle cache)
+        self.phase = None
+        self.total = None
+        self.done = 0
+        self.phase_start = time.monotonic()
+        self.recent = deque(maxlen=RATE_WINDOW) # istanti di completamento recenti
+        self.stop_event = threading.Event()
+        self.flusher = None
+        self.server = None
+        if metrics_file is not None:
+            self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+
+    def start_phase(self, phase, total=None):
+        # nuova fase con avanzamento proprio (total None se non noto in anticipo); tempi e contatori restano
+        with self.lock:
+            self.phase = phase
+            self.total = total
+            self.done = 0
+            self.phase_start = time.monotonic()
+            self.recent.clear()
+
+    def advance(self, items=1):
+        now = time.monotonic()
+        with self.lock:
+            self.done += items
+            for _ in range(items):
+                self.recent.append(now)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def watch(self, name, source):
+        self.sources[name] = source
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def rate(self):
+        # elementi al secondo sugli ultimi RATE_WINDOW completamenti (tutta la fase se sono meno)
+        with self.lock:
+            if len(self.recent) >= 2 and self.recent[-1] > self.recent[0]:
+                return (len(self.recent) - 1) / (self.recent[-1] - self.recent[0])
+            elapsed = time.monotonic() - self.phase_start
+            return self.done / elapsed if self.done and elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        if self.total is None or rate <= 0:
+            return None
+        return max(0, self.total - self.done) / rate
+
+    def progress_line(self):
+        # sostituisce il vecchio contatore "i di n", con throughput ed ETA
+        rate = self.rate()
+        if self.total is None:
+            return f"  {self.done} {self.phase or ''}, {rate:.1f}/s"
+        return f"  {self.done} di {self.total}, {rate:.1f}/s, ETA {format_duration(self.eta())}"
+
+    def snapshot(self):
+        rate = self.rate()
+        eta = self.eta()
+        sources = {}
+        for name, source in list(self.sources.items()):
+            try:
+                sources[name] = source()
+            except Exception as e:
+                # una sorgente chiusa (es. cache a fine esecuzione) non blocca le altre
+                sources[name] = {"error": str(e)}
+        with self.lock:
+            return {
+                "name": self.name,
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "elapsed_s": round(time.time() - self.start_time, 3),
+                "phase": self.phase,
+                "done": self.done,
+                "total": self.total,
+                "rate": round(rate, 4),
+                "eta_s": round(eta, 1) if eta is not None else None,
+                "stages": {stage: {"calls": calls, "seconds": round(seconds, 4)} for stage, (calls, seconds) in self.stages.items()},
+                "counters": dict(self.counters),
+                "sources": sources,
+            }
+
+    def flush(self):
+        if self.metrics_file is None:
+            return
+        # scrittura atomica: chi legge il file non trova mai un JSON a meta'
+        tmp_path = f"{self.metrics_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.metrics_file)
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"\nScrittura delle metriche non riuscita: {e}")
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        prefix = self.name
+        lines = [
+            f"# TYPE {prefix}_elapsed_seconds gauge", f"{prefix}_elapsed_seconds {snapshot['elapsed_s']}",
+            f"# TYPE {prefix}_items_done gauge", f'{prefix}_items_done{{phase="{snapshot["phase"] or ""}"}} {snapshot["done"]}',
+            f"# TYPE {prefix}_items_per_second gauge", f"{prefix}_items_per_second {snapshot['rate']}",
+        ]
+        if snapshot["total"] is not None:
+            lines += [f"# TYPE {prefix}_items_total gauge", f'{prefix}_items_total{{phase="{snapshot["phase"] or ""}"}} {snapshot["total"]}']
+        if snapshot["eta_s"] is not None:
+            lines += [f"# TYPE {prefix}_eta_seconds gauge", f"{prefix}_eta_seconds {snapshot['eta_s']}"]
+        lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+        lines += [f'{prefix}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]}' for stage, values in snapshot["stages"].items()]
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {values["calls"]}' for stage, values in snapshot["stages"].items()]
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        lines += [f'{prefix}_events_total{{event="{name}"}} {value}' for name, value in snapshot["counters"].items()]
+        lines.append(f"# TYPE {prefix}_source gauge")
+        for source, values in snapshot["sources"].items():
+            lines += [f'{prefix}_source{{source="{source}",key="{key}"}} {value}' for key, value in values.items() if isinstance(value, (int, float))]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        # endpoint /metrics in un thread, solo in locale per default
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # niente log per richiesta
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}/metrics"
+
+    def summary_lines(self):
+        # tempi per fase dal piu' costoso (somma sui thread: possono superare il tempo totale) e contatori
+        lines = []
+        for stage, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {stage}: {seconds:.1f} s in {calls} chiamate ({seconds / calls * 1000:.1f} ms ciascuna)")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name}: {value}")
+        return lines
+
+    def close(self):
+        self.stop_event.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.flush()
+
+
+def activate(metrics):
+    global active
+    active = metrics
+    return metrics
+
+
+def deactivate():
+    global active
+    active = None
+
+
+@contextmanager
+def timed(stage):
+    # misura il blocco nella fase indicata del RunMetrics attivo (nessun costo senza strumentazione)
+    metrics = active
+    if metrics is None:
+        yield
+        return
+    with metrics.timed(stage):
+        yield
+
+
+def count(name, value=1):
+    metrics = active
+    if metrics is not None:
+        metrics.count(name, value)
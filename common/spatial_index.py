@@ -0,0 +1,65 @@
+# Coded by Pietro Squilla
+# Indice spaziale a griglia (hash di celle) su coordinate proiettate in metri, condiviso da Satelliti e Meteoriti
+
+import numpy as np
+
+R = 6371000 # raggio della terra in metri
+
+
+def project(lats, lngs, origin_lat):
+    # proiezione equirettangolare locale: adeguata per distanze di pochi km
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lngs = np.radians(np.asarray(lngs, dtype=float))
+    return np.column_stack((R * lngs * np.cos(np.radians(origin_lat)), R * lats))
+
+
+class SpatialIndex:
+    def __init__(self, lats, lngs, cell_size):
+        self.origin_lat = float(np.mean(lats)) if len(lats) else 0.0
+        self.points = project(lats, lngs, self.origin_lat)
+        self.cell_size = float(cell_size)
+
+        # raggruppa i punti per cella ordinando le chiavi: O(n log n)
+        cells = np.floor(self.points / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        self.cells = {}
+        if len(order):
+            sorted_cells = cells[order]
+            breaks = np.flatnonzero(np.any(np.diff(sorted_cells, axis=0) != 0, axis=1)) + 1
+            for group in np.split(order, breaks):
+                self.cells[tuple(cells[group[0]])] = group
+
+    def _candidates(self, point, radius):
+        reach = int(np.ceil(radius / self.cell_size))
+        cx, cy = np.floor(point / self.cell_size).astype(np.int64)
+        groups = [self.cells.get((x, y)) for x in range(cx - reach, cx + reach + 1) for y in range(cy - reach, cy + reach + 1)]
+        groups = [group for group in groups if group is not None]
+        return np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+
+    def query_radius(self, lat, lng, radius):
+        # indici dei punti entro radius metri da (lat, lng)
+        point = project([lat], [lng], self.origin_lat)[0]
+        return self._query_point(point, radius)
+
+    def _query_point(self, point, radius):
+        candidates = self._candidates(point, radius)
+        distances = np.hypot(*(self.points[candidates] - point).T)
+        return np.sort(candidates[distances <= radius])
+
+    def clusters(self, radius, groups=None):
+        # raggruppamento greedy: ogni punto non assegnato diventa capogruppo dei vicini entro radius;
+        # con groups (un'etichetta per punto) un gruppo accoglie al massimo un punto per etichetta,
+        # il primo in ordine di indice; restituisce per ciascun punto l'indice del suo capogruppo
+        leaders = np.full(len(self.points), -1, dtype=np.int64)
+        for index, point in enumerate(self.points):
+            if leaders[index] != -1:
+                continue
+            neighbours = self._query_point(point, radius)
+            neighbours = neighbours[leaders[neighbours] == -1]
+            if groups is not None:
+                others = neighbours[groups[neighbours] != groups[index]]
+                _, first = np.unique(groups[others], return_index=True)
+                neighbours = np.concatenate(([index], others[first]))
+            leaders[neighbours] = index
+        return leaders
+
@@ -0,0 +1,97 @@
+# Coded by Pietro Squilla
+# Test del report in streaming: pagine, indice aggiornato durante l'analisi, file dati JSONL, variabili
+# solo di pagina e riordino finale
+
+import json
+import re
+from report_writer import StreamingReport
+
+PAGE_HEAD = "<html><body><h1>{{ title }} {{ page }}</h1>{% if prev_page %}<a href='{{ prev_page }}'>prec</a>{% endif %}\n"
+ROW = "<p>{{ index }}:{{ row.name }}</p>{% if crop %}<img src='{{ crop }}'>{% endif %}\n"
+PAGE_TAIL = "{% if next_page %}<a href='{{ next_page }}'>succ</a>{% endif %}<a href='{{ index_file }}'>indice</a></body></html>\n"
+
+
+def open_report(tmp_path, page_size=3):
+    return StreamingReport(str(tmp_path / "report.html"), "Report", PAGE_HEAD, ROW, PAGE_TAIL, page_size)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def page_rows(report, number):
+    return re.findall(r"<p>(\d+):(\w+)</p>", read(report.page_file(number)))
+
+
+def test_rows_are_split_into_linked_pages(tmp_path):
+    report = open_report(tmp_path)
+    for i in range(7):
+        report.add_row({"name": f"luogo{i}"})
+    report.close()
+    assert [page["rows"] for page in report.pages] == [3, 3, 1]
+    assert page_rows(report, 1) == [("0", "luogo0"), ("1", "luogo1"), ("2", "luogo2")]
+    assert page_rows(report, 3) == [("0", "luogo6")]
+    first, last = read(report.page_file(1)), read(report.page_file(3))
+    assert "report_0002.html'>succ" in first and "prec" not in first
+    assert "report_0002.html'>prec" in last and "succ" not in last
+
+
+def test_index_lists_closed_pages_while_the_analysis_runs(tmp_path):
+    report = open_report(tmp_path)
+    index = read(report.output_file)
+    assert 'http-equiv="refresh"' in index and "0 righe" in index
+    for i in range(4):
+        report.add_row({"name": f"luogo{i}"})
+    index = read(report.output_file) # aggiornato alla chiusura della prima pagina
+    assert "3 righe" in index and "report_0001.html" in index and "report_0002.html" not in index
+    report.close()
+    index = read(report.output_file)
+    assert 'http-equiv="refresh"' not in index
+    assert "4 righe" in index and "report_0002.html" in index and "report_data.jsonl" in index
+
+
+def test_sidecar_keeps_every_row_as_json(tmp_path):
+    report = open_report(tmp_path)
+    rows = [{"name": "citta", "green": 12.5, "keywords": ["parco", "giardino"]}, {"name": "paese", "green": None, "note": "perche'"}]
+    for row in rows:
+        report.add_row(row)
+        with open(report.data_file, encoding="utf-8") as f:
+            assert json.loads(f.readlines()[-1]) == row # scritto subito, non a fine analisi
+    report.close()
+    with open(report.data_file, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == rows
+
+
+def test_extra_variables_reach_the_page_but_not_the_sidecar(tmp_path):
+    report = open_report(tmp_path)
+    report.add_row({"name": "crop0"}, {"crop": "data:image/jpeg;base64,AAAA"})
+    report.close()
+    assert "<img src='data:image/jpeg;base64,AAAA'>" in read(report.page_file(1))
+    assert read(report.data_file) == '{"name": "crop0"}\n'
+
+
+def test_rewrite_sorted_reads_the_rows_back_from_the_sidecar(tmp_path):
+    report = open_report(tmp_path)
+    greens = [5, 40, 12, 33, 0, 27, 18]
+    for i, green in enumerate(greens):
+        report.add_row({"name": f"luogo{i}", "green": green})
+    report.rewrite_sorted(lambda row: -row["green"])
+    order = [f"luogo{i}" for i in sorted(range(len(greens)), key=lambda i: -greens[i])]
+    assert [name for number in (1, 2, 3) for _, name in page_rows(report, number)] == order
+    with open(report.data_file, encoding="utf-8") as f:
+        assert [json.loads(line)["name"] for line in f] == order
+    assert [page["rows"] for page in report.pages] == [3, 3, 1]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["report.html", "report_0001.html", "report_0002.html", "report_0003.html", "report_data.jsonl"]
+
+
+def test_rewrite_sorted_with_updated_rows(tmp_path):
+    report = open_report(tmp_path)
+    for i in range(4):
+        report.add_row({"name": f"luogo{i}", "green": i})
+    # valori rifiniti dopo la scrittura: le righe passate sostituiscono quelle del file dati
+    updated = [{"name": f"luogo{i}", "green": 10 - i} for i in range(4)]
+    report.rewrite_sorted(lambda row: row["green"], updated)
+    assert [name for number in (1, 2) for _, name in page_rows(report, number)] == ["luogo3", "luogo2", "luogo1", "luogo0"]
+    with open(report.data_file, encoding="utf-8") as f:
+        assert [json.loads(line)["green"] for line in f] == [7, 8, 9, 10]